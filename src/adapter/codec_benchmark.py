@@ -0,0 +1,77 @@
+import argparse
+import json
+import time
+
+from array import array
+from types import SimpleNamespace
+
+from generic.api import label_pb2
+from generic.api.parameter import Parameter
+from generic.api.type import Type
+
+### benchmark of the parameter codec: encode, serialize, parse and decode time of large
+### array and hash parameters, per kind of value and number of elements
+### usage: python codec_benchmark.py --sizes 10000 100000 1000000
+
+
+def _values(kind: str, size: int):
+    if kind == 'int list':
+        return Type.ARRAY, list(range(size))
+    if kind == 'int array.array':
+        return Type.ARRAY, array('q', range(size))
+    if kind == 'float list':
+        return Type.ARRAY, [index / 2 for index in range(size)]
+    if kind == 'string list':
+        return Type.ARRAY, ['event{index}'.format(index=index) for index in range(size)]
+    if kind == 'hash':
+        return Type.HASH, {'key{index}'.format(index=index): index for index in range(size)}
+    if kind == 'struct list':
+        return Type.ARRAY, [SimpleNamespace(index=index, body='hello') for index in range(size)]
+    raise ValueError('Unknown kind: {kind}'.format(kind=kind))
+
+
+KINDS = ('int list', 'int array.array', 'float list', 'string list', 'hash', 'struct list')
+
+
+def run(kind: str, size: int) -> dict:
+    tipe, value = _values(kind, size)
+    parameter = Parameter('values', tipe, value, validate=False)
+
+    start = time.perf_counter()
+    pb_param = parameter.encode()
+    encoded = time.perf_counter()
+    raw = pb_param.SerializeToString()
+    serialized = time.perf_counter()
+    parsed_param = label_pb2.Label.Parameter.FromString(raw)
+    parsed = time.perf_counter()
+    Parameter.decode(parsed_param)
+    decoded = time.perf_counter()
+
+    return {'kind': kind, 'elements': size, 'bytes': len(raw),
+            'encode_ms': (encoded - start) * 1000, 'serialize_ms': (serialized - encoded) * 1000,
+            'parse_ms': (parsed - serialized) * 1000, 'decode_ms': (decoded - parsed) * 1000,
+            'encode_ns_per_element': (encoded - start) / size * 1e9,
+            'decode_ns_per_element': (decoded - parsed) / size * 1e9}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the parameter codec')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='numbers of elements (default: 10000 100000 1000000)')
+    parser.add_argument('-k', '--kinds', nargs='+', default=list(KINDS), choices=KINDS,
+                        help='kinds of values (default: all)')
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    for kind in args.kinds:
+        for size in args.sizes:
+            result = run(kind, size)
+            results.append(result)
+            print('{kind:16} {elements:8d}: encode {encode_ms:8.1f} ms ({encode_ns_per_element:5.0f} ns/element), '
+                  'decode {decode_ms:8.1f} ms ({decode_ns_per_element:5.0f} ns/element), '
+                  'serialize {serialize_ms:6.1f} ms, parse {parse_ms:6.1f} ms, {bytes} bytes'.format(**result))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,135 @@
+import argparse
+import base64
+import hashlib
+import json
+import socket
+import threading
+import time
+
+import websocket
+
+from generic.api import message_pb2
+from generic.api.label import Label, Sort
+from generic.api.parameter import Parameter
+from generic.api.type import Type
+from generic.broker_connection import DEFAULT_COMPRESSION_THRESHOLD
+from generic.deflate import PerMessageDeflate, EXTENSION, OFFER
+
+### benchmark of the AMP link: bytes on the wire and CPU per frame for small and large labels,
+### sent plain (websocket.send) and with permessage-deflate
+### usage: python deflate_benchmark.py --frames 2000 --threshold 1024
+
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class SinkServer:
+    """
+    Local websocket server that accepts permessage-deflate and counts the bytes it receives,
+    without parsing the frames.
+    """
+
+    def __init__(self):
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self.listener.getsockname()[1]
+        self.received = 0
+        self._lock = threading.Lock()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            connection, _ = self.listener.accept()
+            threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+    def _handle(self, connection: socket.socket):
+        request = b''
+        while b'\r\n\r\n' not in request:
+            request += connection.recv(4096)
+        headers = dict(line.split(': ', 1) for line in request.decode().split('\r\n')[1:] if ': ' in line)
+
+        accept = base64.b64encode(hashlib.sha1((headers['Sec-WebSocket-Key'] + GUID).encode()).digest()).decode()
+        response = ['HTTP/1.1 101 Switching Protocols', 'Upgrade: websocket', 'Connection: Upgrade',
+                    'Sec-WebSocket-Accept: ' + accept]
+        if EXTENSION in headers.get('Sec-WebSocket-Extensions', ''):
+            response.append('Sec-WebSocket-Extensions: ' + EXTENSION)
+        connection.sendall(('\r\n'.join(response) + '\r\n\r\n').encode())
+
+        while True:
+            data = connection.recv(1 << 16)
+            if not data:
+                break
+            with self._lock:
+                self.received += len(data)
+
+    def take_received(self, expected: int) -> int:
+        """ Wait until at least `expected` bytes arrived, return them and start counting over. """
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            with self._lock:
+                if self.received >= expected:
+                    received, self.received = self.received, 0
+                    return received
+            time.sleep(0.01)
+        raise RuntimeError('The sink did not receive the frames')
+
+
+def label_message(size: str) -> bytes:
+    """ A serialized response label, small or with a big array, hash and physical label. """
+    if size == 'small':
+        parameters = [Parameter('body', Type.STRING, 'hello'), Parameter('status', Type.INTEGER, 200)]
+        physical_label = None
+    else:
+        events = [{'event_id': '$event{index}:my.matrix.host'.format(index=index), 'sender': '@user{index}:my.matrix.host'
+                   .format(index=index % 10), 'body': 'message {index}'.format(index=index)} for index in range(200)]
+        parameters = [Parameter('events', Type.ARRAY, [json.dumps(event) for event in events]),
+                      Parameter('state', Type.HASH, {'member{index}'.format(index=index): 'join' for index in range(50)})]
+        physical_label = json.dumps({'chunk': events}).encode()
+
+    label = Label(Sort.RESPONSE, 'messages', 'matrix', parameters, time.time_ns(), physical_label)
+    return message_pb2.Message(label=label.encode()).SerializeToString()
+
+
+def run(server: SinkServer, mode: str, message: bytes, frames: int, threshold: int) -> dict:
+    header = {'Sec-WebSocket-Extensions': OFFER} if mode == 'deflate' else {}
+    ws = websocket.create_connection('ws://127.0.0.1:{port}'.format(port=server.port), header=header)
+    deflate = PerMessageDeflate.from_response(ws.getheaders()) if mode == 'deflate' else None
+
+    sent = 0
+    start = time.thread_time()
+    for _ in range(frames):
+        if mode == 'send':
+            sent += ws.send(message, websocket.ABNF.OPCODE_BINARY)
+            continue
+        # As BrokerConnection sends it.
+        compress = deflate is not None and len(message) >= threshold
+        payload = deflate.compress(message) if compress else message
+        sent += ws.send_frame(websocket.ABNF(1, int(compress), 0, 0, websocket.ABNF.OPCODE_BINARY, 1, payload))
+    cpu = time.thread_time() - start
+
+    on_wire = server.take_received(sent)
+    ws.close()
+    return {'mode': mode, 'message_bytes': len(message), 'wire_bytes_per_frame': on_wire / frames,
+            'cpu_us_per_frame': cpu / frames * 1e6}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark permessage-deflate on the AMP link')
+    parser.add_argument('-f', '--frames', type=int, default=2000, help='frames per run (default: 2000)')
+    parser.add_argument('-t', '--threshold', type=int, default=DEFAULT_COMPRESSION_THRESHOLD,
+                        help='compression threshold in bytes (default: {default})'
+                        .format(default=DEFAULT_COMPRESSION_THRESHOLD))
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    server = SinkServer()
+    results = []
+    for size in ('small', 'large'):
+        message = label_message(size)
+        for mode in ('send', 'deflate'):
+            result = dict(run(server, mode, message, args.frames, args.threshold), label=size)
+            results.append(result)
+            print('{label:5} {mode:7} {message_bytes:6d} B -> {wire_bytes_per_frame:8.1f} B on the wire, '
+                  '{cpu_us_per_frame:6.1f} us CPU per frame'.format(**result))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
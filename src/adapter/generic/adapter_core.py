@@ -1,17 +1,28 @@
+import functools
 import logging
+import random
 import time
 
 from enum import Enum
 from typing import List
 from queue import Queue
-from threading import Thread
+from threading import Event, Lock, Thread, current_thread
 
 from .api import label_pb2, message_pb2, announcement_pb2, configuration_pb2
 from .api.configuration import Configuration
 from .api.label import Label
 from .broker_connection import BrokerConnection
 from .handler import Handler
-from .qthread import QThread
+from .qthread import KeyedQThread, QThread
+from .util.memory import memory_tracker
+from .util.metrics import metrics
+from .util.profiling import profiler
+from .util.tracing import tracer
+
+# Bounds (in seconds) of the exponential backoff between reconnection attempts.
+RECONNECT_DELAY_MIN = 0.5
+RECONNECT_DELAY_MAX = 30.0
+
 
 class State(Enum):
     """
@@ -22,9 +33,53 @@ class State(Enum):
     ANNOUNCED = 2
     CONFIGURED = 3
     READY = 4
+    RESETTING = 5
     ERROR = 9
 
 
+# Wire tags of the control messages in `message_pb2.Message`, i.e. the first byte
+# of the serialized message: (field number << 3) | length-delimited wire type.
+_ERROR_TAG = (1 << 3) | 2
+_RESET_TAG = (5 << 3) | 2
+_LABEL_TAG = (4 << 3) | 2
+
+
+# Serialized frames which never change, sent as is.
+_READY_FRAME = message_pb2.Message(ready=message_pb2.Message.Ready()).SerializeToString()
+
+
+@functools.lru_cache(maxsize=64)
+def _error_frame(message: str) -> bytes:
+    """ Serialized error message; the same few error messages are sent over and over. """
+    return message_pb2.Message(error=message_pb2.Message.Error(message=message)).SerializeToString()
+
+
+def _is_label(raw_message) -> bool:
+    """ Whether a raw message from AMP is a label, i.e. a stimulus. """
+    return _peek_message_tag(raw_message) == _LABEL_TAG
+
+
+def _correlation_id_of(message) -> int:
+    """ Correlation id of a message queued to AMP, for tracing. Serialized frames have none. """
+    return 0 if isinstance(message, bytes) else message.label.correlation_id
+
+
+def _peek_message_tag(raw_message) -> int:
+    """
+    Cheaply determine the type of a serialized `message_pb2.Message` without parsing it.
+    A `Message` holds exactly one field of its `type` oneof, so the first byte is that field's tag.
+
+    Args:
+        raw_message (bytes): Raw message from AMP.
+
+    Returns:
+        int: The tag of the message, or -1 if it can not be determined.
+    """
+    if isinstance(raw_message, (bytes, bytearray)) and raw_message:
+        return raw_message[0]
+    return -1
+
+
 class AdapterCore:
     """
     This class implements the core of a plugin-adapter. It handles the connection
@@ -35,37 +90,114 @@ class AdapterCore:
         name (str): The communicated name of this adapter
         broker_connection (BrokerConnection): The broker connection does the communication to AMP
         handler (adapter.generic.handler.Handler): The handler that handles the communication to the SUT
+        stimulus_workers (int): Number of threads performing stimuli. With more than one, stimuli are
+            performed in parallel, in order per `Handler.stimulus_key`
+        max_reconnect_attempts (int): Number of failed reconnections after which `start` gives up, None to never give up
     """
 
-    def __init__(self, name: str, broker_connection: BrokerConnection, handler: Handler):
+    def __init__(self, name: str, broker_connection: BrokerConnection, handler: Handler, stimulus_workers: int = 1,
+                 max_reconnect_attempts: int = None):
         self.name = name
         self.broker_connection = broker_connection
         self.handler = handler
         self.state = State.DISCONNECTED
 
         # QThread for sending messages to AMP.
-        self.qthread_to_amp = QThread(process_item = self._send_message_to_amp)
+        self.qthread_to_amp = QThread(process_item = self._send_message_to_amp, trace_name = 'amp.outbound',
+                                      trace_key = _correlation_id_of)
         self.qthread_to_amp.start()
 
-        # QThread for handling messages from AMP.
-        self.qthread_handle_message = QThread(process_item = self._handle_message)
+        # QThread for handling messages from AMP. Control messages (RESET, ERROR)
+        # are put in a priority lane, so they preempt the queued stimuli.
+        self.qthread_handle_message = QThread(process_item = self._handle_message, priority = True,
+                                              trace_name = 'amp.inbound')
         self.qthread_handle_message.start()
 
-    def start(self):
-        """ Start the adapter core which will open a connection with AMP. """
+        # Pool performing stimuli in parallel, by key; None to perform them in order on qthread_handle_message.
+        self.stimulus_pool = None
+        if stimulus_workers > 1:
+            self.stimulus_pool = KeyedQThread(process_item = self.on_label, workers = stimulus_workers)
+            self.stimulus_pool.start()
 
-        self._clear_qthread_queues()
+        # The last announcement sent as (name, supported labels, configuration, serialized frame).
+        self._announcement = None
 
-        if self.state == State.DISCONNECTED:
-            logging.info('Connecting to broker')
-            self.broker_connection.connect()
-        else:
-            logging.info('Connection started while already connected')
+        # Number of reconnection attempts since the last successful connection.
+        self._reconnect_attempt = 0
+        self.max_reconnect_attempts = max_reconnect_attempts
+
+        # Set by `stop`, ends the reconnect loop in `start`.
+        self._stopped = Event()
+
+        # Configuration the SUT was last started with; kept across reconnects with AMP.
+        self._sut_configuration = None
+
+        # Moment (time.perf_counter) the last RESET was received, used to measure reset latency.
+        self._reset_received_at = None
+
+        # The SUT is reset on a thread of its own, so RESETs received meanwhile can join that reset.
+        self._reset_lock = Lock()
+        self._reset_thread = None  # Thread running handler.reset, None if no reset is in progress
+        self._resets_pending = 0  # RESETs received that have not been answered with READY yet
+        self._reset_ready_sent = False  # whether the handler sent READY during the current reset
+
+    def start(self):
+        """
+        Start the adapter core which will open a connection with AMP.
+        Whenever the connection is closed, a new connection is opened after a jittered,
+        exponentially growing delay - this keeps the adapter alive until `stop` is called
+        or `max_reconnect_attempts` reconnections in a row failed.
+        """
+        try:
+            while not self._stopped.is_set():
+                self._clear_qthread_queues()
+
+                if self.state == State.DISCONNECTED:
+                    logging.info('Connecting to broker')
+                    try:
+                        self.broker_connection.connect()
+                    except Exception as e:
+                        logging.error('Connection with AMP failed: %s', e)
+                    self.state = State.DISCONNECTED
+                else:
+                    logging.info('Connection started while already connected')
+                    return
+
+                if self._stopped.is_set():
+                    break
+                if self.max_reconnect_attempts is not None and self._reconnect_attempt >= self.max_reconnect_attempts:
+                    logging.error('Giving up after %d failed reconnection attempts', self._reconnect_attempt)
+                    break
+
+                delay = self._reconnect_delay()
+                self._reconnect_attempt += 1
+                logging.info('Trying to reconnect to AMP in %.1f seconds', delay)
+                self._stopped.wait(delay)
+        except KeyboardInterrupt:
+            logging.info('Interrupted')
+
+        logging.info('Adapter stopped')
+        if self._sut_configuration is not None:
+            self._sut_configuration = None
+            self.handler.stop()
+
+    def stop(self):
+        """ Close the connection with AMP and end the reconnect loop in `start`, which then stops the SUT. """
+        logging.info('Stopping the adapter')
+        self._stopped.set()
+        if self.state != State.DISCONNECTED:
+            self.broker_connection.close(reason='adapter stopped')
+
+    def _reconnect_delay(self) -> float:
+        """ The delay before the next reconnection attempt: exponential backoff with full jitter. """
+        ceiling = min(RECONNECT_DELAY_MAX, RECONNECT_DELAY_MIN * 2 ** self._reconnect_attempt)
+        return random.uniform(RECONNECT_DELAY_MIN, max(RECONNECT_DELAY_MIN, ceiling))
 
     def on_open(self):
         """ Broker call back for when the connection is opened with AMP. """
         if self.state == State.DISCONNECTED:
             self.state = State.CONNECTED
+            self._reconnect_attempt = 0
 
             self.send_announcement(self.name, self.handler.supported_labels(),
                                    self.handler.get_configuration())
@@ -74,12 +206,20 @@ class AdapterCore:
             logging.info('Connection opened while already connected')
 
     def on_close(self):
-        """ Connection with AMP has been closed. Try to reconnect. """
+        """
+        Connection with AMP has been closed. The reconnect loop in `start` will open a new one.
+        The SUT is left running, so it can be reused if AMP sends the same configuration again.
+        """
         self.state = State.DISCONNECTED
         self._clear_qthread_queues()
-        self.handler.stop()
-        logging.info('Trying to reconnect to AMP')
-        self.start() # reconnect to AMP - keep the adapter alive
+        profiler.end_test_case()
+        logging.info('Connection with AMP closed')
+
+        with self._reset_lock:
+            if self._resets_pending:
+                # The new connection starts with a configuration, not with the pending READYs.
+                logging.info('Cancelling the READY of %d pending reset(s)', self._resets_pending)
+                self._resets_pending = 0
 
     def on_configuration(self, pb_config: configuration_pb2.Configuration):
         """
@@ -91,15 +231,32 @@ class AdapterCore:
         if self.state == State.ANNOUNCED:
             logging.info('Configuration received')
             self.state = State.CONFIGURED
+            self._join_reset()
 
-            # Start the SUT
-            logging.info('Connecting to the SUT')
             try:
-                self.handler.set_configuration(Configuration.decode(pb_config))
+                configuration = Configuration.decode(pb_config)
+
+                if configuration == self._sut_configuration:
+                    # Reconnected to AMP with an unchanged configuration: keep the running SUT, but reset it,
+                    # as it still holds the state of the interrupted test case. The handler sends READY.
+                    logging.info('SUT already started with this configuration, resetting it')
+                    self.handler.set_configuration(configuration)
+                    self.handler.reset()
+                    return
+
+                if self._sut_configuration is not None:
+                    logging.info('Configuration changed, stopping the SUT')
+                    self._sut_configuration = None
+                    self.handler.stop()
+
+                # Start the SUT
+                logging.info('Connecting to the SUT')
+                self.handler.set_configuration(configuration)
                 self.handler.start()
+                self._sut_configuration = configuration
 
             except Exception as e:
-                logging.error('Error connection to the SUT: {}'.format(e))
+                logging.error('Error connection to the SUT: %s', e)
                 self.send_error(str(e))
                 return
 
@@ -128,22 +285,67 @@ class AdapterCore:
 
             try:
                 # Perform the stimulus action (which could trigger a response).
-                logging.debug("Call handler.stimulate for '{name}'".format(name=pb_label.label))
-                self.handler.stimulate(pb_label)
+                logging.debug("Call handler.stimulate for '%s'", pb_label.label)
+                with tracer.span('handler.stimulate', pb_label.correlation_id):
+                    self.handler.stimulate(pb_label)
 
             except Exception as e:
-                logging.error('Exception: {ex}'.format(ex=e))
+                logging.error('Exception: %s', e)
                 self.send_error('error while stimulating the SUT: {ex}'.format(ex=e))
+        elif self.state == State.RESETTING:
+            # Sent before the RESET, but reached the stimulus pool too late: the reset drops it.
+            logging.debug("Dropping stimulus '%s', the SUT is being reset", pb_label.label)
         else:
             message = 'Label received from AMP while not ready'
             logging.error(message)
             self.send_error(message)
 
     def on_reset(self):
-        """ Call back when a Reset message is received. """
-        if self.state == State.READY:
-            logging.debug('Reset message received')
-            self._clear_qthread_queues()
+        """
+        Call back when a Reset message is received. The SUT is reset on a separate thread.
+        A RESET received while the SUT is being reset joins that reset, as nothing happened
+        at the SUT in between; a RESET received after its READY was sent is handled once it finishes.
+        Either way, READY is sent once for every RESET.
+        """
+        logging.debug('Reset message received')
+        if self.stimulus_pool:
+            # Drop the pending stimuli and let the ones being performed finish while still READY:
+            # they would interfere with the reset, and fail once the state changed.
+            self.stimulus_pool.clear_queue()
+            self.stimulus_pool.join()
+
+        with self._reset_lock:
+            if self._reset_thread is not None:
+                if self._resets_pending:
+                    logging.info('Reset joins the reset in progress')
+                    metrics.increment('reset.coalesced')
+                else:
+                    logging.info('Reset queued behind the reset in progress')
+                self._resets_pending += 1
+                return
+
+            if self.state == State.READY:
+                self.state = State.RESETTING
+                self._resets_pending = 1
+                self._reset_thread = reset_thread = Thread(target=self._run_reset, name='reset', daemon=True)
+            else:
+                reset_thread = None
+
+        if reset_thread is None:
+            message = 'Reset received while not ready'
+            logging.error(message)
+            self.send_error(message)
+            return
+
+        self._clear_qthread_queues(inbound=_is_label)
+        reset_thread.start()
+
+    def _run_reset(self):
+        """ Reset the SUT until no RESET is pending anymore. Runs on the reset thread. """
+        while True:
+            profiler.end_test_case()
+            memory_tracker.checkpoint()
+            self._reset_ready_sent = False
 
             try:
                 logging.debug('Resetting the SUT')
@@ -151,18 +353,45 @@ class AdapterCore:
                 if response:
                     message = 'Resetting the SUT failed due to: {reason}'.format(reason=response)
                     logging.error(message)
+                    self._abandon_reset()
                     self.send_error(message)
                     return
 
+                if self._reset_received_at is not None:
+                    latency_ms = (time.perf_counter() - self._reset_received_at) * 1000
+                    self._reset_received_at = None
+                    logging.info('Reset handled in %.1f ms after it was received', latency_ms)
+                    metrics.observe('reset.latency_ms', latency_ms)
+
             except Exception as e:
                 message = 'Error while resetting connection to the SUT: {reason}'.format(reason=str(e))
                 logging.error(message)
+                self._abandon_reset()
                 self.send_error(message)
                 return
-        else:
-            message = 'Reset received while not ready'
-            logging.error(message)
-            self.send_error(message)
+
+            with self._reset_lock:
+                if not self._reset_ready_sent:
+                    logging.warning('The handler did not send READY after resetting the SUT')
+                    self._resets_pending = 0
+                if not self._resets_pending:
+                    self._reset_thread = None
+                    return
+
+                # RESETs received after READY was sent: the SUT is used again, so it needs another reset.
+                self.state = State.RESETTING
+
+    def _abandon_reset(self):
+        with self._reset_lock:
+            self._resets_pending = 0
+            self._reset_thread = None
+
+    def _join_reset(self):
+        """ Wait until the reset in progress, if any, has finished. """
+        reset_thread = self._reset_thread
+        if reset_thread is not None and reset_thread is not current_thread():
+            logging.info('Waiting for the reset in progress to finish')
+            reset_thread.join()
 
     def on_error(self, message: str):
         """
@@ -173,7 +402,7 @@ class AdapterCore:
         """
         self.state = State.ERROR
 
-        logging.error('Error message received: {msg}'.format(msg=message))
+        logging.error('Error message received: %s', message)
 
         # NOTE: we do not send an error message back.
         self.broker_connection.close(reason=message)
@@ -185,7 +414,7 @@ class AdapterCore:
         Args:
             message (str): Send an error message to AMP
         """
-        self._queue_message_to_amp(message_pb2.Message(error=message_pb2.Message.Error(message=message)))
+        self._queue_message_to_amp(_error_frame(message))
         self.broker_connection.close(reason=message)
 
     def send_response(self, label: Label):
@@ -195,10 +424,11 @@ class AdapterCore:
         Args:
             label (Label): Label to be sent back to AMP
         """
-        pb_label = label.encode()
+        with tracer.span('response.encode', label.correlation_id):
+            pb_label = label.encode()
 
         if pb_label.type == label_pb2.Label.LabelType.RESPONSE:
-            logging.info('Sending response to AMP: !{label}'.format(label=pb_label.label))
+            logging.info('Sending response to AMP: !%s', pb_label.label)
             self._queue_message_to_amp(message_pb2.Message(label=pb_label))
         else:
             message = 'Label is not of type Response'
@@ -210,13 +440,29 @@ class AdapterCore:
         Let AMP know the adapter is ready to start testing.
         """
 
+        with self._reset_lock:
+            if current_thread() is self._reset_thread:
+                # Completes the reset in progress, and with it every RESET that joined it.
+                count, self._resets_pending = self._resets_pending, 0
+                self._reset_ready_sent = True
+            else:
+                count = 1
+
+            if not count:
+                logging.info('Reset was cancelled, not sending ready')
+                return
+            self.state = State.READY
+
         logging.debug('Sending ready')
-        self._queue_message_to_amp(message_pb2.Message(ready=message_pb2.Message.Ready()))
-        self.state = State.READY
+        for _ in range(count):
+            self._queue_message_to_amp(_READY_FRAME)
+        profiler.start_test_case()
 
     def send_announcement(self, name: str, supported_labels: List[Label], configuration: Configuration):
         """
         Send an announcement to AMP to let the platform know this adapter is available.
+        The serialized announcement is cached, and only encoded again when the name,
+        supported labels or configuration changed since the previous announcement.
 
         Args:
             name (str): Name of the adapter
@@ -226,13 +472,20 @@ class AdapterCore:
 
         logging.info('Announcing')
 
+        if self._announcement and self._announcement[:3] == (name, supported_labels, configuration):
+            logging.debug('Reusing the serialized announcement')
+            self._queue_message_to_amp(self._announcement[3])
+            return
+
         pb_configuration = configuration.encode()
         pb_supported_labels = [label.encode() for label in supported_labels]
         pb_announcement = announcement_pb2.Announcement(
             name=name, labels=pb_supported_labels, configuration=pb_configuration
         )
 
-        self._queue_message_to_amp(message_pb2.Message(announcement=pb_announcement))
+        frame = message_pb2.Message(announcement=pb_announcement).SerializeToString()
+        self._announcement = (name, supported_labels, configuration, frame)
+        self._queue_message_to_amp(frame)
 
     def send_stimulus_confirmation(self, pb_label: label_pb2.Label):
         """
@@ -242,7 +495,7 @@ class AdapterCore:
         Args:
             pb_label (label_pb2.Label)
         """
-        logging.debug('Sending confirmation for stimulus ?{label} to AMP'.format(label=pb_label.label))
+        logging.debug('Sending confirmation for stimulus ?%s to AMP', pb_label.label)
         self._queue_message_to_amp(message_pb2.Message(label=pb_label))
 
     def handle_message(self, raw_message:str):
@@ -251,11 +504,27 @@ class AdapterCore:
         Adds the message to the queue of messages to be handled by
         qthread_handle_message.
 
+        RESET and ERROR messages are recognized on the websocket thread and put in
+        the control lane. A RESET also drops the pending stimuli: the SUT is about
+        to be reset, so stimulating it first is wasted work. Other pending messages,
+        e.g. an ERROR or a Configuration, are kept.
+
         Args:
             raw_message (str): Raw string message from AMP.
         """
-        logging.debug('Adding message (id: {id}) from AMP to the queue to be handled'.format(id=id(raw_message)))
-        self.qthread_handle_message.put(raw_message)
+        tag = _peek_message_tag(raw_message)
+
+        if tag == _RESET_TAG:
+            logging.debug('Reset (id: %s) received, dropping pending messages from AMP', id(raw_message))
+            self._reset_received_at = time.perf_counter()
+            self.qthread_handle_message.clear_queue(drop=_is_label)
+            self.qthread_handle_message.put(raw_message, priority=QThread.PRIORITY_CONTROL)
+        elif tag == _ERROR_TAG:
+            logging.debug('Error (id: %s) received, handling it before pending messages', id(raw_message))
+            self.qthread_handle_message.put(raw_message, priority=QThread.PRIORITY_CONTROL)
+        else:
+            logging.debug('Adding message (id: %s) from AMP to the queue to be handled', id(raw_message))
+            self.qthread_handle_message.put(raw_message)
 
     def _handle_message(self, raw_message:str):
         """
@@ -266,13 +535,15 @@ class AdapterCore:
             raw_message (str): Raw string message from AMP.
         """
 
-        logging.debug('Starting the handling of message (id: {id}) from AMP'.format(id=id(raw_message)))
+        logging.debug('Starting the handling of message (id: %s) from AMP', id(raw_message))
         pb_message = message_pb2.Message()
 
+        start_ns = time.perf_counter_ns()
         try:
             pb_message.ParseFromString(raw_message)
         except Exception as e:
-            logging.error('Could not decode message due to: {ex}'.format(ex=e))
+            logging.error('Could not decode message due to: %s', e)
+        tracer.record('amp.decode', pb_message.label.correlation_id, start_ns, time.perf_counter_ns())
 
         if pb_message.HasField('configuration'):
             logging.debug('Received a configuration')
@@ -282,33 +553,47 @@ class AdapterCore:
             self.on_error(pb_message.error.message)
         elif pb_message.HasField('label'):
             logging.debug('Received a label')
-            self.on_label(pb_message.label)
+            if self.stimulus_pool:
+                self.stimulus_pool.put(self.handler.stimulus_key(pb_message.label), pb_message.label)
+            else:
+                self.on_label(pb_message.label)
         elif pb_message.HasField('reset'):
             logging.debug('Received a reset')
             self.on_reset()
         elif pb_message.HasField('ready'):
             logging.debug('Received ready, this should not be send')
         else:
-            logging.debug('Unknown message type: {msg}'.format(msg=pb_message))
+            logging.debug('Unknown message type: %s', pb_message)
+
+    def _clear_qthread_queues(self, inbound=None):
+        """
+        Drop the pending messages to AMP and from AMP.
 
-    def _clear_qthread_queues(self):
+        Args:
+            inbound(raw_message): method which returns whether a pending message from AMP is dropped; all are if None
+        """
         logging.info('Clearing queues with pending messages')
         self.qthread_to_amp.clear_queue()
-        self.qthread_handle_message.clear_queue()
+        self.qthread_handle_message.clear_queue(drop=inbound)
+        if self.stimulus_pool:
+            self.stimulus_pool.clear_queue()
 
-    def _queue_message_to_amp(self, message: message_pb2.Message):
+    def _queue_message_to_amp(self, message: message_pb2.Message | bytes):
         """
         Adds message to the queue of pending messages to AMP.
         Separate thread takes care of the actual sending of the message.
         See the worker _send_message_to_amp below.
 
         Args:
-            message (message_pb2.Message)
+            message (message_pb2.Message | bytes): The message, or an already serialized message
         """
-        logging.debug('Adding message to the queue ({id})'.format(id=id(message)))
+        logging.debug('Adding message to the queue (%s)', id(message))
         self.qthread_to_amp.put(message)
 
     def _send_message_to_amp(self, message):
         """ QThread's process_item method for sending a message to AMP. """
-        logging.debug('Sending message to AMP ({id})'.format(id=id(message)))
-        self.broker_connection.send(message.SerializeToString())
+        logging.debug('Sending message to AMP (%s)', id(message))
+        if isinstance(message, bytes):
+            self.broker_connection.send(message)
+        else:
+            self.broker_connection.send(message.SerializeToString())
@@ -16,6 +16,7 @@ class ConfigurationItem:
             description (str): A humanreadable description of the item
             value (int | float | str | bool): Value of the item. Can be of different types.
     """
+    __slots__ = ('name', 'tipe', 'description', 'value')
 
     def __init__(self, name: str, tipe: Type, description: str, value: int | float | str | bool):
         if not isinstance(tipe, Type):
@@ -58,7 +59,8 @@ class ConfigurationItem:
 
     def __eq__(self, other):
         if isinstance(other, ConfigurationItem):
-            return self.__dict__ == other.__dict__
+            return (self.name, self.tipe, self.description, self.value) == \
+                (other.name, other.tipe, other.description, other.value)
 
     @classmethod
     def decode(cls, pb_config_item: configuration_pb2.Configuration.Item):
@@ -115,6 +117,26 @@ class Configuration:
         """
         return configuration_pb2.Configuration(items=[item.encode() for item in self.items])
 
+    def value_of(self, name: str, default=None):
+        """
+        The value of the configuration item with the given name.
+
+        Args:
+            name (str): Name of the item
+            default: Returned if there is no such item
+
+        Returns:
+            The value of the item, or `default`
+        """
+        for item in self.items:
+            if item.name == name:
+                return item.value
+        return default
+
+    def __eq__(self, other):
+        if isinstance(other, Configuration):
+            return self.items == other.items
+
     @classmethod
     def decode(cls, pb_config: configuration_pb2.Configuration):
         """
@@ -1,9 +1,13 @@
+import sys
+import time
+
 from datetime import datetime
 from enum import Enum
 from typing import List
 
 from generic.api import label_pb2
 from generic.api.parameter import Parameter
+from generic.util.time_util import datetime_to_ns, ns_to_datetime
 
 
 class Sort(Enum):
@@ -17,11 +21,16 @@ class Sort(Enum):
 class Label:
     """
     DTO describing the Label message.
-    Has convenient methods to en- and decode to Google Protobuf format
+    Has convenient methods to en- and decode to Google Protobuf format.
+    The name and channel are interned, as the same few names are used for every label.
+
+    The timestamp is kept as integer nanoseconds since the Unix epoch (`timestamp_ns`), the
+    unit of the Google Protobuf field. It is only converted to a datetime on demand (`timestamp`).
     """
+    __slots__ = ('sort', 'name', 'channel', 'parameters', 'timestamp_ns', 'physical_label', 'correlation_id')
 
     def __init__(self, sort: Sort, name: str, channel: str, parameters: List[Parameter] = None,
-                 timestamp: datetime = None, physical_label: bytes = None, correlation_id: int = 0):
+                 timestamp: datetime | int = None, physical_label: bytes = None, correlation_id: int = 0):
         parameters = parameters or []
 
         if not isinstance(sort, Sort):
@@ -37,14 +46,29 @@ class Label:
             self.parameters = []
 
         self.sort = sort
-        self.name = name
-        self.channel = channel
+        self.name = sys.intern(name) if type(name) is str else name
+        self.channel = sys.intern(channel) if type(channel) is str else channel
         self.parameters = parameters
 
-        self.timestamp = timestamp
+        self.timestamp = timestamp  # stored as timestamp_ns
         self.physical_label = physical_label
         self.correlation_id = correlation_id
 
+    def value_of(self, name: str):
+        """
+        The value of the parameter with the given name.
+
+        Args:
+            name (str): Name of the parameter
+
+        Returns:
+            The value of the parameter, or None if the label has no such parameter
+        """
+        for parameter in self.parameters:
+            if parameter.name == name:
+                return parameter.value
+        return None
+
     def encode(self) -> label_pb2.Label:
         """
         Encode this object in Google Protobuf format
@@ -56,11 +80,13 @@ class Label:
             label=self.name,
             type=self.sort.value,
             channel=self.channel,
-            parameters=[param.encode() for param in self.parameters],
         )
+        add = pb_label.parameters.add
+        for param in self.parameters:
+            param.encode(add())
 
-        if self.timestamp:
-            pb_label.timestamp = int(self.timestamp.timestamp() * 1e9)
+        if self.timestamp_ns:
+            pb_label.timestamp = self.timestamp_ns
         if self.physical_label:
             pb_label.physical_label = self.physical_label
         if self.correlation_id:
@@ -68,9 +94,25 @@ class Label:
 
         return pb_label
 
+    @property
+    def timestamp(self) -> datetime:
+        """ The timestamp as a datetime (with microsecond resolution), or None if there is none. """
+        return ns_to_datetime(self.timestamp_ns) if self.timestamp_ns is not None else None
+
+    @timestamp.setter
+    def timestamp(self, timestamp: datetime | int):
+        """ Set the timestamp from a datetime or from integer nanoseconds since the Unix epoch. """
+        if isinstance(timestamp, datetime):
+            timestamp = datetime_to_ns(timestamp)
+        self.timestamp_ns = timestamp
+
+    def _key(self) -> tuple:
+        return (self.sort, self.name, self.channel, self.parameters, self.timestamp_ns, self.physical_label,
+                self.correlation_id)
+
     def __eq__(self, other):
         if isinstance(other, Label):
-            return self.__dict__ == other.__dict__
+            return self._key() == other._key()
 
     @classmethod
     def decode(cls, pb_label: label_pb2.Label):
@@ -83,8 +125,7 @@ class Label:
         Returns:
             Label
         """
-        timestamp = datetime.fromtimestamp(pb_label.timestamp / 1e6) \
-            if pb_label.timestamp else datetime.now().timestamp()
+        timestamp = pb_label.timestamp or time.time_ns()
 
         physical_label = pb_label.physical_label.decode('UTF-8') if pb_label.physical_label else None
 
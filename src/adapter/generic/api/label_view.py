@@ -0,0 +1,117 @@
+import time
+
+from collections.abc import Sequence
+from datetime import datetime
+
+from generic.api import label_pb2
+from generic.api.label import Sort
+from generic.api.parameter import Parameter
+from generic.util.time_util import ns_to_datetime
+
+_UNSET = object()
+
+
+class _LazyParameters(Sequence):
+    """
+    Sequence of the parameters of a label, decoded to `Parameter` on first access and cached.
+    """
+    __slots__ = ('_pb_parameters', '_cache')
+
+    def __init__(self, pb_parameters):
+        self._pb_parameters = pb_parameters
+        self._cache = [None] * len(pb_parameters)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._cache)))]
+
+        parameter = self._cache[index]
+        if parameter is None:
+            parameter = self._cache[index] = Parameter.decode(self._pb_parameters[index])
+        return parameter
+
+
+class LabelView:
+    """
+    Read-only view of a label in Google Protobuf format, with the same attributes as `Label`.
+    Unlike `Label.decode`, nothing is decoded up front: a parameter is only decoded when it
+    is accessed, and the result is cached; the same goes for the timestamp and physical label. This makes it a cheap drop-in replacement for
+    `Label.decode` on the stimulus path of a handler.
+
+    Attributes:
+        pb_label (label_pb2.Label): The viewed label
+    """
+    __slots__ = ('pb_label', '_parameters', '_physical_label', '_timestamp_ns')
+
+    def __init__(self, pb_label: label_pb2.Label):
+        self.pb_label = pb_label
+        self._parameters = None
+        self._physical_label = _UNSET
+        self._timestamp_ns = None
+
+    @property
+    def sort(self) -> Sort:
+        return Sort(self.pb_label.type)
+
+    @property
+    def name(self) -> str:
+        return self.pb_label.label
+
+    @property
+    def channel(self) -> str:
+        return self.pb_label.channel
+
+    @property
+    def correlation_id(self) -> int:
+        return self.pb_label.correlation_id
+
+    @property
+    def parameters(self) -> Sequence:
+        if self._parameters is None:
+            self._parameters = _LazyParameters(self.pb_label.parameters)
+        return self._parameters
+
+    @property
+    def timestamp_ns(self) -> int:
+        # Resolved once, as `Label.decode` does: a label without a timestamp is stamped when first read.
+        if self._timestamp_ns is None:
+            self._timestamp_ns = self.pb_label.timestamp or time.time_ns()
+        return self._timestamp_ns
+
+    @property
+    def timestamp(self) -> datetime:
+        return ns_to_datetime(self.timestamp_ns)
+
+    @property
+    def physical_label(self) -> str:
+        if self._physical_label is _UNSET:
+            physical_label = self.pb_label.physical_label
+            self._physical_label = physical_label.decode('UTF-8') if physical_label else None
+        return self._physical_label
+
+    def value_of(self, name: str):
+        """
+        The value of the parameter with the given name; only that parameter is decoded.
+
+        Args:
+            name (str): Name of the parameter
+
+        Returns:
+            The value of the parameter, or None if the label has no such parameter
+        """
+        for index, pb_param in enumerate(self.pb_label.parameters):
+            if pb_param.name == name:
+                return self.parameters[index].value
+        return None
+
+    def encode(self) -> label_pb2.Label:
+        """
+        The label in Google Protobuf format, i.e. the viewed label itself.
+
+        Returns:
+            label_pb2.Label
+        """
+        return self.pb_label
@@ -1,10 +1,38 @@
+import sys
+
+from array import array
 from datetime import datetime, date
 from types import SimpleNamespace
 from typing import Any
 
 from generic.api import label_pb2
 from generic.api.type import Type
-from generic.util.namespace_util import to_obj
+from generic.util.time_util import NANOSECONDS_PER_MICROSECOND, datetime_to_ns, ns_to_datetime
+
+# The `type` oneof fields of `label_pb2.Label.Parameter.Value` and the Type they hold.
+_FIELD_TYPES = {
+    'string': Type.STRING,
+    'integer': Type.INTEGER,
+    'decimal': Type.DECIMAL,
+    'boolean': Type.BOOLEAN,
+    'date': Type.DATE,
+    'time': Type.TIME,
+    'array': Type.ARRAY,
+    'struct': Type.STRUCT,
+    'hash_value': Type.HASH,
+}
+
+# Fields which are decoded as is, without any conversion.
+_PLAIN_FIELDS = frozenset(('string', 'integer', 'decimal', 'boolean'))
+
+_CONTAINER_FIELDS = frozenset(('array', 'struct', 'hash_value'))
+
+# Type codes of `array.array` and the field their elements are encoded in.
+_ARRAY_TYPECODE_FIELDS = dict.fromkeys('bBhHiIlLqQ', 'integer')
+_ARRAY_TYPECODE_FIELDS.update(dict.fromkeys('fd', 'decimal'))
+
+# Python types which are encoded in a field without any conversion.
+_PLAIN_TYPE_FIELDS = {str: 'string', int: 'integer', float: 'decimal', bool: 'boolean'}
 
 
 def _determine_type_from_value(value) -> Type:
@@ -16,7 +44,7 @@ def _determine_type_from_value(value) -> Type:
         tipe = Type.HASH
     elif type(value) == SimpleNamespace:
         tipe = Type.STRUCT
-    elif type(value) == list:
+    elif type(value) == list or type(value) == array:
         tipe = Type.ARRAY
     elif type(value) == int:
         tipe = Type.INTEGER
@@ -35,129 +63,204 @@ def _determine_type_from_value(value) -> Type:
 
 
 def _is_array_of_same_type(value) -> bool:
-    # Value should be of type list, this is checked earlier, so we do not check this here
-    return len(set(map(lambda val: type(val), value))) == 1
+    # Value should be a collection, this is checked earlier, so we do not check this here
+    if value is None or type(value) == array:
+        return True
+
+    iterator = iter(value)
+    first = next(iterator, None)
+    first_type = type(first)
+    return all(type(val) is first_type for val in iterator)
+
+
+def _encode_value(tipe, value=None, pb_value=None):
+    """
+    Encode a value in a single, iterative pass: nested arrays, structs and hashes are
+    encoded in place through an explicit stack, so deep nesting does not recurse.
+    The value is encoded into `pb_value` if given: passing a nested message to a protobuf
+    constructor copies it by serializing and parsing it, which fails on deep nesting.
+    """
+    if not tipe:
+        return None
 
+    if pb_value is None:
+        pb_value = label_pb2.Label.Parameter.Value()
+    stack = [(tipe, value, pb_value)]
 
-def _encode_value(tipe, value=None):
+    while stack:
+        _encode_into(*stack.pop(), stack)
+
+    return pb_value
+
+
+def _encode_into(tipe, value, pb_value, stack):
     if value and type(value) is Type:
         value = None
 
     if tipe == Type.STRING:
-        value = 'string' if value is None else value
-        pb_value = label_pb2.Label.Parameter.Value(string=value)
+        pb_value.string = 'string' if value is None else value
     elif tipe == Type.INTEGER:
-        value = 1 if value is None else value
-        pb_value = label_pb2.Label.Parameter.Value(integer=value)
+        pb_value.integer = 1 if value is None else value
     elif tipe == Type.BOOLEAN:
-        value = True if value is None else value
-        pb_value = label_pb2.Label.Parameter.Value(boolean=value)
+        pb_value.boolean = True if value is None else value
     elif tipe == Type.DECIMAL:
-        value = 1.0 if value is None else value
-        pb_value = label_pb2.Label.Parameter.Value(decimal=value)
+        pb_value.decimal = 1.0 if value is None else value
     elif tipe == Type.TIME:
         value = datetime.now() if value is None else value
-        pb_value = label_pb2.Label.Parameter.Value(time=int(value.timestamp() * 1e6))
+        pb_value.time = datetime_to_ns(value) // NANOSECONDS_PER_MICROSECOND
     elif tipe == Type.DATE:
         value = date.today() if value is None else value
-        pb_value = label_pb2.Label.Parameter.Value(
-            date=int(datetime(year=value.year, month=value.month, day=value.day).timestamp() * 1e3))
+        pb_value.date = int(datetime(year=value.year, month=value.month, day=value.day).timestamp() * 1e3)
     elif tipe == Type.ARRAY:
-        value = [] if value is None else value
-        pb_value = label_pb2.Label.Parameter.Value(array=_encode_array_value(value))
+        pb_value.array.SetInParent()
+        if value:
+            _encode_array_values(value, pb_value.array.values, stack)
     elif tipe == Type.STRUCT:
-        value = to_obj({}) if value is None else value
-        pb_value = label_pb2.Label.Parameter.Value(struct=_encode_hash_or_struct_entries(value.__dict__))
+        pb_value.struct.SetInParent()
+        if value is not None:
+            _encode_entries(value.__dict__, pb_value.struct.entries, stack)
     elif tipe == Type.HASH:
-        value = {} if value is None else value
-        pb_value = label_pb2.Label.Parameter.Value(hash_value=_encode_hash_or_struct_entries(value))
-    elif not tipe:
-        pb_value = None
-    else:
+        pb_value.hash_value.SetInParent()
+        if value:
+            _encode_entries(value, pb_value.hash_value.entries, stack)
+    elif tipe:
         raise ValueError('Can not encode parameter of type {tipe}'.format(tipe=tipe))
 
-    return pb_value
 
+def _encode_array_values(values, pb_values, stack):
+    add = pb_values.add
 
-def _encode_array_value(values):
-    pb_values = [_encode_value(_determine_type_from_value(e), e) for e in values]
-    return label_pb2.Label.Parameter.Value.Array(values=pb_values)
+    # Fast path: homogeneous arrays of plain values are encoded directly.
+    if type(values) == array:
+        field = _ARRAY_TYPECODE_FIELDS.get(values.typecode)
+        if field is None:
+            raise ValueError('Can not encode array of type code {code}'.format(code=values.typecode))
+        for val in values:
+            add(**{field: val})
+        return
 
+    field = _PLAIN_TYPE_FIELDS.get(type(values[0]))
+    if field is not None:
+        element_type = type(values[0])
+        for val in values:
+            if type(val) is not element_type:
+                raise ValueError('Array can only hold elements of a single type')
+            add(**{field: val})
+        return
 
-def _encode_hash_or_struct_entries(entries):
-    def _encode_hash_or_struct_entry(key, val):
-        return label_pb2.Label.Parameter.Value.Hash.Entry(
-            key=_encode_value(_determine_type_from_value(key), key),
-            value=_encode_value(_determine_type_from_value(val), val)
-        )
+    for val in values:
+        stack.append((_determine_type_from_value(val), val, add()))
 
-    pb_entries = [_encode_hash_or_struct_entry(k, v) for k, v in entries.items()]
-    return label_pb2.Label.Parameter.Value.Hash(entries=pb_entries)
+
+def _encode_entries(entries, pb_entries, stack):
+    for key, val in entries.items():
+        pb_entry = pb_entries.add()
+        stack.append((_determine_type_from_value(key), key, pb_entry.key))
+        stack.append((_determine_type_from_value(val), val, pb_entry.value))
 
 
 def _decode_type_of_value(pb_value) -> Type:
-    if pb_value.HasField('string'):
-        return Type.STRING
-    elif pb_value.HasField('integer'):
-        return Type.INTEGER
-    elif pb_value.HasField('decimal'):
-        return Type.DECIMAL
-    elif pb_value.HasField('boolean'):
-        return Type.BOOLEAN
-    elif pb_value.HasField('date'):
-        return Type.DATE
-    elif pb_value.HasField('time'):
-        return Type.TIME
-    elif pb_value.HasField('array'):
-        return Type.ARRAY
-    elif pb_value.HasField('struct'):
-        return Type.STRUCT
-    elif pb_value.HasField('hash_value'):
-        return Type.HASH
+    return _FIELD_TYPES.get(pb_value.WhichOneof('type'))
+
+
+def _decode_scalar(field, pb_value) -> Any:
+    if field in _PLAIN_FIELDS:
+        return getattr(pb_value, field)
+    elif field == 'date':
+        return datetime.fromtimestamp(pb_value.date / 1e3).date()
+    elif field == 'time':
+        return ns_to_datetime(pb_value.time * NANOSECONDS_PER_MICROSECOND)
+    elif field is None:
+        return None
+
+    raise ValueError('Can not decode a {field} as a scalar value'.format(field=field))
+
+
+def _new_container(field):
+    if field == 'array':
+        return []
+    elif field == 'struct':
+        return SimpleNamespace()
+    return {}
 
 
 def _decode_value(pb_value) -> Any:
-    tipe = _decode_type_of_value(pb_value)
-    val = None
+    """
+    Decode a value in a single, iterative pass. Containers are created empty and filled
+    through an explicit stack, so deep nesting does not recurse. The element types of
+    arrays and the value types of hashes are validated while decoding.
+    """
+    field = pb_value.WhichOneof('type')
+    if field not in _CONTAINER_FIELDS:
+        return _decode_scalar(field, pb_value)
+
+    root = _new_container(field)
+    stack = [(field, pb_value, root)]
+
+    while stack:
+        field, pb_value, container = stack.pop()
+
+        if field == 'array':
+            _decode_array_into(pb_value.array.values, container, stack)
+        elif field == 'struct':
+            _decode_entries_into(pb_value.struct.entries, container, stack, struct=True)
+        else:
+            _decode_entries_into(pb_value.hash_value.entries, container, stack, struct=False)
+
+    return root
 
-    if tipe == Type.STRING:
-        val = pb_value.string
-    elif tipe == Type.INTEGER:
-        val = pb_value.integer
-    elif tipe == Type.DECIMAL:
-        val = pb_value.decimal
-    elif tipe == Type.BOOLEAN:
-        val = pb_value.boolean
-    elif tipe == Type.DATE:
-        val = datetime.fromtimestamp(pb_value.date / 1e3).date()
-    elif tipe == Type.TIME:
-        val = datetime.fromtimestamp(pb_value.time / 1e6)
-    elif tipe == Type.ARRAY:
-        val = _decode_array(pb_value.array)
-    elif tipe == Type.STRUCT:
-        val = _decode_struct(pb_value.struct)
-    elif tipe == Type.HASH:
-        val = _decode_hash(pb_value.hash_value)
 
-    return val
+def _decode_array_into(pb_values, target, stack):
+    if not pb_values:
+        return
 
+    first_field = pb_values[0].WhichOneof('type')
+    append = target.append
 
-def _decode_array(pb_array):
-    if len({_decode_type_of_value(pb_elem) for pb_elem in pb_array.values}) > 1:
-        raise 'Array can only hold elements of a single type'
+    # Fast path: homogeneous arrays of plain values are read directly.
+    if first_field in _PLAIN_FIELDS:
+        for pb_elem in pb_values:
+            if pb_elem.WhichOneof('type') != first_field:
+                raise ValueError('Array can only hold elements of a single type')
+            append(getattr(pb_elem, first_field))
+        return
 
-    return [_decode_value(pb_elem) for pb_elem in pb_array.values]
+    for pb_elem in pb_values:
+        field = pb_elem.WhichOneof('type')
+        if field != first_field:
+            raise ValueError('Array can only hold elements of a single type')
 
+        if field in _CONTAINER_FIELDS:
+            child = _new_container(field)
+            stack.append((field, pb_elem, child))
+            append(child)
+        else:
+            append(_decode_scalar(field, pb_elem))
 
-def _decode_struct(pb_struct):
-    return to_obj({_decode_value(pb_elem.key): _decode_value(pb_elem.value) for pb_elem in pb_struct.entries})
 
+def _decode_entries_into(pb_entries, target, stack, struct):
+    value_field = None
 
-def _decode_hash(pb_hash):
-    if len({_decode_type_of_value(pb_elem.value) for pb_elem in pb_hash.entries}) > 1:
-        raise 'Hashes can only hold elements of a single type'
+    for pb_entry in pb_entries:
+        key = _decode_scalar(pb_entry.key.WhichOneof('type'), pb_entry.key)
+        field = pb_entry.value.WhichOneof('type')
 
-    return {_decode_value(pb_elem.key): _decode_value(pb_elem.value) for pb_elem in pb_hash.entries}
+        if not struct:
+            if value_field is None:
+                value_field = field
+            elif field != value_field:
+                raise ValueError('Hashes can only hold elements of a single type')
+
+        if field in _CONTAINER_FIELDS:
+            val = _new_container(field)
+            stack.append((field, pb_entry.value, val))
+        else:
+            val = _decode_scalar(field, pb_entry.value)
+
+        if struct:
+            setattr(target, key, val)
+        else:
+            target[key] = val
 
 
 class Parameter:
@@ -169,30 +272,35 @@ class Parameter:
         tipe (Type): Type of the parameter
         value (int|float|bool|date|datetime|List|dict|SimpleNamespace): Value of the parameter.
             Can be of different types. Defaults to None.
+        validate (bool): Validate the name, tipe and value. Trusted internal paths (e.g. decoding,
+            which already checks the types) can skip this. Defaults to True.
     """
-    def __init__(self, name, tipe, value=None):
-        if not name:
-            raise ValueError('name must not be empty')
+    __slots__ = ('name', 'tipe', 'value')
+
+    def __init__(self, name, tipe, value=None, validate=True):
+        if validate:
+            if not name:
+                raise ValueError('name must not be empty')
 
-        if not isinstance(tipe, Type):
-            raise ValueError('tipe must be of enum Type')
+            if not isinstance(tipe, Type):
+                raise ValueError('tipe must be of enum Type')
 
-        if value and tipe != _determine_type_from_value(value):
-            raise ValueError("value must be of same type as the given 'tipe'")
+            if value and tipe != _determine_type_from_value(value):
+                raise ValueError("value must be of same type as the given 'tipe'")
 
-        if tipe == Type.ARRAY and not _is_array_of_same_type(value):
-            raise ValueError("All elements in the array must be of the same type")
+            if tipe == Type.ARRAY and not _is_array_of_same_type(value):
+                raise ValueError("All elements in the array must be of the same type")
 
-        if tipe == Type.HASH and not _is_array_of_same_type(value.values()):
-            raise ValueError("All values in an hash must be of the same type")
+            if tipe == Type.HASH and not _is_array_of_same_type(value.values()):
+                raise ValueError("All values in an hash must be of the same type")
 
-        self.name = name
+        self.name = sys.intern(name) if type(name) is str else name
         self.tipe = tipe
         self.value = value
 
     def __eq__(self, other):
         if isinstance(other, Parameter):
-            return self.__dict__ == other.__dict__
+            return self.name == other.name and self.tipe == other.tipe and self.value == other.value
 
     @classmethod
     def decode(cls, pb_param: label_pb2.Label.Parameter):
@@ -208,13 +316,21 @@ class Parameter:
         tipe = _decode_type_of_value(pb_param.value)
         value = _decode_value(pb_param.value)
 
-        return Parameter(pb_param.name, tipe, value=value)
+        return Parameter(pb_param.name, tipe, value=value, validate=False)
 
-    def encode(self) -> label_pb2.Label.Parameter:
+    def encode(self, pb_param: label_pb2.Label.Parameter = None) -> label_pb2.Label.Parameter:
         """
         Encode this DTO to Google Protobuf format.
 
+        Args:
+            pb_param (label_pb2.Label.Parameter): Message to encode into, e.g. one added to the
+                parameters of a label; a new one if None
+
         Returns:
             label_pb2.Label.Parameter: Parameter in Google Protobuf Format
         """
-        return label_pb2.Label.Parameter(name=self.name, value=_encode_value(self.tipe, self.value))
+        if pb_param is None:
+            pb_param = label_pb2.Label.Parameter()
+        pb_param.name = self.name
+        _encode_value(self.tipe, self.value, pb_param.value)
+        return pb_param
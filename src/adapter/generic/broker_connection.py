@@ -1,6 +1,21 @@
 import logging
+import threading
+import time
 import websocket
 
+from generic.deflate import DeflateFrameBuffer, PerMessageDeflate, OFFER
+from generic.util.logging_util import Preview
+from generic.util.metrics import metrics
+from generic.util.tracing import tracer
+
+# Messages smaller than this many bytes are sent uncompressed, even when compression is negotiated.
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+
+# Seconds between pings to AMP (0: no pings, pinging is opt-in), and the seconds a pong may take
+# before the link is considered dead; generous, so a slow link does not abort a test run.
+DEFAULT_PING_INTERVAL = 0
+DEFAULT_PING_TIMEOUT = 10.0
+
 class BrokerConnection:
     """
     This class holds the connection with the Axini Modeling Platform. It is responsible
@@ -8,16 +23,42 @@ class BrokerConnection:
 
     The `BrokerConnection` forwards incoming message to the `AdapterCore`.
 
+    When a compression threshold is given, permessage-deflate is offered to AMP. If AMP accepts
+    it, messages of at least the threshold are sent compressed and compressed messages from AMP
+    are decompressed.
+
+    When a ping interval is given, AMP is pinged every `ping_interval` seconds while connected,
+    with the send time as payload.
+    The round trip time of every pong is published as the `amp.rtt_ms` histogram, next to the
+    `sut.latency.*` histograms of the handler, so network and SUT latency can be told apart.
+    When no pong arrives within `ping_timeout` seconds the link is considered dead and the socket
+    is aborted, after which the reconnect loop of the `AdapterCore` opens a new connection; AMP
+    sends the unchanged configuration again, so the SUT is reset before READY is sent.
+
     Attributes:
         url (str): The websocket URL of the AMP instance that should be connected to.
         token (str): Token to authorize with.
+        compression_threshold (int): Size in bytes from which messages are compressed, None to not offer compression
+        ping_interval (float): Seconds between pings, 0 to not ping
+        ping_timeout (float): Seconds to wait for a pong before the link is considered dead
     """
 
-    def __init__(self, url, token):
+    def __init__(self, url, token, compression_threshold=None, ping_interval=DEFAULT_PING_INTERVAL,
+                 ping_timeout=DEFAULT_PING_TIMEOUT):
+        if ping_interval and not ping_timeout > 0:
+            raise ValueError('ping_timeout should be positive')
+
         self.url = url
         self.token = token
+        self.compression_threshold = compression_threshold
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
         self.adapter_core = None  # callback to adapter; register separately
         self.websocket = None  # reference to websocket; initialized on #connect
+        self.deflate = None  # negotiated permessage-deflate; set on #on_open
+        self._closed = threading.Event()  # set when the connection closes, stops its keepalive thread
+        self._pong = threading.Event()  # set when the pong of the last ping arrives
+        self._ping_sent = None  # perf_counter_ns payload of the last ping
 
     def register_adapter_core(self, adapter_core):
         """
@@ -34,13 +75,18 @@ class BrokerConnection:
         """
         logging.info('Connecting to AMP')
 
+        header = {'Authorization': 'Bearer {token}'.format(token=self.token)}
+        if self.compression_threshold is not None:
+            header['Sec-WebSocket-Extensions'] = OFFER
+
         self.websocket = websocket.WebSocketApp(
             self.url,
             on_open=lambda _: self.on_open(),
             on_close=lambda _, close_status_code, close_msg: self.on_close(close_status_code, close_msg),
             on_message=lambda _, msg: self.on_message(msg),
             on_error=lambda _, msg: self.on_error(msg),
-            header={'Authorization': 'Bearer {token}'.format(token=self.token)},
+            on_pong=lambda _, payload: self.on_pong(payload),
+            header=header,
         )
 
         self.websocket.run_forever()
@@ -50,8 +96,31 @@ class BrokerConnection:
         Callback handler for when the connection with the Axini Modeling Platform is opened.
         """
         logging.info('Successfully opened a connection')
+        self._negotiate_compression()
+        self._start_keepalive()
         self.adapter_core.on_open()
 
+    def _negotiate_compression(self):
+        """ Use permessage-deflate on the new connection if AMP accepted it in the handshake. """
+        self.deflate = None
+        if self.compression_threshold is None:
+            return
+
+        sock = self.websocket.sock
+        self.deflate = PerMessageDeflate.from_response(sock.getheaders())
+        if self.deflate is None:
+            logging.info('AMP did not accept permessage-deflate, sending uncompressed')
+            return
+
+        # The connection is open but not read from yet, so nothing is buffered.
+        sock.frame_buffer = DeflateFrameBuffer(sock.frame_buffer.recv, sock.frame_buffer.skip_utf8_validation,
+                                               self.deflate)
+        if not self.deflate.compressing:
+            logging.warning('AMP limited our deflate window to %d bits, which zlib does not support: '
+                            'sending uncompressed', self.deflate.window_bits)
+            return
+        logging.info('Using permessage-deflate for messages of %d bytes or more', self.compression_threshold)
+
     def on_close(self, close_status_code, close_msg):
         """
         Callback handler for when the connection with the Axini Modeling Platform is closed.
@@ -60,10 +129,55 @@ class BrokerConnection:
             close_status_code (int): The status code returned by closing the connection
             close_msg (str): The reason for the connection termination.
         """
-        logging.info('WebSocket connection has been closed with code: {code}, with reason: {reason}'
-                     .format(code=close_status_code, reason=close_msg))
+        logging.info('WebSocket connection has been closed with code: %s, with reason: %s',
+                     close_status_code, close_msg)
+        self._closed.set()
         self.adapter_core.on_close()
 
+    def _start_keepalive(self):
+        self._closed = threading.Event()
+        if self.ping_interval:
+            threading.Thread(target=self._keepalive, args=(self.websocket.sock, self._closed),
+                             name='amp-keepalive', daemon=True).start()
+
+    def _keepalive(self, sock, closed):
+        """ Ping AMP until the connection closes; abort the socket when a pong does not arrive in time. """
+        while not closed.wait(self.ping_interval):
+            self._pong.clear()
+            self._ping_sent = time.perf_counter_ns()
+            try:
+                sock.ping(str(self._ping_sent))
+            except Exception as e:
+                logging.debug('Sending a ping failed: %s', e)
+                return
+
+            if self._pong.wait(self.ping_timeout) or closed.is_set():
+                continue
+
+            logging.warning('No pong from AMP within %.1f seconds, dropping the connection', self.ping_timeout)
+            metrics.increment('amp.dead_links')
+            sock.abort()
+            return
+
+    def on_pong(self, payload):
+        """
+        Callback handler for when a pong is received from the Axini Modeling Platform.
+
+        Args:
+            payload (bytes): The payload of the ping it answers, its send time
+        """
+        try:
+            sent = int(payload)
+        except ValueError:
+            return  # unsolicited pong
+        if sent != self._ping_sent:
+            return  # late pong of an earlier ping
+
+        rtt_ms = (time.perf_counter_ns() - sent) / 1e6
+        metrics.observe('amp.rtt_ms', rtt_ms)
+        metrics.set_gauge('amp.rtt_last_ms', rtt_ms)
+        self._pong.set()
+
     def on_message(self, message):
         """
         Callback handler for when a message is received from the Axini Modeling Platform.
@@ -71,8 +185,9 @@ class BrokerConnection:
         Args:
             message (str): The message that was sent by the Axini Modeling Platform.
         """
-        logging.debug('Received a message: {msg}'.format(msg=message))
-        self.adapter_core.handle_message(message)
+        logging.debug('Received a message: %s', Preview(message))
+        with tracer.span('ws.receive'):
+            self.adapter_core.handle_message(message)
 
     def on_error(self, err):
         """
@@ -81,7 +196,7 @@ class BrokerConnection:
         Args:
             err (str): Error message
         """
-        logging.error('Got a connection error: {error}'.format(error=err))
+        logging.error('Got a connection error: %s', err)
         self.adapter_core.send_error(err)
 
         logging.debug('Closing the connection...')
@@ -96,25 +211,44 @@ class BrokerConnection:
             code (int): The status code (default -1)
         """
         if self.websocket:
-            logging.info('Closing the connection due to: {reason}'.format(reason=reason))
-            logging.info('With error code: {code}'.format(code=code))
+            logging.info('Closing the connection due to: %s', reason)
+            logging.info('With error code: %s', code)
             self.websocket.close()
         else:
             logging.warning('No websocket initialized to close')
 
     def send(self, raw_message):
         """
-        Sends the given message` to the Axini Modeling Platform
+        Sends the given message` to the Axini Modeling Platform, as one binary frame.
 
         Args:
-            raw_message (str): The message to send to the Axini Modeling Platform
+            raw_message (bytes): The message to send to the Axini Modeling Platform
         """
         if not self.websocket:
             logging.warning('No connection to websocket (yet). Is the adapter connected to AMP?')
         else:
             try:
-                logging.debug('Sending out message: {msg}'.format(msg=raw_message))
-                self.websocket.send(raw_message, websocket.ABNF.OPCODE_BINARY)
+                logging.debug('Sending out message: %s', Preview(raw_message))
+                with tracer.span('ws.send'):
+                    self._send_frame(raw_message)
                 logging.debug('Success send')
             except Exception as e:
-                logging.error('Failed sending message, exception: {ex}'.format(ex=e))
+                logging.error('Failed sending message, exception: %s', e)
+
+    def _send_frame(self, raw_message):
+        sock = self.websocket.sock
+        if sock is None:
+            raise websocket.WebSocketConnectionClosedException('Connection is already closed.')
+
+        deflate = self.deflate
+        compress = deflate is not None and deflate.compressing and len(raw_message) >= self.compression_threshold
+        payload = deflate.compress(raw_message) if compress else raw_message
+        # A final, masked frame; RSV1 marks a compressed message.
+        frame = websocket.ABNF(1, int(compress), 0, 0, websocket.ABNF.OPCODE_BINARY, 1, payload)
+        sent = sock.send_frame(frame)
+
+        metrics.increment('amp.frames_sent')
+        metrics.increment('amp.bytes_sent', sent)
+        if compress:
+            metrics.increment('amp.frames_compressed')
+            metrics.increment('amp.bytes_saved', len(raw_message) - len(payload))
@@ -0,0 +1,145 @@
+import threading
+import zlib
+
+from websocket import ABNF
+from websocket._abnf import frame_buffer
+
+EXTENSION = 'permessage-deflate'
+
+# Offered in the handshake; the server picks the window size our messages may use.
+OFFER = EXTENSION + '; client_max_window_bits'
+
+# Ends every compressed message on the wire; stripped when sending, restored when receiving (RFC 7692).
+TAIL = b'\x00\x00\xff\xff'
+
+# zlib can not write raw deflate streams with a smaller window than this (log2).
+MIN_WINDOW_BITS = 9
+
+
+def _parse_extensions(value: str) -> dict:
+    """
+    The parameters of permessage-deflate in a Sec-WebSocket-Extensions header.
+
+    Returns:
+        dict: Parameter name -> value (None for parameters without one), or None if the
+            extension was not accepted
+    """
+    for extension in value.split(','):
+        name, *parameters = [part.strip() for part in extension.split(';')]
+        if name != EXTENSION:
+            continue
+        accepted = {}
+        for parameter in parameters:
+            key, _, argument = parameter.partition('=')
+            accepted[key.strip()] = argument.strip().strip('"') or None
+        return accepted
+    return None
+
+
+class PerMessageDeflate:
+    """
+    The permessage-deflate extension as negotiated with AMP. Outgoing messages are compressed
+    with one raw deflate stream, incoming ones decompressed with another; a stream starts over
+    at every message when the peer asked for no context takeover.
+
+    Attributes:
+        client_no_context_takeover (bool): Whether our stream starts over at every message
+        server_no_context_takeover (bool): Whether the stream of AMP starts over at every message
+        window_bits (int): Window size (log2) of our stream
+    """
+
+    def __init__(self, client_no_context_takeover: bool = False, server_no_context_takeover: bool = False,
+                 window_bits: int = zlib.MAX_WBITS):
+        self.client_no_context_takeover = client_no_context_takeover
+        self.server_no_context_takeover = server_no_context_takeover
+        self.window_bits = window_bits
+        self.compressing = window_bits >= MIN_WINDOW_BITS
+
+        self._lock = threading.Lock()
+        self._compressor = self._new_compressor() if self.compressing else None
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+    @classmethod
+    def from_response(cls, headers: dict):
+        """
+        The extension as accepted in the handshake response.
+
+        Args:
+            headers (dict): Headers of the handshake response, lower case names
+
+        Returns:
+            PerMessageDeflate: The extension, or None if the server did not accept it
+        """
+        accepted = _parse_extensions((headers or {}).get('sec-websocket-extensions', ''))
+        if accepted is None:
+            return None
+
+        window_bits = int(accepted.get('client_max_window_bits') or zlib.MAX_WBITS)
+        if not 8 <= window_bits <= zlib.MAX_WBITS:
+            raise ValueError('Invalid client_max_window_bits: {bits}'.format(bits=window_bits))
+        return cls('client_no_context_takeover' in accepted, 'server_no_context_takeover' in accepted, window_bits)
+
+    def _new_compressor(self):
+        return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -self.window_bits)
+
+    def compress(self, data) -> bytes:
+        """ Compress a message, without the trailing TAIL. """
+        with self._lock:
+            compressed = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            if self.client_no_context_takeover:
+                self._compressor = self._new_compressor()
+        return compressed[:-len(TAIL)]
+
+    def decompress(self, data: bytes, fin: bool) -> bytes:
+        """ Decompress the next fragment of an incoming message. """
+        if fin:
+            data += TAIL
+        decompressed = self._decompressor.decompress(data)
+        if fin and self.server_no_context_takeover:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return decompressed
+
+
+class DeflateFrameBuffer(frame_buffer):
+    """
+    Reads frames like the frame buffer of websocket-client, which rejects the RSV1 bit of
+    compressed messages, and decompresses the frames of those messages before validating them.
+    Fragments are decompressed as they arrive, so websocket-client reassembles plain data.
+    """
+
+    def __init__(self, recv_fn, skip_utf8_validation: bool, deflate: PerMessageDeflate):
+        super().__init__(recv_fn, skip_utf8_validation)
+        self.deflate = deflate
+        self._compressed = False  # whether the message being received is compressed
+
+    def recv_frame(self) -> ABNF:
+        with self.lock:
+            if self.has_received_header():
+                self.recv_header()
+            (fin, rsv1, rsv2, rsv3, opcode, has_mask, _) = self.header
+
+            if self.has_received_length():
+                self.recv_length()
+            length = self.length
+
+            if self.has_received_mask():
+                self.recv_mask()
+            mask_value = self.mask_value
+
+            payload = self.recv_strict(length)
+            if has_mask:
+                payload = ABNF.mask(mask_value, payload)
+
+            self.clear()
+
+            # RSV1 is only set on the first frame of a compressed message.
+            if opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY):
+                self._compressed = bool(rsv1)
+                rsv1 = 0
+            if self._compressed and opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY, ABNF.OPCODE_CONT):
+                payload = self.deflate.decompress(payload, bool(fin))
+
+            frame = ABNF(fin, rsv1, rsv2, rsv3, opcode, has_mask, payload)
+            frame.validate(self.skip_utf8_validation)
+
+        return frame
@@ -64,6 +64,17 @@ class Handler(ABC):
         """
         pass
 
+    def stimulus_key(self, pb_label: label_pb2.Label):
+        """
+        The key of a stimulus when the adapter performs stimuli in parallel: stimuli with the
+        same key are performed in order, stimuli with different keys may run concurrently.
+        Defaults to the channel of the label.
+
+        Args:
+            pb_label (label_pb2.Label): stimulus that the Axini Modeling Platform has sent
+        """
+        return pb_label.channel
+
     @abstractmethod
     def supported_labels(self) -> List[Label]:
         """
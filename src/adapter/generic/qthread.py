@@ -1,41 +1,135 @@
+import itertools
 import logging
+import time
 
-from queue import Queue
+from queue import Empty, Queue, PriorityQueue
 from threading import Thread
 
+from generic.util.tracing import tracer
+
 class QThread:
     """
     Class that manages a thread which processes items in a queue.
     Items can be added to the queue, and the queue can be emptied.
+
+    In priority mode the queue is a `PriorityQueue`: items with a lower
+    priority value are processed first, items with equal priority keep
+    their FIFO order.
+
+    When tracing is enabled, the time an item waits in the queue and the time
+    it takes to process it are recorded as '<trace_name>.wait' and
+    '<trace_name>.process' spans.
     """
 
-    def __init__(self, process_item):
+    # Priority lanes for a QThread in priority mode.
+    PRIORITY_CONTROL = 0
+    PRIORITY_NORMAL = 1
+
+    def __init__(self, process_item, priority=False, trace_name='qthread', trace_key=None):
         """
         Constructor.
         Args:
             process_item(item): method which is called for an item
                                 retrieved from the queue by the _worker
+            priority (bool): process items by priority lane instead of plain FIFO
+            trace_name (str): prefix of the spans recorded for this queue
+            trace_key(item): method which returns the correlation id of an item for its spans
         """
         self.process_item = process_item
-        self.queue = Queue()
-        self.thread = Thread(target = self._worker)
+        self.priority = priority
+        self.trace_name = trace_name
+        self.trace_key = trace_key
+        self.queue = PriorityQueue() if priority else Queue()
+        self.thread = Thread(target = self._worker, name = trace_name, daemon = True)
+
+        # Tie-breaker which keeps the FIFO order within a priority lane.
+        self._sequence = itertools.count()
 
     def start(self):
         self.thread.start()
 
-    def put(self, item):
-        logging.debug('Adding item to the queue ({id})'.format(id=id(item)))
-        self.queue.put(item)
+    def put(self, item, priority=PRIORITY_NORMAL):
+        logging.debug('Adding item to the queue (%s)', id(item))
+        if self.priority:
+            self.queue.put((priority, next(self._sequence), time.perf_counter_ns(), item))
+        else:
+            self.queue.put((time.perf_counter_ns(), item))
 
-    def clear_queue(self):
-        while not self.queue.empty():
-            item = self.queue.get()
-            logging.debug('Removing item from queue ({id})'.format(id=id(item)))
+    def clear_queue(self, drop=None):
+        """
+        Remove the pending items from the queue.
+        Args:
+            drop(item): method which returns whether an item should be removed; all items are removed if None
+        """
+        kept = []
+        while True:
+            try:
+                entry = self.queue.get_nowait()
+            except Empty:
+                break
+            item = entry[-1]
+            if drop is None or drop(item):
+                logging.debug('Removing item from queue (%s)', id(item))
+            else:
+                kept.append(entry)
             self.queue.task_done()
 
+        # Put back as they were, so they keep their lane and order.
+        for entry in kept:
+            self.queue.put(entry)
+
     def _worker(self):
         while True:
-            item = self.queue.get()
-            logging.debug('Processing item from queue ({id})'.format(id=id(item)))
+            *_, put_ns, item = self.queue.get()
+            logging.debug('Processing item from queue (%s)', id(item))
+
+            start_ns = time.perf_counter_ns()
             self.process_item(item)
+
+            if tracer.enabled:
+                correlation_id = self.trace_key(item) if self.trace_key else 0
+                tracer.record(self.trace_name + '.wait', correlation_id, put_ns, start_ns)
+                tracer.record(self.trace_name + '.process', correlation_id, start_ns, time.perf_counter_ns())
+
             self.queue.task_done()
+
+
+class KeyedQThread:
+    """
+    Class that manages a pool of QThreads which process keyed items.
+    An item is put with a key (e.g. a channel, session token or username). Items
+    with the same key are always handled by the same worker, so they are processed
+    strictly in the order they were put. Items with different keys may be
+    processed in parallel.
+    """
+
+    def __init__(self, process_item, workers=4):
+        """
+        Constructor.
+        Args:
+            process_item(item): method which is called for an item
+                                retrieved from the queue by one of the workers
+            workers (int): number of worker threads
+        """
+        if workers < 1:
+            raise ValueError('workers should be at least 1')
+
+        self.process_item = process_item
+        self.qthreads = [QThread(process_item = process_item, trace_name = 'keyed-qthread-{}'.format(i))
+                         for i in range(workers)]
+
+    def start(self):
+        for qthread in self.qthreads:
+            qthread.start()
+
+    def put(self, key, item):
+        self.qthreads[hash(key) % len(self.qthreads)].put(item)
+
+    def clear_queue(self, drop=None):
+        for qthread in self.qthreads:
+            qthread.clear_queue(drop)
+
+    def join(self):
+        """ Wait until every item put so far has been processed. """
+        for qthread in self.qthreads:
+            qthread.queue.join()
@@ -0,0 +1,104 @@
+import atexit
+import json
+import logging
+
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+TEXT_FORMAT = '%(asctime)s-[%(levelname)8s] %(name)s::%(module)s|%(lineno)s:: %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Maximum number of bytes/characters of a payload shown in a log message.
+PREVIEW_LENGTH = 64
+
+
+class Preview:
+    """
+    Lazy, truncated preview of a (raw) payload for log messages.
+    The payload is only rendered when the log record is actually formatted,
+    so passing a Preview to a suppressed debug call costs next to nothing.
+
+    Attributes:
+        payload (bytes | str | object): The payload to preview
+        limit (int): Maximum number of bytes/characters shown
+    """
+    __slots__ = ('payload', 'limit')
+
+    def __init__(self, payload, limit: int = PREVIEW_LENGTH):
+        self.payload = payload
+        self.limit = limit
+
+    def __str__(self):
+        payload = self.payload
+        if not isinstance(payload, (bytes, bytearray, str)):
+            payload = str(payload)
+
+        if len(payload) <= self.limit:
+            return repr(payload) if isinstance(payload, (bytes, bytearray)) else payload
+
+        head = payload[:self.limit]
+        head = repr(bytes(head)) if isinstance(head, (bytes, bytearray)) else head
+        return '{head}... ({size} total)'.format(head=head, size=len(payload))
+
+
+class JsonFormatter(logging.Formatter):
+    """ Formats log records as structured JSON lines. """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'module': record.module,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves the formatting of the record to the QueueListener.
+    The standard QueueHandler formats the message on the logging thread; this one only
+    enqueues the record, so the hot threads never pay for formatting.
+    Arguments passed to a log call must therefore not be mutated afterwards.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(loglevel, structured: bool = False) -> QueueListener:
+    """
+    Configure the root logger to write log records on a background thread.
+
+    Args:
+        loglevel (int | str): Loglevel constant or name
+        structured (bool): Emit JSON lines instead of plain text
+
+    Returns:
+        QueueListener: The started listener, it is stopped (and flushed) at exit
+    """
+    stream_handler = logging.StreamHandler()
+    if structured:
+        stream_handler.setFormatter(JsonFormatter(datefmt=DATE_FORMAT))
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT))
+
+    log_queue = SimpleQueue()
+    listener = QueueListener(log_queue, stream_handler)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.setLevel(loglevel)
+
+    listener.start()
+    atexit.register(listener.stop)
+
+    return listener
@@ -0,0 +1,121 @@
+import logging
+import os
+import sys
+import tracemalloc
+
+from generic.util.metrics import metrics
+
+# Number of allocation sites reported per test case.
+TOP_ALLOCATION_SITES = 10
+
+# Growth (in bytes) of traced memory per test case above which an alert is raised.
+DEFAULT_ALERT_THRESHOLD = 1024 * 1024
+
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def current_rss() -> int:
+    """ The resident set size of this process in bytes, or None without procfs (e.g. on macOS and Windows). """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss() -> int:
+    """ The peak resident set size of this process in bytes, or None where it is unknown (Windows). """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, in KiB elsewhere.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MemoryTracker:
+    """
+    Tracks the memory growth of the adapter over a long AMP session.
+    At every RESET boundary a tracemalloc snapshot is taken and compared with the previous
+    one. The top allocation sites and the RSS trend are logged and published as metrics, and
+    an alert is raised when the memory grew more than `alert_threshold` bytes in a test case.
+
+    Attributes:
+        enabled (bool): Whether memory is tracked
+        alert_threshold (int): Growth in bytes per test case that raises an alert
+    """
+
+    def __init__(self, alert_threshold: int = DEFAULT_ALERT_THRESHOLD):
+        self.enabled = False
+        self.alert_threshold = alert_threshold
+        self._snapshot = None
+        self._initial_rss = None
+        self._test_case = 0
+
+    def enable(self, alert_threshold: int = None, frames: int = 1):
+        """
+        Start tracing memory allocations.
+
+        Args:
+            alert_threshold (int): Growth in bytes per test case that raises an alert
+            frames (int): Number of frames stored per allocation site
+        """
+        if alert_threshold is not None:
+            self.alert_threshold = alert_threshold
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        self._initial_rss = current_rss()
+        self.enabled = True
+        logging.info('Memory tracking enabled, alert threshold %d bytes per test case', self.alert_threshold)
+
+    def checkpoint(self):
+        """ Snapshot the memory at a RESET boundary and report the growth since the previous one. """
+        if not self.enabled:
+            return
+
+        self._test_case += 1
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        differences = snapshot.compare_to(self._snapshot, 'lineno')
+        self._snapshot = snapshot
+
+        growth = sum(difference.size_diff for difference in differences)
+        traced, _ = tracemalloc.get_traced_memory()
+        rss = current_rss()
+
+        metrics.set_gauge('memory.traced_bytes', traced)
+        metrics.observe('memory.growth_per_test_case_bytes', growth)
+        peak = peak_rss()
+        if peak is not None:
+            metrics.set_gauge('memory.peak_rss_bytes', peak)
+
+        if rss is not None and self._initial_rss is not None:
+            metrics.set_gauge('memory.rss_bytes', rss)
+            metrics.set_gauge('memory.rss_growth_bytes', rss - self._initial_rss)
+            logging.info('Memory after test case %d: %+d bytes traced (%d total), RSS %d bytes (%+d since start)',
+                         self._test_case, growth, traced, rss, rss - self._initial_rss)
+        else:
+            logging.info('Memory after test case %d: %+d bytes traced (%d total), peak RSS %s bytes',
+                         self._test_case, growth, traced, peak)
+        for difference in differences[:TOP_ALLOCATION_SITES]:
+            if difference.size_diff:
+                logging.debug('  %s', difference)
+
+        if growth > self.alert_threshold:
+            metrics.increment('memory.alerts')
+            logging.warning('Memory grew %d bytes during test case %d, more than the threshold of %d bytes. '
+                            'Top allocation sites:', growth, self._test_case, self.alert_threshold)
+            for difference in differences[:TOP_ALLOCATION_SITES]:
+                logging.warning('  %s', difference)
+
+
+# The memory tracker of the adapter; disabled until enabled explicitly.
+memory_tracker = MemoryTracker()
@@ -0,0 +1,87 @@
+import json
+import threading
+
+from collections import Counter, deque
+
+# Number of observations kept per histogram.
+DEFAULT_WINDOW = 1000
+
+
+def _percentile(ordered: list, fraction: float):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Metrics:
+    """
+    Thread safe registry of the metrics of the adapter: gauges (last value),
+    counters and histograms over a rolling window of observations.
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._gauges = {}
+        self._counters = Counter()
+        self._histograms = {}
+
+    def set_gauge(self, name: str, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = deque(maxlen=self.window)
+            histogram.append(value)
+
+    def values(self, name: str) -> list:
+        """ The observations of a histogram in the rolling window, oldest first. """
+        with self._lock:
+            return list(self._histograms.get(name, ()))
+
+    def summary(self, name: str) -> dict:
+        """
+        Summarize a histogram.
+
+        Returns:
+            dict: count, min, p50, p95, p99 and max of the rolling window, or None if there are no observations
+        """
+        ordered = sorted(self.values(name))
+        if not ordered:
+            return None
+
+        return {
+            'count': len(ordered),
+            'min': ordered[0],
+            'p50': _percentile(ordered, 0.50),
+            'p95': _percentile(ordered, 0.95),
+            'p99': _percentile(ordered, 0.99),
+            'max': ordered[-1],
+        }
+
+    def snapshot(self) -> dict:
+        """ All metrics as a JSON serializable dictionary. """
+        with self._lock:
+            gauges = dict(self._gauges)
+            counters = dict(self._counters)
+            names = list(self._histograms)
+
+        return {
+            'gauges': gauges,
+            'counters': counters,
+            'histograms': {name: self.summary(name) for name in names},
+        }
+
+    def export(self, path: str):
+        """ Write a snapshot of all metrics as JSON to the given file. """
+        with open(path, 'w') as metrics_file:
+            json.dump(self.snapshot(), metrics_file, indent=2)
+
+
+# The metrics registry shared by all components of the adapter.
+metrics = Metrics()
@@ -0,0 +1,136 @@
+import logging
+import os
+import sys
+import threading
+import time
+
+from collections import Counter
+
+# Seconds between two samples of the thread stacks.
+DEFAULT_INTERVAL = 0.005
+
+# Modules whose functions are listed in the per test case summary.
+DEFAULT_HOT_MODULES = ('adapter_core', 'parameter', 'mock_client')
+
+# Number of functions listed in the per test case summary.
+SUMMARY_SIZE = 10
+
+
+def _frame_key(code):
+    return code.co_name, code.co_filename, code.co_firstlineno
+
+
+class SamplingProfiler:
+    """
+    Low overhead sampling profiler for all threads of the adapter.
+    A background thread periodically samples the stacks of the other threads while a
+    test case is running. At the end of every test case the samples are written as
+    folded stacks (one file per test case, usable by flamegraph tools) and the hottest
+    functions of the `hot_modules` are logged.
+
+    Attributes:
+        directory (str): Directory the profiles are written to
+        interval (float): Seconds between two samples
+        hot_modules (tuple): Names of the modules listed in the summary
+        enabled (bool): Whether test cases are profiled
+    """
+
+    def __init__(self, directory: str = 'profiles', interval: float = DEFAULT_INTERVAL,
+                 hot_modules: tuple = DEFAULT_HOT_MODULES):
+        self.directory = directory
+        self.interval = interval
+        self.hot_modules = hot_modules
+        self.enabled = False
+
+        self._lock = threading.Lock()
+        self._active = False
+        self._test_case = 0
+        self._samples = 0
+        self._stacks = Counter()
+        self._functions = Counter()
+        self._thread = None
+
+    def enable(self, enabled: bool = True):
+        """ Enable or disable profiling; takes effect at the next test case. """
+        self.enabled = enabled
+        logging.info('Profiling %s', 'enabled' if enabled else 'disabled')
+
+        if enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._sampler, name='profiler', daemon=True)
+            self._thread.start()
+
+    def toggle(self):
+        self.enable(not self.enabled)
+
+    def start_test_case(self):
+        """ Start profiling a new test case. """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._test_case += 1
+            self._samples = 0
+            self._stacks.clear()
+            self._functions.clear()
+            self._active = True
+
+    def end_test_case(self):
+        """ Stop profiling the current test case and write its profile. """
+        with self._lock:
+            if not self._active:
+                return
+            self._active = False
+            test_case, samples = self._test_case, self._samples
+            stacks, functions = self._stacks.copy(), self._functions.copy()
+
+        if not samples:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, 'testcase-{:05d}.folded'.format(test_case))
+        with open(path, 'w') as profile_file:
+            for stack, count in stacks.most_common():
+                profile_file.write('{} {}\n'.format(stack, count))
+
+        hottest = [(key, count) for key, count in functions.most_common()
+                   if os.path.splitext(os.path.basename(key[1]))[0] in self.hot_modules][:SUMMARY_SIZE]
+
+        logging.info('Profile of test case %d written to %s (%d samples)', test_case, path, samples)
+        for (name, filename, lineno), count in hottest:
+            logging.info('  %5.1f%% %s (%s:%d)', 100.0 * count / samples,
+                         name, os.path.basename(filename), lineno)
+
+    def _sampler(self):
+        own_ident = threading.get_ident()
+
+        while True:
+            time.sleep(self.interval)
+            if not self._active:
+                continue
+
+            frames = sys._current_frames()
+            with self._lock:
+                if not self._active:
+                    continue
+
+                for ident, frame in frames.items():
+                    if ident == own_ident:
+                        continue
+
+                    stack = []
+                    seen = set()
+                    while frame is not None:
+                        key = _frame_key(frame.f_code)
+                        stack.append('{}:{}'.format(os.path.basename(key[1]), key[0]))
+                        # Count every function once per sample (inclusive time).
+                        if key not in seen:
+                            seen.add(key)
+                            self._functions[key] += 1
+                        frame = frame.f_back
+
+                    self._stacks[';'.join(reversed(stack))] += 1
+                self._samples += 1
+
+
+# The profiler shared by all components of the adapter; disabled until enabled explicitly.
+profiler = SamplingProfiler()
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+NANOSECONDS_PER_SECOND = 1_000_000_000
+NANOSECONDS_PER_MICROSECOND = 1_000
+
+
+def datetime_to_ns(value: datetime) -> int:
+    """
+    Convert a datetime to integer nanoseconds since the Unix epoch, without going through a float.
+
+    Args:
+        value (datetime): The datetime; naive datetimes are interpreted as local time
+
+    Returns:
+        int: Nanoseconds since the Unix epoch
+    """
+    seconds = int(value.replace(microsecond=0).timestamp())
+    return seconds * NANOSECONDS_PER_SECOND + value.microsecond * NANOSECONDS_PER_MICROSECOND
+
+
+def ns_to_datetime(ns: int) -> datetime:
+    """
+    Convert integer nanoseconds since the Unix epoch to a (naive, local time) datetime.
+    The datetime has microsecond resolution, so the sub-microsecond part is truncated.
+
+    Args:
+        ns (int): Nanoseconds since the Unix epoch
+
+    Returns:
+        datetime
+    """
+    seconds, remainder = divmod(ns, NANOSECONDS_PER_SECOND)
+    return datetime.fromtimestamp(seconds).replace(microsecond=remainder // NANOSECONDS_PER_MICROSECOND)
@@ -0,0 +1,125 @@
+import itertools
+import json
+import os
+import threading
+import time
+
+# Number of spans kept by default; the oldest spans are overwritten first.
+DEFAULT_CAPACITY = 1 << 16
+
+
+class _Span:
+    """ Context manager recording a single span on exit. """
+    __slots__ = ('tracer', 'name', 'correlation_id', 'start_ns')
+
+    def __init__(self, tracer, name: str, correlation_id: int):
+        self.tracer = tracer
+        self.name = name
+        self.correlation_id = correlation_id
+        self.start_ns = 0
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.record(self.name, self.correlation_id, self.start_ns, time.perf_counter_ns())
+        return False
+
+
+class _NullSpan:
+    """ Span returned while tracing is disabled; does nothing. """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Records timing spans of the adapter, keyed by the correlation id of the label they belong to.
+    Spans are measured with `time.perf_counter_ns` and stored in a preallocated ring buffer,
+    so recording a span does not grow memory. The buffer is exported in bulk as a
+    Chrome trace (viewable in chrome://tracing or Perfetto).
+
+    Attributes:
+        enabled (bool): Whether spans are recorded
+        capacity (int): Maximum number of spans kept
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.enabled = False
+        self.capacity = capacity
+        self._spans = [None] * capacity
+        self._index = itertools.count()
+
+    def enable(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def span(self, name: str, correlation_id: int = 0):
+        """
+        Context manager which records the duration of its body as a span.
+
+        Args:
+            name (str): Name of the span, e.g. 'sut.request'
+            correlation_id (int): Correlation id of the label the span belongs to (0 if unknown)
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, correlation_id)
+
+    def record(self, name: str, correlation_id: int, start_ns: int, end_ns: int):
+        """
+        Record a span measured by the caller.
+
+        Args:
+            name (str): Name of the span
+            correlation_id (int): Correlation id of the label the span belongs to (0 if unknown)
+            start_ns (int): Start of the span, from `time.perf_counter_ns`
+            end_ns (int): End of the span, from `time.perf_counter_ns`
+        """
+        if self.enabled:
+            self._spans[next(self._index) % self.capacity] = \
+                (name, correlation_id, start_ns, end_ns, threading.get_ident())
+
+    def spans(self) -> list:
+        """ The recorded spans as (name, correlation_id, start_ns, end_ns, thread_id), ordered by start. """
+        return sorted((span for span in self._spans if span is not None), key=lambda span: span[2])
+
+    def export(self, path: str):
+        """
+        Write the recorded spans to a Chrome trace file.
+
+        Args:
+            path (str): File to write the trace to
+        """
+        pid = os.getpid()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        events = [{
+            'name': name,
+            'cat': name.split('.', 1)[0],
+            'ph': 'X',
+            'ts': start_ns / 1e3,
+            'dur': (end_ns - start_ns) / 1e3,
+            'pid': pid,
+            'tid': tid,
+            'args': {'correlation_id': correlation_id},
+        } for name, correlation_id, start_ns, end_ns, tid in self.spans()]
+
+        events.extend({
+            'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name},
+        } for tid, thread_name in thread_names.items())
+
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+
+
+# The tracer shared by all components of the adapter; disabled until enabled explicitly.
+tracer = Tracer()
@@ -0,0 +1,99 @@
+import argparse
+import json
+import time
+import tracemalloc
+
+from generic.api.label import Label, Sort
+from generic.api.parameter import Parameter, _determine_type_from_value
+from generic.api.type import Type
+
+### benchmark of the label DTOs: construction time and bytes allocated per response label,
+### slotted with interned names against dict-backed objects as before, with and without validation
+### usage: python label_benchmark.py --labels 100000
+
+
+class DictParameter:
+    """ Parameter as it was before: dict-backed and always validated. """
+
+    def __init__(self, name, tipe, value=None):
+        if not name:
+            raise ValueError('name must not be empty')
+        if not isinstance(tipe, Type):
+            raise ValueError('tipe must be of enum Type')
+        if value and tipe != _determine_type_from_value(value):
+            raise ValueError("value must be of same type as the given 'tipe'")
+        self.name = name
+        self.tipe = tipe
+        self.value = value
+
+
+class DictLabel:
+    """ Label as it was before: dict-backed, with new name and channel strings. """
+
+    def __init__(self, sort, name, channel, parameters=None, timestamp=None, physical_label=None, correlation_id=0):
+        if not isinstance(sort, Sort):
+            raise ValueError('sort should be of the enumeration Sort')
+        self.sort = sort
+        self.name = name
+        self.channel = channel
+        self.parameters = parameters or []
+        self.timestamp = timestamp
+        self.physical_label = physical_label
+        self.correlation_id = correlation_id
+
+
+def make_dict(index: int):
+    # Names built at runtime, like the response names of the handler.
+    return DictLabel(Sort.RESPONSE, ''.join(('message_', 'received')), ''.join(('syn', 'apse')),
+                     [DictParameter(''.join(('room', '_id')), Type.STRING, '!room:my.matrix.host'),
+                      DictParameter(''.join(('mess', 'age')), Type.STRING, 'hello')], index)
+
+
+def make_slotted(index: int, validate: bool):
+    return Label(Sort.RESPONSE, ''.join(('message_', 'received')), ''.join(('syn', 'apse')),
+                 [Parameter(''.join(('room', '_id')), Type.STRING, '!room:my.matrix.host', validate=validate),
+                  Parameter(''.join(('mess', 'age')), Type.STRING, 'hello', validate=validate)], index)
+
+
+VARIANTS = {
+    'dict': make_dict,
+    'slotted': lambda index: make_slotted(index, True),
+    'slotted, no validation': lambda index: make_slotted(index, False),
+}
+
+
+def run(variant: str, labels: int) -> dict:
+    make = VARIANTS[variant]
+
+    start = time.perf_counter()
+    for index in range(labels):
+        make(index)
+    duration = time.perf_counter() - start
+
+    # Bytes kept alive per label, with the labels held like a window of responses.
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    kept = [make(index) for index in range(labels)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+
+    return {'variant': variant, 'labels': labels, 'construct_us_per_label': duration / labels * 1e6,
+            'bytes_per_label': (after - before) / labels}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the label DTOs')
+    parser.add_argument('-n', '--labels', type=int, default=100000, help='labels per run (default: 100000)')
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    for variant in VARIANTS:
+        result = run(variant, args.labels)
+        results.append(result)
+        print('{variant:24} {construct_us_per_label:6.2f} us, {bytes_per_label:6.1f} bytes per label'.format(**result))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
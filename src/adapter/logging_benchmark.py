@@ -0,0 +1,84 @@
+import argparse
+import atexit
+import json
+import logging
+import os
+import time
+
+from generic.util.logging_util import DATE_FORMAT, TEXT_FORMAT, Preview, setup_logging
+
+### benchmark of logging on the hot path: time per message spent on the sending thread, with
+### eager formatting and a synchronous handler against lazy arguments and the background writer
+### of setup_logging, at INFO and DEBUG
+### usage: python logging_benchmark.py --messages 20000 --payload 4096
+
+
+def eager(payload: bytes):
+    """ As the hot path logged before: messages formatted up front, whatever the level. """
+    logging.debug('Adding item to the queue ({id})'.format(id=id(payload)))
+    logging.debug('Sending out message: {message}'.format(message=payload))
+    logging.info('Sending response to AMP: !{label}'.format(label='message_received'))
+
+
+def deferred(payload: bytes):
+    """ As the hot path logs now: lazy arguments and a truncated preview of the payload. """
+    logging.debug('Adding item to the queue (%s)', id(payload))
+    logging.debug('Sending out message: %s', Preview(payload))
+    logging.info('Sending response to AMP: !%s', 'message_received')
+
+
+def configure(mode: str, level: int, sink):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    if mode == 'eager':
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(level)
+        return None
+
+    listener = setup_logging(level)
+    listener.handlers[0].setStream(sink)
+    return listener
+
+
+def run(mode: str, level: int, messages: int, payload: bytes, sink) -> dict:
+    listener = configure(mode, level, sink)
+    log = eager if mode == 'eager' else deferred
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        log(payload)
+    hot = time.perf_counter() - start
+
+    if listener:
+        listener.stop()  # flushes the queue
+        atexit.unregister(listener.stop)
+    total = time.perf_counter() - start
+
+    return {'mode': mode, 'level': logging.getLevelName(level), 'messages': messages,
+            'hot_us_per_message': hot / messages * 1e6, 'total_us_per_message': total / messages * 1e6}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark eager against deferred logging')
+    parser.add_argument('-m', '--messages', type=int, default=20000, help='messages per run (default: 20000)')
+    parser.add_argument('-p', '--payload', type=int, default=4096, help='payload size in bytes (default: 4096)')
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    payload = os.urandom(args.payload)
+    results = []
+    with open(os.devnull, 'w') as sink:
+        for level in (logging.INFO, logging.DEBUG):
+            for mode in ('eager', 'deferred'):
+                result = run(mode, level, args.messages, payload, sink)
+                results.append(result)
+                print('{level:5} {mode:8} {hot_us_per_message:7.2f} us on the hot thread, '
+                      '{total_us_per_message:7.2f} us until written per message'.format(**result))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,32 @@
+from matrix.backends.backend import Backend, TRANSPORTS, DEFAULT_SOCKET_DIRECTORY
+from matrix.backends.docker_engine import DockerEngineBackend
+from matrix.backends.fake import FakeBackend
+from matrix.backends.federation import FederationBackend, FederationOrchestrator, DEFAULT_SERVERS
+from matrix.backends.script import ScriptBackend
+
+# Name of the backend (configuration item `backend`) -> Backend class
+BACKENDS = {
+    'script': ScriptBackend,
+    'docker': DockerEngineBackend,
+    'fake': FakeBackend,
+    'federation': FederationBackend,
+}
+
+
+def create_backend(name: str, port: int, **kwargs) -> Backend:
+    """
+    Create the lifecycle backend with the given name.
+
+    Args:
+        name (str): 'script', 'docker', 'fake' or 'federation'
+        port (int): Port the homeserver is reachable on
+        **kwargs: transport, socket_directory and shared_secret, see Backend, and the
+            backend specific arguments, e.g. servers of FederationBackend
+
+    Returns:
+        Backend
+    """
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise ValueError('Unsupported backend: {name}'.format(name=name))
+    return backend(port, **kwargs)
@@ -0,0 +1,108 @@
+import logging
+import os
+import time
+
+from abc import ABC, abstractmethod
+
+from ttAssignment1 import new_connection, use_unix_socket
+
+# Transports between the adapter and Synapse
+TRANSPORTS = ('tcp', 'uds', 'host')
+
+DEFAULT_SOCKET_DIRECTORY = '/tmp/synapse-sockets'
+
+# Seconds to wait for a (re)started homeserver to answer.
+HEALTH_TIMEOUT = 15
+
+# Seconds between two health probes while waiting.
+HEALTH_INTERVAL = 0.5
+
+
+class Backend(ABC):
+    """
+    Lifecycle of the Synapse homeserver under test. This class needs to be extended by a
+    backend specific implementation.
+
+    Attributes:
+        port (int): Port the homeserver is reachable on
+        transport (str): 'tcp' (published port), 'uds' (UNIX socket) or 'host' (host networking)
+        socket_directory (str): Host directory of the UNIX socket when the transport is uds
+        shared_secret (str): registration_shared_secret of the homeserver, or None
+    """
+
+    # The transports supported by the backend.
+    transports = TRANSPORTS
+
+    def __init__(self, port: int, transport: str = 'tcp', socket_directory: str = DEFAULT_SOCKET_DIRECTORY,
+                 shared_secret: str = None):
+        if transport not in self.transports:
+            raise ValueError('Transport {transport} is not supported by the {backend} backend'
+                             .format(transport=transport, backend=type(self).__name__))
+
+        self.port = port
+        self.transport = transport
+        self.socket_directory = socket_directory
+        self.shared_secret = shared_secret or None
+
+    @property
+    def socket_path(self) -> str:
+        """ The UNIX socket of the homeserver, or None if the transport is not uds. """
+        if self.transport != 'uds':
+            return None
+        return os.path.join(self.socket_directory, 'synapse1', 'synapse.sock')
+
+    @abstractmethod
+    def provision(self):
+        """
+        Create and start a homeserver with an empty database.
+        """
+        pass
+
+    @abstractmethod
+    def reset(self):
+        """
+        Replace the homeserver by one with an empty database.
+        """
+        pass
+
+    @abstractmethod
+    def teardown(self):
+        """
+        Stop the homeserver and remove its data.
+        """
+        pass
+
+    def health(self) -> bool:
+        """
+        Whether the homeserver answers requests.
+
+        Returns:
+            bool: True if the client API versions endpoint responds with 200
+        """
+        try:
+            conn = new_connection(self.port, timeout=2)
+            try:
+                conn.request('GET', '/_matrix/client/versions')
+                return conn.getresponse().status == 200
+            finally:
+                conn.close()
+        except OSError:
+            return False
+
+    def wait_healthy(self, timeout: float = HEALTH_TIMEOUT):
+        """
+        Wait until the homeserver answers requests.
+
+        Raises:
+            RuntimeError: If it did not within `timeout` seconds
+        """
+        deadline = time.monotonic() + timeout
+        while not self.health():
+            if time.monotonic() > deadline:
+                raise RuntimeError('Synapse timeout')
+            time.sleep(HEALTH_INTERVAL)
+
+    def _use_transport(self):
+        """ Send the requests of the mock client to the homeserver over the transport of this backend. """
+        use_unix_socket(self.port, self.socket_path)
+        logging.debug('Synapse on port %d reached over %s', self.port, self.transport)
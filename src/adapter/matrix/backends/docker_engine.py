@@ -0,0 +1,344 @@
+import json
+import logging
+import os
+
+from urllib.parse import quote
+
+from ttAssignment1 import UnixHTTPConnection
+
+from matrix.backends.backend import Backend
+
+DOCKER_SOCKET = '/var/run/docker.sock'
+DOCKER_API = '/v1.41'
+
+SYNAPSE_IMAGE = 'matrixdotorg/synapse:v1.138.0'
+OPENSSL_IMAGE = 'alpine/openssl:latest'
+
+# Names of the homeserver with the given id, as in setup_homeserver.sh.
+SERVER_NAME = 'my.matrix.host{id}'
+CONTAINER_NAME = 'synapse{id}'
+VOLUME_NAME = 'synapse{id}-data'
+
+# Appended to the generated homeserver.yaml, as in setup_homeserver.sh.
+HOMESERVER_CONFIG = '''
+enable_registration: true
+enable_registration_without_verification: true
+
+rc_login:
+  address:
+    per_second: 1000
+    burst_count: 1000
+  account:
+    per_second: 1000
+    burst_count: 1000
+  failed_attempts:
+    per_second: 1000
+    burst_count: 1000
+
+rc_message:
+  per_second: 1000
+  burst_count: 1000
+rc_registration:
+  per_second: 1000
+  burst_count: 1000
+'''
+
+# Listeners replacing the generated ones when the transport is uds or the server federates.
+TCP_LISTENER = '''
+  - port: 8008
+    tls: false
+    type: http
+    x_forwarded: true
+    resources:
+      - names: [client, federation]
+        compress: false
+'''
+UDS_LISTENER = '''
+  - path: /sockets/synapse.sock
+    mode: 0666
+    type: http
+    resources:
+      - names: [client]
+        compress: false
+'''
+FEDERATION_LISTENER = '''
+  - port: 8448
+    tls: true
+    type: http
+    resources:
+      - names: [federation]
+'''
+
+# Federation with the other servers on the Docker network, over TLS with self-signed certificates.
+FEDERATION_CONFIG = '''
+tls_certificate_path: /data/tls.crt
+tls_private_key_path: /data/tls.key
+federation_verify_certificates: false
+federation_domain_whitelist: [{peers}]
+trusted_key_servers: []
+suppress_key_server_warning: true
+ip_range_blocklist: []
+'''
+
+# Generates the self-signed certificate of $NAME, readable by the Synapse user.
+GENERATE_CERTIFICATE = 'openssl req -x509 -newkey rsa:2048 -nodes -days 365 -subj "/CN=$NAME" ' \
+                       '-keyout /data/tls.key -out /data/tls.crt && chmod 644 /data/tls.key /data/tls.crt'
+
+# Replaces the generated listeners block of homeserver.yaml in place by `listeners:` and $LISTENERS,
+# run by the Python of the Synapse image: appending a second listeners key relies on the last
+# duplicate key winning, which strict YAML loaders reject.
+REPLACE_LISTENERS = '''
+import os, re
+path = "/data/homeserver.yaml"
+with open(path) as file:
+    config = file.read()
+listeners = "listeners:" + os.environ["LISTENERS"] + "\\n"
+config, count = re.subn(r"^listeners:\\n(?:[ \\t]+.*\\n|\\n)*", lambda match: listeners, config, count=1, flags=re.M)
+if count != 1:
+    raise SystemExit("No listeners in " + path)
+with open(path, "w") as file:
+    file.write(config)
+'''
+
+# Sets the registration secret to $SECRET.
+SET_SHARED_SECRET = 'sed -i "s/^registration_shared_secret:.*/registration_shared_secret: \\"$SECRET\\"/" ' \
+                    '/data/homeserver.yaml'
+
+
+class DockerError(Exception):
+    """ A request to the Docker Engine API failed. """
+
+    def __init__(self, method: str, path: str, status: int, message: str):
+        super().__init__('{method} {path} failed with status {status}: {message}'
+                         .format(method=method, path=path, status=status, message=message))
+        self.status = status
+
+
+class DockerClient:
+    """
+    Minimal client of the Docker Engine API, over the UNIX socket of the daemon.
+    Every request uses its own connection, so the client can be shared between threads.
+
+    Attributes:
+        socket_path (str): The socket of the Docker daemon
+    """
+
+    def __init__(self, socket_path: str = DOCKER_SOCKET):
+        self.socket_path = socket_path
+
+    def request(self, method: str, path: str, body: dict = None, ignore: tuple = ()):
+        """
+        Send a request to the Docker Engine API.
+
+        Args:
+            method (str): HTTP method
+            path (str): Path of the endpoint, without the API version
+            body (dict): JSON body of the request
+            ignore (tuple): Error statuses that are not raised but return None, e.g. 404 when removing
+
+        Returns:
+            The JSON response, or None if it is empty or its status is ignored
+
+        Raises:
+            DockerError: If the daemon responded with an error status
+        """
+        conn = UnixHTTPConnection(self.socket_path)
+        try:
+            payload = json.dumps(body) if body is not None else None
+            conn.request(method, DOCKER_API + path, payload, {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            data = response.read()
+        finally:
+            conn.close()
+
+        if response.status in ignore:
+            return None
+        if response.status >= 400:
+            try:
+                message = json.loads(data).get('message', '')
+            except ValueError:
+                message = data.decode('utf-8', 'replace')
+            raise DockerError(method, path, response.status, message)
+
+        if not data:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            # Streamed progress (e.g. of a pull): one JSON document per line, the last one is the outcome.
+            return json.loads(data.splitlines()[-1])
+
+    def ensure_image(self, image: str):
+        """ Pull the image unless it is available locally. """
+        if self.request('GET', '/images/{image}/json'.format(image=image), ignore=(404,)) is not None:
+            return
+
+        logging.info('Pulling %s', image)
+        name, _, tag = image.partition(':')
+        outcome = self.request('POST', '/images/create?fromImage={name}&tag={tag}'
+                               .format(name=quote(name, safe=''), tag=quote(tag or 'latest')))
+        if outcome and 'error' in outcome:
+            raise DockerError('POST', '/images/create', 500, outcome['error'])
+
+    def create_container(self, config: dict, name: str = None) -> str:
+        path = '/containers/create'
+        if name:
+            path += '?name={name}'.format(name=quote(name))
+        return self.request('POST', path, config)['Id']
+
+    def start_container(self, container: str):
+        self.request('POST', '/containers/{id}/start'.format(id=container))
+
+    def wait_container(self, container: str) -> int:
+        """ Wait until the container exits and return its exit code. """
+        return self.request('POST', '/containers/{id}/wait'.format(id=container))['StatusCode']
+
+    def remove_container(self, container: str):
+        self.request('DELETE', '/containers/{id}?force=true'.format(id=quote(container)), ignore=(404,))
+
+    def remove_volume(self, volume: str):
+        self.request('DELETE', '/volumes/{name}?force=true'.format(name=quote(volume)), ignore=(404,))
+
+    def ensure_network(self, network: str):
+        """ Create the bridge network unless it exists. """
+        if self.request('GET', '/networks/{name}'.format(name=quote(network)), ignore=(404,)) is None:
+            self.request('POST', '/networks/create', {'Name': network, 'Driver': 'bridge'})
+
+    def remove_network(self, network: str):
+        self.request('DELETE', '/networks/{name}'.format(name=quote(network)), ignore=(404,))
+
+    def run_to_completion(self, config: dict) -> int:
+        """ Run a short-lived container, remove it and return its exit code. """
+        container = self.create_container(config)
+        try:
+            self.start_container(container)
+            return self.wait_container(container)
+        finally:
+            self.remove_container(container)
+
+
+class DockerEngineBackend(Backend):
+    """
+    Provisions the homeserver through the Docker Engine API on the local daemon socket, instead
+    of forking docker CLIs. Generating and configuring homeserver.yaml is done by a single
+    short-lived container of the Synapse image itself.
+    On a Docker network with federation peers, the server is named after its container, so
+    the peers can resolve it, and federates over TLS on port 8448 with a self-signed certificate
+    made by a short-lived openssl container.
+
+    Attributes:
+        image (str): The Synapse image
+        docker (DockerClient): Client of the Docker daemon
+        server_id (int): Number of the homeserver, part of its container and volume names
+        network (str): Docker network the container joins, or None
+        federation_peers ([str]): Server names this server federates with, itself included
+    """
+
+    def __init__(self, port: int, image: str = SYNAPSE_IMAGE, docker_socket: str = DOCKER_SOCKET,
+                 server_id: int = 1, network: str = None, federation_peers: list = None, **kwargs):
+        super().__init__(port, **kwargs)
+        if network and self.transport == 'host':
+            raise ValueError('A homeserver on a Docker network can not use host networking')
+
+        self.image = image
+        self.docker = DockerClient(docker_socket)
+        self.server_id = server_id
+        self.network = network
+        self.federation_peers = federation_peers or []
+
+        self.container_name = CONTAINER_NAME.format(id=server_id)
+        self.volume_name = VOLUME_NAME.format(id=server_id)
+        self.server_name = self.container_name if self.federation_peers else SERVER_NAME.format(id=server_id)
+
+    @property
+    def socket_path(self) -> str:
+        if self.transport != 'uds':
+            return None
+        return os.path.join(self.socket_directory, self.container_name, 'synapse.sock')
+
+    def provision(self):
+        logging.info('Provisioning %s through the Docker Engine API', self.container_name)
+        self.docker.ensure_image(self.image)
+        self._remove()
+        self._configure()
+
+        host_config = {
+            'Mounts': [{'Type': 'volume', 'Source': self.volume_name, 'Target': '/data'}],
+            'RestartPolicy': {'Name': 'unless-stopped'},
+        }
+        if self.transport == 'host':
+            host_config['NetworkMode'] = 'host'
+        else:
+            host_config['PortBindings'] = {'8008/tcp': [{'HostPort': str(self.port)}]}
+        if self.network:
+            host_config['NetworkMode'] = self.network
+        if self.transport == 'uds':
+            socket_directory = os.path.dirname(self.socket_path)
+            os.makedirs(socket_directory, exist_ok=True)
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            host_config['Mounts'].append({'Type': 'bind', 'Source': socket_directory, 'Target': '/sockets'})
+
+        container = self.docker.create_container({
+            'Image': self.image,
+            'ExposedPorts': {'8008/tcp': {}},
+            'HostConfig': host_config,
+        }, name=self.container_name)
+        self.docker.start_container(container)
+        self._use_transport()
+
+    def reset(self):
+        self.provision()
+
+    def teardown(self):
+        logging.info('Removing %s', self.container_name)
+        self._remove()
+
+    def _remove(self):
+        self.docker.remove_container(self.container_name)
+        self.docker.remove_volume(self.volume_name)
+
+    def _configure(self):
+        """ Generate homeserver.yaml in the data volume, append the test configuration and set the listeners. """
+        config = HOMESERVER_CONFIG
+        if self.federation_peers:
+            config += FEDERATION_CONFIG.format(peers=', '.join(self.federation_peers))
+
+        script = "/start.py generate && cat >> /data/homeserver.yaml <<'EOF'\n{config}EOF\n".format(config=config)
+        env = ['SYNAPSE_SERVER_NAME=' + self.server_name, 'SYNAPSE_REPORT_STATS=yes']
+        if self.transport == 'uds' or self.federation_peers:
+            listeners = TCP_LISTENER
+            if self.transport == 'uds':
+                listeners += UDS_LISTENER
+            if self.federation_peers:
+                listeners += FEDERATION_LISTENER
+            script += 'python -c "$REPLACE_LISTENERS"\n'
+            env += ['LISTENERS=' + listeners, 'REPLACE_LISTENERS=' + REPLACE_LISTENERS]
+        if self.shared_secret:
+            script += SET_SHARED_SECRET + '\n'
+            env.append('SECRET=' + self.shared_secret)
+
+        mounts = [{'Type': 'volume', 'Source': self.volume_name, 'Target': '/data'}]
+        status = self.docker.run_to_completion({
+            'Image': self.image,
+            'Entrypoint': ['/bin/sh', '-ec'],
+            'Cmd': [script],
+            'Env': env,
+            'HostConfig': {'Mounts': mounts},
+        })
+        if status != 0:
+            raise RuntimeError('Generating the configuration of {name} failed with exit code {status}'
+                               .format(name=self.container_name, status=status))
+
+        if self.federation_peers:
+            self.docker.ensure_image(OPENSSL_IMAGE)
+            status = self.docker.run_to_completion({
+                'Image': OPENSSL_IMAGE,
+                'Entrypoint': ['/bin/sh', '-ec'],
+                'Cmd': [GENERATE_CERTIFICATE],
+                'Env': ['NAME=' + self.server_name],
+                'HostConfig': {'Mounts': mounts},
+            })
+            if status != 0:
+                raise RuntimeError('Generating the certificate of {name} failed with exit code {status}'
+                                   .format(name=self.container_name, status=status))
@@ -0,0 +1,410 @@
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import re
+import secrets
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from matrix.backends.backend import Backend
+
+SERVER_NAME = 'fake.matrix.host'
+
+CLIENT_PATH = '/_matrix/client/v3'
+ADMIN_PATH = '/_synapse/admin/v1'
+
+_VALID_LOCALPART = re.compile(r'^[a-z0-9=_\-./+]+$')
+
+
+class MatrixError(Exception):
+    """ An error response of the fake homeserver. """
+
+    def __init__(self, status: int, errcode: str, error: str):
+        super().__init__(error)
+        self.status = status
+        self.errcode = errcode
+        self.error = error
+
+
+class FakeMatrixState:
+    """
+    In-memory state of the fake homeserver: accounts, sessions, rooms and the event stream.
+    Implements the subset of the client-server API used by the mock client, with the status
+    codes and error messages of Synapse for the cases the adapter distinguishes.
+    """
+
+    def __init__(self, shared_secret: str = None):
+        self.shared_secret = shared_secret
+        self.passwords = {}  # user id -> password
+        self.sessions = {}  # access token -> user id
+        self.admins = set()  # user ids
+        self.rooms = {}  # room id -> {'members': set, 'invited': set, 'public': bool}
+        self.events = []  # (room id, event), the position in the list is the stream position
+        self.nonces = set()
+        self.changed = threading.Condition()
+        self._ids = itertools.count(1)
+
+    def _user_id(self, localpart: str) -> str:
+        return '@{localpart}:{server}'.format(localpart=localpart, server=SERVER_NAME)
+
+    def _session(self, user_id: str) -> dict:
+        access_token = secrets.token_urlsafe(24)
+        self.sessions[access_token] = user_id
+        return {'user_id': user_id, 'access_token': access_token, 'device_id': 'FAKE{id}'.format(id=next(self._ids))}
+
+    def new_filter_id(self) -> str:
+        return str(next(self._ids))
+
+    def authenticate(self, access_token: str) -> str:
+        user_id = self.sessions.get(access_token)
+        if user_id is None:
+            raise MatrixError(401, 'M_UNKNOWN_TOKEN', 'Invalid access token passed.')
+        return user_id
+
+    def register(self, username, password) -> dict:
+        if not isinstance(username, str):
+            raise MatrixError(400, 'M_INVALID_USERNAME', 'Invalid username')
+        username = username.lower()
+        if not username:
+            raise MatrixError(400, 'M_INVALID_USERNAME', 'User ID cannot be empty')
+        if not _VALID_LOCALPART.match(username):
+            raise MatrixError(400, 'M_INVALID_USERNAME', "User ID can only contain characters a-z, 0-9, or '=_-./+'")
+        if len(self._user_id(username)) > 255:
+            raise MatrixError(400, 'M_INVALID_USERNAME', 'User ID may not be longer than 255 characters')
+
+        with self.changed:
+            user_id = self._user_id(username)
+            if user_id in self.passwords:
+                raise MatrixError(400, 'M_USER_IN_USE', 'User ID already taken.')
+            self.passwords[user_id] = password
+            return self._session(user_id)
+
+    def is_available(self, username: str) -> bool:
+        return self._user_id(username.lower()) not in self.passwords
+
+    def new_nonce(self) -> str:
+        nonce = secrets.token_hex(16)
+        self.nonces.add(nonce)
+        return nonce
+
+    def register_admin(self, body: dict) -> dict:
+        """ Shared-secret registration: the mac is an HMAC-SHA1 of nonce, username, password and admin. """
+        if not self.shared_secret:
+            raise MatrixError(400, 'M_UNKNOWN', 'Shared secret registration is not enabled')
+        nonce = body.get('nonce')
+        if nonce not in self.nonces:
+            raise MatrixError(400, 'M_UNKNOWN', 'unrecognised nonce')
+        self.nonces.discard(nonce)
+
+        mac = hmac.new(self.shared_secret.encode('utf8'), digestmod=hashlib.sha1)
+        mac.update(b'\x00'.join([nonce.encode('utf8'), body.get('username', '').encode('utf8'),
+                                 body.get('password', '').encode('utf8'),
+                                 b'admin' if body.get('admin') else b'notadmin']))
+        if not hmac.compare_digest(mac.hexdigest(), body.get('mac', '')):
+            raise MatrixError(403, 'M_FORBIDDEN', 'HMAC incorrect')
+        session = self.register(body.get('username'), body.get('password'))
+        if body.get('admin'):
+            self.admins.add(session['user_id'])
+        return session
+
+    def login(self, body: dict) -> dict:
+        identifier = body.get('identifier', {})
+        if 'user' not in identifier or identifier['user'] is None:
+            raise MatrixError(400, 'M_UNKNOWN', "User identifier is missing 'user' key")
+        if not isinstance(identifier['user'], str):
+            # Synapse fails on it
+            raise MatrixError(500, 'M_UNKNOWN', 'Internal server error')
+
+        user = identifier['user'].lower()
+        user_id = user if user.startswith('@') else self._user_id(user)
+        with self.changed:
+            if self.passwords.get(user_id) != body.get('password'):
+                raise MatrixError(403, 'M_FORBIDDEN', 'Invalid username or password')
+            return self._session(user_id)
+
+    def logout(self, access_token: str):
+        with self.changed:
+            self.authenticate(access_token)
+            del self.sessions[access_token]
+
+    def create_room(self, user_id: str, body: dict) -> str:
+        with self.changed:
+            room_id = '!room{id}:{server}'.format(id=next(self._ids), server=SERVER_NAME)
+            self.rooms[room_id] = {'members': {user_id}, 'invited': set(body.get('invite', [])),
+                                   'public': body.get('preset', 'public_chat') == 'public_chat'}
+            self._append(room_id, user_id, 'm.room.create', {'creator': user_id})
+            if body.get('name'):
+                self._append(room_id, user_id, 'm.room.name', {'name': body['name']})
+            return room_id
+
+    def delete_room(self, user_id: str, room_id: str):
+        if user_id not in self.admins:
+            raise MatrixError(403, 'M_FORBIDDEN', 'You are not a server admin')
+        with self.changed:
+            self._room(room_id)
+            del self.rooms[room_id]
+
+    def _room(self, room_id: str) -> dict:
+        room = self.rooms.get(room_id)
+        if room is None:
+            raise MatrixError(404, 'M_NOT_FOUND', 'Unknown room')
+        return room
+
+    def join(self, user_id: str, room_id: str):
+        with self.changed:
+            room = self._room(room_id)
+            if not room['public'] and user_id not in room['invited'] and user_id not in room['members']:
+                raise MatrixError(403, 'M_FORBIDDEN', 'You are not invited to this room.')
+            room['invited'].discard(user_id)
+            room['members'].add(user_id)
+            self._append(room_id, user_id, 'm.room.member', {'membership': 'join'})
+
+    def leave(self, user_id: str, room_id: str):
+        with self.changed:
+            self._room(room_id)['members'].discard(user_id)
+            self._append(room_id, user_id, 'm.room.member', {'membership': 'leave'})
+
+    def invite(self, user_id: str, room_id: str, invitee: str):
+        with self.changed:
+            room = self._room(room_id)
+            if user_id not in room['members']:
+                raise MatrixError(403, 'M_FORBIDDEN', 'You are not in this room.')
+            if invitee not in self.passwords:
+                raise MatrixError(404, 'M_NOT_FOUND', 'Unknown user')
+            room['invited'].add(invitee)
+
+    def send(self, user_id: str, room_id: str, content: dict) -> str:
+        with self.changed:
+            if user_id not in self._room(room_id)['members']:
+                raise MatrixError(403, 'M_FORBIDDEN', 'You are not in this room.')
+            return self._append(room_id, user_id, 'm.room.message', content)
+
+    def _append(self, room_id: str, sender: str, event_type: str, content: dict) -> str:
+        event_id = '$event{id}'.format(id=next(self._ids))
+        self.events.append((room_id, {'event_id': event_id, 'type': event_type, 'sender': sender,
+                                      'content': content}))
+        self.changed.notify_all()
+        return event_id
+
+    def joined_rooms(self, user_id: str) -> list:
+        with self.changed:
+            return [room_id for room_id, room in self.rooms.items() if user_id in room['members']]
+
+    def messages(self, user_id: str, room_id: str, limit: int, direction: str) -> list:
+        with self.changed:
+            if user_id not in self._room(room_id)['members']:
+                raise MatrixError(403, 'M_FORBIDDEN', 'You are not in this room.')
+            events = [event for event_room, event in self.events if event_room == room_id]
+        return list(reversed(events))[:limit] if direction == 'b' else events[:limit]
+
+    def sync(self, user_id: str, since: str, timeout_ms: int) -> dict:
+        """ The events of the joined rooms after `since`, waiting up to `timeout_ms` for new ones. """
+        position = int(since) if since else 0
+        with self.changed:
+            if since and timeout_ms and len(self.events) <= position:
+                self.changed.wait_for(lambda: len(self.events) > position, timeout_ms / 1000)
+
+            joined = {}
+            for room_id, event in self.events[position:]:
+                room = self.rooms.get(room_id)
+                if room and user_id in room['members']:
+                    joined.setdefault(room_id, {'timeline': {'events': []}})['timeline']['events'].append(event)
+            return {'next_batch': str(len(self.events)), 'rooms': {'join': joined}}
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """ Routes the requests of the mock client to the state of the fake homeserver. """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # headers and body are written separately
+
+    # (method, path pattern, name of the method handling it)
+    ROUTES = [
+        ('GET', r'/_matrix/client/versions', '_versions'),
+        ('GET', CLIENT_PATH + r'/register/available', '_available'),
+        ('POST', CLIENT_PATH + r'/register', '_register'),
+        ('GET', ADMIN_PATH + r'/register', '_nonce'),
+        ('POST', ADMIN_PATH + r'/register', '_register_admin'),
+        ('POST', CLIENT_PATH + r'/login', '_login'),
+        ('POST', CLIENT_PATH + r'/logout', '_logout'),
+        ('GET', CLIENT_PATH + r'/account/whoami', '_whoami'),
+        ('POST', CLIENT_PATH + r'/user/(?P<user_id>[^/]+)/filter', '_filter'),
+        ('GET', CLIENT_PATH + r'/sync', '_sync'),
+        ('POST', CLIENT_PATH + r'/createRoom', '_create_room'),
+        ('POST', CLIENT_PATH + r'/join/(?P<room_id>[^/]+)', '_join'),
+        ('POST', CLIENT_PATH + r'/rooms/(?P<room_id>[^/]+)/leave', '_leave'),
+        ('POST', CLIENT_PATH + r'/rooms/(?P<room_id>[^/]+)/invite', '_invite'),
+        ('GET', CLIENT_PATH + r'/joined_rooms', '_joined_rooms'),
+        ('GET', CLIENT_PATH + r'/rooms/(?P<room_id>[^/]+)/messages', '_messages'),
+        ('PUT', CLIENT_PATH + r'/rooms/(?P<room_id>[^/]+)/send/(?P<event_type>[^/]+)/[^/]+', '_send'),
+        ('DELETE', ADMIN_PATH + r'/rooms/(?P<room_id>[^/]+)', '_delete_room'),
+    ]
+    COMPILED_ROUTES = [(method, re.compile(pattern + '$'), name) for method, pattern, name in ROUTES]
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def log_message(self, format, *args):
+        logging.debug('Fake Synapse: ' + format, *args)
+
+    def _dispatch(self, method: str):
+        url = urlsplit(self.path)
+        self.query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        try:
+            self.body = json.loads(body) if body else {}
+            for route_method, pattern, name in self.COMPILED_ROUTES:
+                match = pattern.match(url.path)
+                if match and route_method == method:
+                    arguments = {key: unquote(value) for key, value in match.groupdict().items()}
+                    self._respond(200, getattr(self, name)(**arguments))
+                    return
+            raise MatrixError(404, 'M_UNRECOGNIZED', 'Unrecognized request')
+        except MatrixError as e:
+            self._respond(e.status, {'errcode': e.errcode, 'error': e.error})
+        except ValueError:
+            self._respond(400, {'errcode': 'M_NOT_JSON', 'error': 'Content not JSON.'})
+
+    def _respond(self, status: int, body: dict):
+        data = json.dumps(body).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @property
+    def state(self) -> FakeMatrixState:
+        return self.server.state
+
+    def _user(self) -> str:
+        authorization = self.headers.get('Authorization', '')
+        return self.state.authenticate(authorization[len('Bearer '):] if authorization.startswith('Bearer ') else '')
+
+    def _versions(self):
+        return {'versions': ['v1.11']}
+
+    def _available(self):
+        if not self.state.is_available(self.query.get('username', '')):
+            raise MatrixError(400, 'M_USER_IN_USE', 'User ID already taken.')
+        return {'available': True}
+
+    def _register(self):
+        return self.state.register(self.body.get('username'), self.body.get('password'))
+
+    def _nonce(self):
+        return {'nonce': self.state.new_nonce()}
+
+    def _register_admin(self):
+        return self.state.register_admin(self.body)
+
+    def _login(self):
+        return self.state.login(self.body)
+
+    def _logout(self):
+        self._user()
+        self.state.logout(self.headers['Authorization'][len('Bearer '):])
+        return {}
+
+    def _whoami(self):
+        return {'user_id': self._user()}
+
+    def _filter(self, user_id):
+        self._user()
+        return {'filter_id': self.state.new_filter_id()}
+
+    def _sync(self):
+        return self.state.sync(self._user(), self.query.get('since'), int(self.query.get('timeout', 0)))
+
+    def _create_room(self):
+        return {'room_id': self.state.create_room(self._user(), self.body)}
+
+    def _join(self, room_id):
+        self.state.join(self._user(), room_id)
+        return {'room_id': room_id}
+
+    def _leave(self, room_id):
+        self.state.leave(self._user(), room_id)
+        return {}
+
+    def _invite(self, room_id):
+        self.state.invite(self._user(), room_id, self.body.get('user_id'))
+        return {}
+
+    def _joined_rooms(self):
+        return {'joined_rooms': self.state.joined_rooms(self._user())}
+
+    def _messages(self, room_id):
+        chunk = self.state.messages(self._user(), room_id, int(self.query.get('limit', 10)),
+                                    self.query.get('dir', 'b'))
+        return {'chunk': chunk, 'start': '0', 'end': str(len(chunk))}
+
+    def _send(self, room_id, event_type):
+        return {'event_id': self.state.send(self._user(), room_id, self.body)}
+
+    def _delete_room(self, room_id):
+        self.state.delete_room(self._user(), room_id)
+        return {'kicked_users': [], 'failed_to_kick_users': [], 'local_aliases': [], 'new_room_id': None}
+
+
+class FakeMatrixServer(ThreadingHTTPServer):
+    """
+    Minimal in-process Matrix homeserver on localhost, serving a FakeMatrixState.
+
+    Attributes:
+        state (FakeMatrixState): The state of the homeserver
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int, shared_secret: str = None):
+        super().__init__(('localhost', port), _RequestHandler)
+        self.state = FakeMatrixState(shared_secret)
+
+
+class FakeBackend(Backend):
+    """
+    Runs a minimal in-process Matrix homeserver instead of Synapse, for developing and testing
+    the adapter without Docker. A reset only replaces the in-memory state, so it is nearly free.
+    """
+
+    transports = ('tcp',)
+
+    def __init__(self, port: int, **kwargs):
+        super().__init__(port, **kwargs)
+        self._server = None
+        self._lock = threading.Lock()
+
+    def provision(self):
+        with self._lock:
+            if self._server is None:
+                logging.info('Starting a fake Matrix homeserver on port %d', self.port)
+                self._server = FakeMatrixServer(self.port, self.shared_secret)
+                threading.Thread(target=self._server.serve_forever, name='fake-synapse', daemon=True).start()
+            else:
+                self._server.state = FakeMatrixState(self.shared_secret)
+        self._use_transport()
+
+    def reset(self):
+        self.provision()
+
+    def teardown(self):
+        with self._lock:
+            server, self._server = self._server, None
+        if server:
+            server.shutdown()
+            server.server_close()
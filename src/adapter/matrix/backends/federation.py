@@ -0,0 +1,149 @@
+import argparse
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from generic.util.metrics import metrics
+from matrix.backends.backend import Backend
+from matrix.backends.docker_engine import (DockerClient, DockerEngineBackend, CONTAINER_NAME, DOCKER_SOCKET,
+                                           OPENSSL_IMAGE, SYNAPSE_IMAGE)
+
+# Docker network shared by the homeservers of a federation.
+FEDERATION_NETWORK = 'matrix-federation'
+
+DEFAULT_SERVERS = 2
+
+# Seconds to wait for a homeserver to answer; they start concurrently, so it takes longer than alone.
+BRING_UP_TIMEOUT = 60
+
+
+class FederationOrchestrator:
+    """
+    Brings up a federation of homeservers: one DockerEngineBackend per port, all on a shared
+    Docker network and federating with each other. The servers are provisioned in parallel
+    and awaited together; the bring-up time of every server and of the whole federation is
+    logged and published as metrics.
+
+    Attributes:
+        network (str): The shared Docker network
+        backends ([DockerEngineBackend]): The homeservers, numbered from 1 in the order of their ports
+    """
+
+    def __init__(self, ports: List[int], network: str = FEDERATION_NETWORK, image: str = SYNAPSE_IMAGE,
+                 docker_socket: str = DOCKER_SOCKET, **kwargs):
+        self.network = network
+        self.image = image
+        self.docker = DockerClient(docker_socket)
+
+        peers = [CONTAINER_NAME.format(id=server_id) for server_id in range(1, len(ports) + 1)]
+        self.backends = [DockerEngineBackend(port, image, docker_socket, server_id=server_id, network=network,
+                                             federation_peers=peers, **kwargs)
+                         for server_id, port in enumerate(ports, 1)]
+
+    def provision(self) -> Dict[str, float]:
+        """
+        Bring up all homeservers in parallel and wait until every one of them answers.
+
+        Returns:
+            {str: float}: Server name -> seconds it took to bring it up
+
+        Raises:
+            RuntimeError: If any of the homeservers could not be brought up
+        """
+        start = time.perf_counter()
+
+        # Once up front, instead of a pull per server.
+        self.docker.ensure_image(self.image)
+        self.docker.ensure_image(OPENSSL_IMAGE)
+        self.docker.ensure_network(self.network)
+
+        with ThreadPoolExecutor(max_workers=len(self.backends), thread_name_prefix='federation') as pool:
+            futures = {backend.server_name: pool.submit(self._bring_up, backend) for backend in self.backends}
+
+        durations = {}
+        failures = []
+        for server_name, future in futures.items():
+            try:
+                durations[server_name] = future.result()
+            except Exception as e:
+                failures.append('{name}: {reason}'.format(name=server_name, reason=e))
+
+        total = time.perf_counter() - start
+        metrics.observe('federation.bring_up_total_ms', total * 1000)
+        logging.info('%d of %d homeservers up in %.1f s', len(durations), len(self.backends), total)
+
+        if failures:
+            raise RuntimeError('Bringing up the federation failed: {failures}'.format(failures='; '.join(failures)))
+        return durations
+
+    @staticmethod
+    def _bring_up(backend: DockerEngineBackend) -> float:
+        start = time.perf_counter()
+        backend.provision()
+        backend.wait_healthy(BRING_UP_TIMEOUT)
+        duration = time.perf_counter() - start
+
+        metrics.observe('federation.bring_up_ms', duration * 1000)
+        metrics.set_gauge('federation.{name}.bring_up_ms'.format(name=backend.server_name), duration * 1000)
+        logging.info('Homeserver %s up on port %d in %.1f s', backend.server_name, backend.port, duration)
+        return duration
+
+    def teardown(self):
+        """ Remove all homeservers and the network. """
+        with ThreadPoolExecutor(max_workers=len(self.backends), thread_name_prefix='federation') as pool:
+            list(pool.map(DockerEngineBackend.teardown, self.backends))
+        self.docker.remove_network(self.network)
+
+
+class FederationBackend(Backend):
+    """
+    Lifecycle backend for a federation of homeservers on consecutive ports, see
+    FederationOrchestrator. The adapter tests the first one; the others are its peers.
+
+    Attributes:
+        orchestrator (FederationOrchestrator): Brings the homeservers up and down
+    """
+
+    transports = ('tcp', 'uds')
+
+    def __init__(self, port: int, servers: int = DEFAULT_SERVERS, **kwargs):
+        super().__init__(port, **kwargs)
+        self.orchestrator = FederationOrchestrator([port + offset for offset in range(servers)],
+                                                   transport=self.transport,
+                                                   socket_directory=self.socket_directory,
+                                                   shared_secret=self.shared_secret)
+
+    @property
+    def socket_path(self) -> str:
+        return self.orchestrator.backends[0].socket_path
+
+    def provision(self):
+        self.orchestrator.provision()
+
+    def reset(self):
+        self.provision()
+
+    def health(self) -> bool:
+        return all(backend.health() for backend in self.orchestrator.backends)
+
+    def teardown(self):
+        self.orchestrator.teardown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bring up a federation of Synapse homeservers')
+    parser.add_argument('-n', '--servers', type=int, default=DEFAULT_SERVERS,
+                        help='number of homeservers (default: {default})'.format(default=DEFAULT_SERVERS))
+    parser.add_argument('-p', '--port', type=int, default=8008,
+                        help='client port of the first homeserver, the others use the next ports (default: 8008)')
+    parser.add_argument('--teardown', action='store_true', help='remove the homeservers instead')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    orchestrator = FederationOrchestrator([args.port + offset for offset in range(args.servers)])
+    if args.teardown:
+        orchestrator.teardown()
+    else:
+        orchestrator.provision()
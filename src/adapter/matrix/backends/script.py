@@ -0,0 +1,38 @@
+import logging
+import os
+import subprocess
+
+import ttAssignment1
+
+from matrix.backends.backend import Backend
+
+# The provisioning script, located relative to the package instead of the working directory.
+SETUP_SCRIPT = os.path.join(os.path.dirname(ttAssignment1.__file__), 'setup_homeserver.sh')
+
+# Container and volume created by the script for the homeserver on port 8008.
+CONTAINER_NAME = 'synapse1'
+VOLUME_NAME = 'synapse1-data'
+
+
+class ScriptBackend(Backend):
+    """
+    Provisions the homeserver with setup_homeserver.sh, which drives the docker CLI.
+    The script always starts from scratch, so a reset is a full provision.
+    """
+
+    def provision(self):
+        logging.info('Provisioning Synapse with %s', SETUP_SCRIPT)
+        env = dict(os.environ,
+                   REGISTRATION_SHARED_SECRET=self.shared_secret or '',
+                   SYNAPSE_TRANSPORT=self.transport,
+                   SYNAPSE_SOCKET_DIR=self.socket_directory)
+        subprocess.run([SETUP_SCRIPT], check=True, env=env)
+        self._use_transport()
+
+    def reset(self):
+        self.provision()
+
+    def teardown(self):
+        logging.info('Removing Synapse')
+        subprocess.run(['docker', 'rm', '-f', CONTAINER_NAME], check=False)
+        subprocess.run(['docker', 'volume', 'rm', '-f', VOLUME_NAME], check=False)
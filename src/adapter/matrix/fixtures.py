@@ -0,0 +1,265 @@
+import json
+import logging
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from ttAssignment1 import (register_user, register_user_shared_secret, login_user, logout_user, create_room,
+                           join_room, delete_room, send_message, fixture_username, random_string)
+
+# Number of concurrent requests while seeding.
+DEFAULT_WORKERS = 16
+
+# The world of a reset when no fixture spec is configured: only the account of Alice.
+DEFAULT_SPEC = {
+    'accounts': [{'username': 'Alice', 'password': 'alice123'}],
+}
+
+
+class Fixtures:
+    """
+    The seeded world of a test case.
+
+    Attributes:
+        users ([dict]): username, password, user_id and access_token of every seeded user;
+            the named accounts first, then the generated users in index order
+        rooms ([dict]): room_id and members (indices into `users`) of every seeded room
+        messages (int): Number of seeded messages
+        duration (float): Seconds it took to seed the world
+    """
+
+    def __init__(self):
+        self.users = []
+        self.rooms = []
+        self.messages = 0
+        self.duration = 0.0
+
+
+def parse_spec(value: str) -> dict:
+    """
+    Parse a fixture spec from its JSON form, e.g. the `fixture_spec` configuration item:
+
+        {
+            "accounts": [{"username": "Alice", "password": "alice123"}],
+            "users": {"count": 1000, "prefix": "user", "password": "secret"},
+            "rooms": {"count": 100, "members": 10, "prefix": "room"},
+            "messages": {"per_room": 20},
+            "workers": 16
+        }
+
+    Every key is optional. An empty value means DEFAULT_SPEC.
+
+    Args:
+        value (str): The spec as JSON
+
+    Returns:
+        dict: The spec
+    """
+    if not value:
+        return DEFAULT_SPEC
+
+    spec = json.loads(value)
+    if not isinstance(spec, dict):
+        raise ValueError('A fixture spec should be a JSON object')
+
+    unknown = spec.keys() - {'accounts', 'users', 'rooms', 'messages', 'workers'}
+    if unknown:
+        raise ValueError('Unknown fixture spec keys: {keys}'.format(keys=', '.join(sorted(unknown))))
+    return spec
+
+
+class CaseChanges:
+    """
+    What the stimuli of a test case changed on the homeserver beyond its seeded world, so a
+    kept homeserver can be brought back to it (see `FixtureLoader.unload`).
+
+    Attributes:
+        registrations (int): Number of users registered
+        rooms ([str]): Ids of the rooms created
+        sessions ([str]): Access tokens of the sessions logged in
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.registrations = 0
+        self.rooms = []
+        self.sessions = []
+
+    def record(self, response: str, parameters: list):
+        """ Record the response of the SUT to a stimulus, with its response parameters. """
+        with self._lock:
+            if response == 'user_registered':
+                self.registrations += 1
+            elif response == 'room_created':
+                self.rooms.append(parameters[0].value)
+            elif response == 'logged_in':
+                self.sessions.append(parameters[0].value)
+
+    def take(self) -> 'CaseChanges':
+        """ The changes recorded so far, after which the recording starts over. """
+        changes = CaseChanges()
+        with self._lock:
+            changes.registrations, self.registrations = self.registrations, 0
+            changes.rooms, self.rooms = self.rooms, []
+            changes.sessions, self.sessions = self.sessions, []
+        return changes
+
+
+class FixtureLoader:
+    """
+    Seeds a homeserver with the users, rooms and message histories described by a fixture spec
+    (see `parse_spec`). Generated usernames are derived from their index and a random suffix,
+    drawn once per homeserver (or per load), so no availability checks are needed. All requests are spread over a
+    pool of worker threads, each reusing its own keep-alive connection to the homeserver.
+    Users are registered with the admin API if the shared secret of the homeserver is known.
+
+    A homeserver that is kept between test cases is brought back to its seeded world with
+    `unload`; with the same suffix, its users then exist already, and are logged in instead,
+    so the database does not grow with every reset.
+
+    Attributes:
+        port (int): Port of the SUT
+        shared_secret (str): registration_shared_secret of the homeserver, or None
+        existing_accounts (bool): Whether the users may exist already, i.e. were unloaded
+        suffix (str): Suffix of the generated names, kept for as long as the homeserver; None to draw one per load
+    """
+
+    def __init__(self, port: int, shared_secret: str = None, existing_accounts: bool = False, suffix: str = None):
+        self.port = port
+        self.shared_secret = shared_secret or None
+        self.existing_accounts = existing_accounts
+        self.suffix = suffix
+
+    def load(self, spec: dict) -> Fixtures:
+        """
+        Seed the homeserver.
+
+        Args:
+            spec (dict): The fixture spec
+
+        Returns:
+            Fixtures: The seeded world
+
+        Raises:
+            RuntimeError: If the homeserver refused to create part of the world
+        """
+        start = time.perf_counter()
+        fixtures = Fixtures()
+
+        users = [(account['username'], account['password']) for account in spec.get('accounts', [])]
+        generated = spec.get('users', {})
+        suffix = self.suffix or random_string(6)
+        users += [(fixture_username(generated.get('prefix', 'user'), index, suffix), generated.get('password', 'password'))
+                  for index in range(generated.get('count', 0))]
+
+        with ThreadPoolExecutor(max_workers=spec.get('workers', DEFAULT_WORKERS),
+                                thread_name_prefix='fixtures') as pool:
+            fixtures.users = list(pool.map(self._register, users))
+
+            rooms = spec.get('rooms', {})
+            if rooms.get('count', 0) and not fixtures.users:
+                raise ValueError('A fixture spec with rooms needs users')
+            members = max(1, min(rooms.get('members', 1), len(fixtures.users)))
+            room_members = [[(index + offset) % len(fixtures.users) for offset in range(members)]
+                            for index in range(rooms.get('count', 0))]
+            names = ['{prefix}{index}_{suffix}'.format(prefix=rooms.get('prefix', 'room'), index=index, suffix=suffix)
+                     for index in range(len(room_members))]
+            fixtures.rooms = list(pool.map(self._create_room, [fixtures.users] * len(names), names, room_members))
+
+            per_room = spec.get('messages', {}).get('per_room', 0)
+            if per_room:
+                fixtures.messages = sum(pool.map(self._send_history, [fixtures.users] * len(fixtures.rooms),
+                                                 fixtures.rooms, [per_room] * len(fixtures.rooms)))
+
+        fixtures.duration = time.perf_counter() - start
+        logging.info('Seeded %d users, %d rooms and %d messages in %.1f ms', len(fixtures.users),
+                     len(fixtures.rooms), fixtures.messages, fixtures.duration * 1000)
+        return fixtures
+
+    def unload(self, fixtures: Fixtures, changes: CaseChanges, admin_token: str, workers: int = DEFAULT_WORKERS):
+        """
+        Undo a test case on a kept homeserver, so the next `load` seeds the same world again:
+        the seeded rooms and the rooms created in the test case are deleted, and every seeded
+        session and session logged in during the test case is logged out. Users registered in
+        the test case can not be undone, as their user IDs are never freed.
+
+        Args:
+            fixtures (Fixtures): The world seeded at the start of the test case
+            changes (CaseChanges): What the test case changed beyond it
+            admin_token (str): Access token of a server admin, for deleting rooms
+            workers (int): Number of concurrent requests
+
+        Raises:
+            RuntimeError: If the test case registered users, or a room could not be deleted
+        """
+        if changes.registrations:
+            raise RuntimeError('{count} users were registered in the test case'.format(count=changes.registrations))
+
+        start = time.perf_counter()
+        rooms = [room['room_id'] for room in fixtures.rooms] + changes.rooms
+        sessions = [user['access_token'] for user in fixtures.users] + changes.sessions
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fixtures') as pool:
+            deleted = pool.map(self._delete_room, rooms, [admin_token] * len(rooms))
+            for room_id, (status, response) in zip(rooms, deleted):
+                if status != 200:
+                    raise RuntimeError('Deleting room {room_id} failed with status {status}: {error}'
+                                       .format(room_id=room_id, status=status, error=response.get('error')))
+            # Sessions logged out in the test case already answer 401.
+            list(pool.map(logout_user, [self.port] * len(sessions), sessions))
+
+        logging.info('Unloaded %d rooms and %d sessions in %.1f ms', len(rooms), len(sessions),
+                     (time.perf_counter() - start) * 1000)
+
+    def _delete_room(self, room_id: str, admin_token: str) -> tuple:
+        return delete_room(self.port, admin_token, room_id)
+
+    def _register(self, user: tuple) -> dict:
+        username, password = user
+        if self.shared_secret:
+            status, response = register_user_shared_secret(self.port, username, password, self.shared_secret)
+        else:
+            status, response = register_user(self.port, username, password)
+
+        if status == 400 and response.get('errcode') == 'M_USER_IN_USE' and self.existing_accounts:
+            # Seeded before the world was unloaded: user IDs are never freed.
+            status, response = login_user(self.port, username, password)
+
+        if status != 200:
+            raise RuntimeError('Seeding user {username} failed with status {status}: {error}'
+                               .format(username=username, status=status, error=response.get('error')))
+        return {'username': username, 'password': password,
+                'user_id': response['user_id'], 'access_token': response['access_token']}
+
+    def _create_room(self, users: List[dict], name: str, members: List[int]) -> dict:
+        """ The first member creates the room and invites the others, who then join it. """
+        creator = users[members[0]]
+        invited = [users[index] for index in members[1:]]
+
+        status, response = create_room(self.port, creator['access_token'], name=name,
+                                       invite=[user['user_id'] for user in invited])
+        if status != 200:
+            raise RuntimeError('Seeding room {name} failed with status {status}: {error}'
+                               .format(name=name, status=status, error=response.get('error')))
+        room_id = response['room_id']
+
+        for user in invited:
+            status, response = join_room(self.port, user['access_token'], room_id)
+            if status != 200:
+                raise RuntimeError('Joining seeded room {name} failed with status {status}: {error}'
+                                   .format(name=name, status=status, error=response.get('error')))
+        return {'room_id': room_id, 'members': members}
+
+    def _send_history(self, users: List[dict], room: dict, count: int) -> int:
+        """ The members of the room take turns sending the messages, in order. """
+        members = room['members']
+        for index in range(count):
+            sender = users[members[index % len(members)]]
+            status, response = send_message(self.port, sender['access_token'], room['room_id'],
+                                            'message {index}'.format(index=index))
+            if status != 200:
+                raise RuntimeError('Seeding messages failed with status {status}: {error}'
+                                   .format(status=status, error=response.get('error')))
+        return count
@@ -1,79 +1,255 @@
 import logging
+import threading
 import time
-import http.client
-import subprocess
-from datetime import datetime
 from generic.api import label_pb2
 from generic.api.configuration import ConfigurationItem, Configuration
 from generic.api.label import Label, Sort
+from generic.api.label_view import LabelView
 from generic.api.parameter import Type, Parameter
 from generic.handler import Handler as AbstractHandler
+from generic.util.metrics import metrics
+from generic.util.tracing import tracer
+from matrix.backends import Backend, DEFAULT_SERVERS, DEFAULT_SOCKET_DIRECTORY, create_backend
+from matrix.fixtures import CaseChanges, FixtureLoader, parse_spec
+from matrix.routes import ROUTES, compile_routes
+from matrix.sync import SyncWorker
+from matrix.watchdog import HealthWatchdog, DEFAULT_DRIFT_THRESHOLD
 
-from ttAssignment1 import login_user, logout_user, register_user
+from ttAssignment1 import last_response_time_ns, clear_filter_cache, random_string, register_user_shared_secret
 
 PORT = 8008
 
+# What happens to the SUT at a RESET: always rebuilt, or only when the watchdog asks for it
+# (otherwise the test case is undone, see FixtureLoader.unload)
+RESET_MODES = ('rebuild', 'watchdog')
+
 class Handler(AbstractHandler):
 
     def __init__(self):
         super().__init__()
         self.adapter_core = None
+        self._routes = {}  # stimulus label name -> compiled route, see matrix.routes
+        self._backend = None  # lifecycle of the SUT, see matrix.backends
+        self._watchdog = None  # health of the SUT, see matrix.watchdog
+
+        # access token -> SyncWorker reporting the messages received by that session
+        self._sync_workers = {}
+        self._sync_lock = threading.Lock()
 
-    def send_message_to_amp(self, raw_message: str, parameters=None):
-        logging.debug(f'response received: {raw_message}')
+        self.fixtures = None  # the world seeded at the last reset, see matrix.fixtures
+        self._changes = CaseChanges()  # what the test case changed beyond it
+        self._admin_token = None  # of the server admin undoing test cases, in the watchdog reset mode
+        self._rebuilt = False  # whether the SUT was rebuilt by the reset in progress
+        self._fixture_suffix = None  # of the generated fixture names, drawn once per built SUT
+
+    def send_message_to_amp(self, raw_message: str, parameters=None, timestamp_ns=None):
+        logging.debug('response received: %s', raw_message)
 
         if raw_message == 'RESET_PERFORMED':
-            self._wait_for_synapse(PORT)
-            status, _ = register_user(PORT, "Alice", "alice123")
-            assert status==200
+            try:
+                start = time.perf_counter()
+                self._backend.wait_healthy()
+                self._record_reset_phase('startup', start)
+
+                start = time.perf_counter()
+                loader = FixtureLoader(PORT, self.configuration.value_of('registration_shared_secret'),
+                                       existing_accounts=self._reset_mode() == 'watchdog',
+                                       suffix=self._fixture_suffix)
+                self.fixtures = loader.load(parse_spec(self.configuration.value_of('fixture_spec')))
+                self._record_reset_phase('seed', start)
+
+                # The baselines of a rebuilt SUT start once it is healthy and seeded.
+                if self._rebuilt:
+                    self._rebuilt = False
+                    self._watchdog.rebuilt()
+            finally:
+                self._watchdog.resume()
+
             self.adapter_core.send_ready()
         else:
-            label = self._message2label(raw_message, parameters)
+            label = self._message2label(raw_message, parameters, timestamp_ns)
             self.adapter_core.send_response(label)
 
-    def _wait_for_synapse(self, port, timeout=15):
-        start = time.time()
-        while True:
-            try:
-                conn = http.client.HTTPConnection("localhost", port, timeout=2)
-                conn.request("GET", "/_matrix/client/versions")
-                res = conn.getresponse()
-                if res.status == 200:
-                    return
-                if time.time() - start > timeout:
-                    raise RuntimeError(f"Synapse timeout")
-            except Exception:
-                if time.time() - start > timeout:
-                    raise RuntimeError(f"Synapse timeout")
-            time.sleep(0.5)
-
     def start(self):
         logging.info("Starting Handler")
-        self._rebuild_synapse()
+        reset_mode = self._reset_mode()
+        if reset_mode not in RESET_MODES:
+            raise ValueError('Unsupported reset mode: {mode}'.format(mode=reset_mode))
+        if reset_mode == 'watchdog' and not self.configuration.value_of('registration_shared_secret'):
+            # Undoing a test case deletes its rooms with the admin API.
+            raise ValueError('The watchdog reset mode needs the registration_shared_secret')
+
+        clear_filter_cache()
+        self._changes.take()
+        self._admin_token = None
+        self._fixture_suffix = random_string(6)
+        self._backend = self._create_backend()
+
+        self._routes = compile_routes(ROUTES, self.supported_labels(), PORT)
+
+        start = time.perf_counter()
+        self._backend.provision()
+        self._record_reset_phase('provision', start)
+
+        self._watchdog = HealthWatchdog(self._backend,
+                                        self.configuration.value_of('watchdog_drift', DEFAULT_DRIFT_THRESHOLD))
+        self._watchdog.pause()
+        self._watchdog.start()
+
         self.send_message_to_amp("RESET_PERFORMED")
 
     def reset(self):
         logging.info('Resetting SUT')
-        self._rebuild_synapse()
+        # Not watched until it is ready again: a restarting SUT fails its probes.
+        self._watchdog.pause()
+        self._stop_sync_workers()
+
+        changes = self._changes.take()
+        if self._reset_mode() == 'rebuild':
+            self._rebuild_synapse()
+        else:
+            reason = self._watchdog.take_rebuild_reason()
+            if not reason:
+                reason = self._undo_test_case(changes)
+            if reason:
+                logging.info('Watchdog: rebuilding the SUT, %s', reason)
+                metrics.increment('watchdog.rebuilds')
+                self._rebuild_synapse()
+            else:
+                logging.info('Watchdog: SUT is healthy, keeping it')
+                metrics.increment('watchdog.reuses')
+
         self.send_message_to_amp("RESET_PERFORMED")
 
+    def _reset_mode(self) -> str:
+        return self.configuration.value_of('reset_mode', 'rebuild')
+
+    def _undo_test_case(self, changes: CaseChanges) -> str:
+        """
+        Bring the kept SUT back to the world seeded at the last reset.
+
+        Returns:
+            str: Why the SUT needs a rebuild instead, or None if the test case was undone
+        """
+        start = time.perf_counter()
+        shared_secret = self.configuration.value_of('registration_shared_secret')
+        try:
+            if self._admin_token is None:
+                status, response = register_user_shared_secret(PORT, 'adapter_admin_' + random_string(8),
+                                                                random_string(), shared_secret, admin=True)
+                if status != 200:
+                    raise RuntimeError('Registering the server admin failed with status {status}: {error}'
+                                       .format(status=status, error=response.get('error')))
+                self._admin_token = response['access_token']
+
+            FixtureLoader(PORT, shared_secret).unload(self.fixtures, changes, self._admin_token)
+        except RuntimeError as e:
+            return 'the test case can not be undone: {error}'.format(error=e)
+
+        self._record_reset_phase('undo', start)
+        return None
+
+    def _create_backend(self) -> Backend:
+        name = self.configuration.value_of('backend', 'script')
+        kwargs = dict(transport=self.configuration.value_of('transport', 'tcp'),
+                      socket_directory=self.configuration.value_of('socket_directory', DEFAULT_SOCKET_DIRECTORY),
+                      shared_secret=self.configuration.value_of('registration_shared_secret'))
+        if name == 'federation':
+            kwargs['servers'] = self.configuration.value_of('homeservers', DEFAULT_SERVERS)
+        return create_backend(name, PORT, **kwargs)
+
     def _rebuild_synapse(self):
         logging.info("Rebuilding Synapse")
-        subprocess.run(["src/ttAssignment1/setup_homeserver.sh"], check=True)
+        start = time.perf_counter()
+        clear_filter_cache()
+        self._admin_token = None
+        self._fixture_suffix = random_string(6)
+        self._backend.reset()
+        self._rebuilt = True
+        self._record_reset_phase('rebuild', start)
+
+    def _record_reset_phase(self, phase: str, start: float):
+        """ Log and record the duration of a phase of resetting the SUT, started at `start` (perf_counter). """
+        duration_ms = (time.perf_counter() - start) * 1000
+        logging.info('Reset phase %s took %.1f ms', phase, duration_ms)
+        metrics.observe('reset.{phase}_ms'.format(phase=phase), duration_ms)
 
     def stop(self):
         logging.info('Stopping Handler')
+        self._stop_sync_workers()
+        if self._watchdog:
+            self._watchdog.stop()
+            self._watchdog = None
+        if self._backend:
+            self._backend.teardown()
+            self._backend = None
+
+    def _start_sync_worker(self, access_token: str):
+        worker = SyncWorker(PORT, access_token, self._on_message_received)
+        with self._sync_lock:
+            previous = self._sync_workers.pop(access_token, None)
+            self._sync_workers[access_token] = worker
+        if previous:
+            previous.stop()
+        worker.start()
+
+    def _stop_sync_worker(self, access_token: str):
+        with self._sync_lock:
+            worker = self._sync_workers.pop(access_token, None)
+        if worker:
+            worker.stop()
+
+    def _stop_sync_workers(self):
+        with self._sync_lock:
+            workers = list(self._sync_workers.values())
+            self._sync_workers.clear()
+        for worker in workers:
+            worker.stop()
+
+    def _on_message_received(self, access_token: str, room_id: str, sender: str, body: str):
+        """ Called by a SyncWorker: report the received message to AMP as an asynchronous response. """
+        self.send_message_to_amp('message_received', parameters=[
+            Parameter('session_token', Type.STRING, access_token, validate=False),
+            Parameter('room_id', Type.STRING, room_id, validate=False),
+            Parameter('sender', Type.STRING, sender, validate=False),
+            Parameter('message', Type.STRING, body, validate=False),
+        ])
 
     def stimulate(self, pb_label: label_pb2.Label):
-        label = Label.decode(pb_label)
-        sut_msg, response_parameters= self._label2message(label)
+        with tracer.span('label.decode', pb_label.correlation_id):
+            label = LabelView(pb_label)
+
+        with tracer.span('sut.request', pb_label.correlation_id):
+            requested_ns = time.time_ns()
+            start = time.perf_counter()
+            sut_msg, response_parameters= self._label2message(label)
+            self._watchdog.observe(label.name, (time.perf_counter() - start) * 1000)
+        self._changes.record(sut_msg, response_parameters)
+
+        # The moment the SUT responded; labels without a request to the SUT are timestamped now.
+        response_ns = last_response_time_ns()
+        if response_ns < requested_ns:
+            response_ns = time.time_ns()
+
+        with tracer.span('stimulus.confirm', pb_label.correlation_id):
+            pb_label.timestamp = response_ns
+            pb_label.physical_label = bytes(sut_msg, 'UTF-8')
+            self.adapter_core.send_stimulus_confirmation(pb_label)
+
+        logging.info('Injecting stimulus @SUT: %s', label.name)
 
-        pb_label.timestamp = time.time_ns()
-        pb_label.physical_label = bytes(sut_msg, 'UTF-8')
-        self.adapter_core.send_stimulus_confirmation(pb_label)
+        # Logged in sessions get a sync worker reporting the messages they receive.
+        if sut_msg == 'logged_in':
+            self._start_sync_worker(response_parameters[0].value)
+        elif sut_msg == 'logged_out':
+            self._stop_sync_worker(label.value_of('session_token'))
 
-        logging.info(f'Injecting stimulus @SUT: {label.name}')
-        self.send_message_to_amp(sut_msg, parameters=response_parameters)
+        self.send_message_to_amp(sut_msg, parameters=response_parameters, timestamp_ns=response_ns)
+
+    def stimulus_key(self, pb_label: label_pb2.Label):
+        """ Stimuli of the same session, or of the same user before it has one, are performed in order. """
+        label = LabelView(pb_label)
+        return label.value_of('session_token') or label.value_of('username') or pb_label.channel
 
     def supported_labels(self):
         return [
@@ -89,6 +265,24 @@ class Handler(AbstractHandler):
             Label(Sort.STIMULUS, 'logout', 'synapse', parameters=[
                 Parameter('session_token', Type.STRING)
             ]),
+            Label(Sort.STIMULUS, 'create_room', 'synapse', parameters=[
+                Parameter('session_token', Type.STRING),
+                Parameter('room_name', Type.STRING)
+            ]),
+            Label(Sort.STIMULUS, 'join_room', 'synapse', parameters=[
+                Parameter('session_token', Type.STRING),
+                Parameter('room_id', Type.STRING)
+            ]),
+            Label(Sort.STIMULUS, 'invite_user', 'synapse', parameters=[
+                Parameter('session_token', Type.STRING),
+                Parameter('room_id', Type.STRING),
+                Parameter('user_id', Type.STRING)
+            ]),
+            Label(Sort.STIMULUS, 'send_message', 'synapse', parameters=[
+                Parameter('session_token', Type.STRING),
+                Parameter('room_id', Type.STRING),
+                Parameter('message', Type.STRING)
+            ]),
             Label(Sort.RESPONSE, 'logged_in', 'synapse', parameters=[
                 Parameter('session_token', Type.STRING)
             ]),
@@ -98,6 +292,22 @@ class Handler(AbstractHandler):
             Label(Sort.RESPONSE, 'invalid_register', 'synapse'),
             Label(Sort.RESPONSE, 'invalid_login', 'synapse'),
             Label(Sort.RESPONSE, 'invalid_logout', 'synapse'),
+            Label(Sort.RESPONSE, 'room_created', 'synapse', parameters=[
+                Parameter('room_id', Type.STRING)
+            ]),
+            Label(Sort.RESPONSE, 'room_joined', 'synapse'),
+            Label(Sort.RESPONSE, 'user_invited', 'synapse'),
+            Label(Sort.RESPONSE, 'message_sent', 'synapse'),
+            Label(Sort.RESPONSE, 'message_received', 'synapse', parameters=[
+                Parameter('session_token', Type.STRING),
+                Parameter('room_id', Type.STRING),
+                Parameter('sender', Type.STRING),
+                Parameter('message', Type.STRING)
+            ]),
+            Label(Sort.RESPONSE, 'invalid_create_room', 'synapse'),
+            Label(Sort.RESPONSE, 'invalid_join_room', 'synapse'),
+            Label(Sort.RESPONSE, 'invalid_invite', 'synapse'),
+            Label(Sort.RESPONSE, 'invalid_send_message', 'synapse'),
             Label(Sort.RESPONSE, 'shut_off', 'synapse')
         ]
 
@@ -107,50 +317,64 @@ class Handler(AbstractHandler):
             tipe=Type.STRING,
             description='Base URL for Matrix API',
             value='http://localhost:8008'
+        ), ConfigurationItem(
+            name='fixture_spec',
+            tipe=Type.STRING,
+            description='JSON spec of the users, rooms and messages seeded at every reset (empty: only Alice)',
+            value=''
+        ), ConfigurationItem(
+            name='registration_shared_secret',
+            tipe=Type.STRING,
+            description='Shared secret for registering the seeded users with the admin API (empty: regular registration)',
+            value=''
+        ), ConfigurationItem(
+            name='backend',
+            tipe=Type.STRING,
+            description='Lifecycle backend of Synapse: script (setup_homeserver.sh), docker (Docker Engine API), '
+                        'fake (in-process) or federation (several federating homeservers, the first one is tested)',
+            value='script'
+        ), ConfigurationItem(
+            name='homeservers',
+            tipe=Type.INTEGER,
+            description='Number of homeservers on consecutive ports when the backend is federation',
+            value=DEFAULT_SERVERS
+        ), ConfigurationItem(
+            name='reset_mode',
+            tipe=Type.STRING,
+            description='rebuild: rebuild the SUT at every reset; watchdog: undo the test case and keep the SUT until '
+                        'the health watchdog asks for a rebuild, or the test case registered users (needs the '
+                        'registration_shared_secret)',
+            value='rebuild'
+        ), ConfigurationItem(
+            name='watchdog_drift',
+            tipe=Type.DECIMAL,
+            description='Factor by which the latency of an endpoint may drift from its baseline before the SUT is rebuilt',
+            value=DEFAULT_DRIFT_THRESHOLD
+        ), ConfigurationItem(
+            name='transport',
+            tipe=Type.STRING,
+            description='Transport to Synapse: tcp (published port), uds (UNIX socket) or host (host networking)',
+            value='tcp'
+        ), ConfigurationItem(
+            name='socket_directory',
+            tipe=Type.STRING,
+            description='Host directory for the UNIX socket of Synapse when the transport is uds',
+            value='/tmp/synapse-sockets'
         )])
 
-    def _label2message(self, label: Label) -> tuple:
+    def _label2message(self, label: LabelView) -> tuple:
         """Returns (message_string, parameters_list)"""
+        route = self._routes.get(label.name)
+        if route is None:
+            raise ValueError(f'Unsupported stimulus: {label.name}')
+        return route(label)
 
-        if label.name == 'login':
-            username = label.parameters[0].value
-            password = label.parameters[1].value
-            status, response = login_user(PORT, username, password)
-
-            if status == 200 and "access_token" in response:
-                token = response["access_token"]
-                # Return both message and parameters for logged_in response
-                return "logged_in", [Parameter('session_token', Type.STRING, token)]
-            elif status == 403:
-                return "incorrect_login", None
-            else:
-                return "invalid_login", None
-
-        elif label.name == 'logout':
-            token = label.parameters[0].value
-            status, _ = logout_user(PORT, token)
-            if status == 200:
-                return "logged_out", None
-            else:
-                return "invalid_logout", None
-
-        elif label.name == 'register':
-            username = label.parameters[0].value
-            password = label.parameters[1].value
-            status, _ = register_user(PORT, username, password)
-            if status == 200:
-                return "user_registered", None
-            else:
-                return "invalid_register", None
-
-        return "shut_off", None
-
-    def _message2label(self, message: str, parameters=None):
+    def _message2label(self, message: str, parameters=None, timestamp_ns=None):
         return Label(
             sort=Sort.RESPONSE,
             name=message.lower(),
             parameters=parameters or [],
             channel='synapse',
             physical_label=bytes(message, 'UTF-8'),
-            timestamp=datetime.now()
+            timestamp=timestamp_ns or time.time_ns()
         )
@@ -0,0 +1,133 @@
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+from generic.api.label import Label, Sort
+from generic.api.parameter import Type, Parameter
+
+from ttAssignment1 import login_user, logout_user, register_user, create_room, join_room, invite_user, send_message
+
+
+class Route:
+    """
+    Declarative description of how a stimulus label is performed at the SUT.
+
+    Attributes:
+        call (callable): mock_client function called with the port and the bound parameters,
+            returning (status, response). None if the stimulus does not call the SUT.
+        parameters (tuple): Names of the label parameters passed to `call`, in order
+        responses (dict): HTTP status -> name of the response label
+        default (str): Name of the response label for any other status
+        response_parameters (dict): Name of a response label -> function building its
+            parameters from the response body. If the function returns None, the
+            `default` response label is sent instead.
+    """
+    __slots__ = ('call', 'parameters', 'responses', 'default', 'response_parameters')
+
+    def __init__(self, call: Callable, parameters: tuple = (), responses: Dict[int, str] = None,
+                 default: str = None, response_parameters: Dict[str, Callable] = None):
+        self.call = call
+        self.parameters = parameters
+        self.responses = responses or {}
+        self.default = default
+        self.response_parameters = response_parameters or {}
+
+    def response_labels(self) -> set:
+        return set(self.responses.values()) | {self.default}
+
+
+def _session_token(response: dict) -> Optional[List[Parameter]]:
+    if 'access_token' not in response:
+        return None
+    return [Parameter('session_token', Type.STRING, response['access_token'], validate=False)]
+
+
+def _room_id(response: dict) -> Optional[List[Parameter]]:
+    if 'room_id' not in response:
+        return None
+    return [Parameter('room_id', Type.STRING, response['room_id'], validate=False)]
+
+
+# Stimulus label name -> Route
+ROUTES = {
+    'register': Route(register_user, ('username', 'password'),
+                      {200: 'user_registered'}, 'invalid_register'),
+    'login': Route(login_user, ('username', 'password'),
+                   {200: 'logged_in', 403: 'incorrect_login'}, 'invalid_login',
+                   {'logged_in': _session_token}),
+    'logout': Route(logout_user, ('session_token',),
+                    {200: 'logged_out'}, 'invalid_logout'),
+    'create_room': Route(create_room, ('session_token', 'room_name'),
+                         {200: 'room_created'}, 'invalid_create_room',
+                         {'room_created': _room_id}),
+    'join_room': Route(join_room, ('session_token', 'room_id'),
+                       {200: 'room_joined'}, 'invalid_join_room'),
+    'invite_user': Route(invite_user, ('session_token', 'room_id', 'user_id'),
+                         {200: 'user_invited'}, 'invalid_invite'),
+    'send_message': Route(send_message, ('session_token', 'room_id', 'message'),
+                          {200: 'message_sent'}, 'invalid_send_message'),
+    'reset': Route(None, default='shut_off'),
+}
+
+
+def _compile_route(route: Route, port: int) -> Callable:
+    call = partial(route.call, port) if route.call else None
+    names = route.parameters
+    responses = route.responses
+    default = route.default
+    response_parameters = route.response_parameters
+
+    def perform(label) -> tuple:
+        if call is None:
+            return default, None
+
+        status, response = call(*[label.value_of(name) for name in names])
+
+        message = responses.get(status, default)
+        build = response_parameters.get(message)
+        if build is None:
+            return message, None
+
+        parameters = build(response)
+        if parameters is None:
+            return default, None
+        return message, parameters
+
+    return perform
+
+
+def compile_routes(routes: Dict[str, Route], supported_labels: List[Label], port: int) -> Dict[str, Callable]:
+    """
+    Compile the route table into a dispatch dictionary, validated against the supported labels.
+
+    Args:
+        routes ({str: Route}): Stimulus label name -> Route
+        supported_labels ([Label]): The labels supported by the handler
+        port (int): Port of the SUT
+
+    Returns:
+        {str: callable}: Stimulus label name -> function performing the stimulus, which
+            takes the label and returns (response label name, response parameters)
+    """
+    stimuli = {label.name: label for label in supported_labels if label.sort == Sort.STIMULUS}
+    responses = {label.name for label in supported_labels if label.sort == Sort.RESPONSE}
+
+    unrouted = stimuli.keys() - routes.keys()
+    if unrouted:
+        raise ValueError('No route for the stimuli: {names}'.format(names=', '.join(sorted(unrouted))))
+
+    for name, route in routes.items():
+        if name not in stimuli:
+            raise ValueError('Route for unsupported stimulus: {name}'.format(name=name))
+
+        label_parameters = {parameter.name for parameter in stimuli[name].parameters}
+        unknown = set(route.parameters) - label_parameters
+        if unknown:
+            raise ValueError('Route {name} binds unknown parameters: {params}'
+                             .format(name=name, params=', '.join(sorted(unknown))))
+
+        unsupported = route.response_labels() - responses
+        if unsupported:
+            raise ValueError('Route {name} maps to unsupported responses: {labels}'
+                             .format(name=name, labels=', '.join(sorted(unsupported))))
+
+    return {name: _compile_route(route, port) for name, route in routes.items()}
@@ -0,0 +1,145 @@
+import logging
+import socket
+import threading
+
+from typing import Callable
+
+from ttAssignment1 import get_sync, get_filter_id, new_connection, room_filter, whoami
+
+# How long (ms) Synapse holds a /sync request open while there are no new events.
+SYNC_TIMEOUT_MS = 5000
+
+# Seconds to wait before retrying after a failed /sync request.
+RETRY_DELAY = 1.0
+
+# Seconds a /sync request may take beyond its long-poll timeout.
+REQUEST_MARGIN = 30
+
+# Only the message timeline of joined rooms is needed: no member lists, state, presence
+# or account data, and only the event fields that are reported.
+SYNC_FILTER = room_filter(timeline_types=['m.room.message'], state_types=[],
+                          event_fields=['type', 'sender', 'content.body'])
+
+
+class SyncWorker:
+    """
+    Background long-poll of the /sync endpoint for a single logged-in session.
+    `start` establishes the position in the event stream (the `since` token) on the calling
+    thread, so every event that arrives after it returns is reported; the worker then tracks
+    the token, so every request only returns the events that arrived after the previous one,
+    and Synapse answers as soon as a new event is there.
+    The requests use a server-side filter (uploaded once per user), so Synapse only sends
+    and the worker only parses the message timelines.
+    New `m.room.message` events sent by other users are reported to `on_message`.
+
+    Attributes:
+        port (int): Port of the SUT
+        access_token (str): Access token of the session
+        on_message (callable): Called with (access_token, room_id, sender, body) for every received message
+    """
+
+    def __init__(self, port: int, access_token: str, on_message: Callable, timeout_ms: int = SYNC_TIMEOUT_MS):
+        self.port = port
+        self.access_token = access_token
+        self.on_message = on_message
+        self.timeout_ms = timeout_ms
+
+        self._user_id = None
+        self._filter_id = None
+        self._since = None
+
+        # The long-polls use a connection of their own, so `stop` can shut it down.
+        self._connection = new_connection(port, timeout=timeout_ms / 1000 + REQUEST_MARGIN)
+
+        # Held while reporting, so nothing is reported once `stop` returns.
+        self._report_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sync-worker', daemon=True)
+
+    def start(self):
+        """ Establish the position in the event stream, then long-poll in the background. """
+        try:
+            status, response = whoami(self.port, self.access_token)
+            self._user_id = response.get('user_id') if status == 200 else None
+            if self._user_id:
+                self._filter_id = get_filter_id(self.port, self.access_token, self._user_id, SYNC_FILTER)
+            self._since = self._initial_sync()
+        except Exception as e:
+            logging.warning('Establishing the sync position failed: %s', e)
+
+        self._thread.start()
+
+    def stop(self):
+        """ Stop reporting events and shut down the pending long-poll. """
+        with self._report_lock:
+            self._stopped.set()
+
+        sock = self._connection.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _initial_sync(self) -> str:
+        """ The `since` token of the current position in the event stream, or None if unknown. """
+        status, response = get_sync(self.port, self.access_token, timeout=0, filter=self._filter_id,
+                                    connection=self._connection)
+        if status != 200:
+            logging.warning('Initial sync failed with status %s', status)
+            return None
+        return response['next_batch']
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                try:
+                    if not self._poll():
+                        return
+                except Exception as e:
+                    if self._stopped.is_set():
+                        return
+                    # e.g. a timeout or a reset connection while Synapse is busy: reconnect and retry.
+                    logging.warning('Sync failed due to: %s, retrying', e)
+                    self._connection.close()
+                    self._stopped.wait(RETRY_DELAY)
+        finally:
+            self._connection.close()
+
+    def _poll(self) -> bool:
+        """ Long-poll once and report the new messages; returns whether to keep polling. """
+        if self._since is None:
+            # The position could not be established at start: events until now are not reported.
+            self._since = self._initial_sync()
+            if self._since is None:
+                self._stopped.wait(RETRY_DELAY)
+            return True
+
+        status, response = get_sync(self.port, self.access_token, since=self._since,
+                                    timeout=self.timeout_ms, filter=self._filter_id,
+                                    connection=self._connection)
+        if self._stopped.is_set():
+            return False
+
+        if status == 401:
+            logging.debug('Session logged out, stopping its sync worker')
+            return False
+        if status != 200:
+            logging.warning('Sync failed with status %s, retrying', status)
+            self._stopped.wait(RETRY_DELAY)
+            return True
+
+        self._report_messages(response, self._user_id)
+        self._since = response['next_batch']
+        return True
+
+    def _report_messages(self, response: dict, user_id: str):
+        for room_id, room in response.get('rooms', {}).get('join', {}).items():
+            for event in room.get('timeline', {}).get('events', []):
+                if event.get('type') != 'm.room.message' or event.get('sender') == user_id:
+                    continue
+                with self._report_lock:
+                    if self._stopped.is_set():
+                        return
+                    self.on_message(self.access_token, room_id, event['sender'],
+                                    event.get('content', {}).get('body', ''))
@@ -0,0 +1,158 @@
+import logging
+import statistics
+import threading
+import time
+
+from collections import deque
+
+from generic.util.metrics import metrics
+
+# Number of latencies kept per endpoint.
+WINDOW = 200
+
+# Number of latencies after a rebuild that make up the baseline of an endpoint, and the
+# number of recent latencies compared with it.
+BASELINE_SIZE = 20
+
+# Factor by which the recent median latency of an endpoint may exceed its baseline median.
+DEFAULT_DRIFT_THRESHOLD = 2.0
+
+# Drift below this many milliseconds is ignored, so fast endpoints do not trigger on noise.
+MIN_DRIFT_MS = 5.0
+
+# Seconds between probes, and the time without stimuli after which the SUT is considered idle.
+PROBE_INTERVAL = 5.0
+
+# Name of the probe in the latency windows.
+PROBE = 'probe'
+
+
+class HealthWatchdog:
+    """
+    Watches the health of the SUT over a long session. It keeps a rolling window of latencies
+    per endpoint (stimulus), fed by the handler, and in the background probes the SUT whenever
+    it is idle, i.e. between test cases. The first latencies after a rebuild are the baseline
+    of an endpoint. When the recent median of an endpoint drifts past `drift_threshold` times
+    its baseline, or a probe fails, a clean rebuild is scheduled; the handler performs it at
+    the next RESET. All decisions are logged and published as metrics.
+
+    Attributes:
+        backend (Backend): Lifecycle backend of the SUT, used for probing
+        drift_threshold (float): Allowed factor between the recent and the baseline median latency
+    """
+
+    def __init__(self, backend, drift_threshold: float = DEFAULT_DRIFT_THRESHOLD):
+        self.backend = backend
+        self.drift_threshold = drift_threshold
+
+        self._lock = threading.Lock()
+        self._latencies = {}  # endpoint -> deque of latencies (ms)
+        self._baselines = {}  # endpoint -> baseline median latency (ms)
+        self._rebuild_reason = None
+        self._last_activity = time.monotonic()
+        self._paused = False  # while the SUT is reset, see pause
+
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='watchdog', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def observe(self, endpoint: str, latency_ms: float):
+        """ Record the latency of a request to the SUT. """
+        metrics.observe('sut.latency.{endpoint}_ms'.format(endpoint=endpoint), latency_ms)
+        with self._lock:
+            if endpoint != PROBE:
+                self._last_activity = time.monotonic()
+
+            latencies = self._latencies.get(endpoint)
+            if latencies is None:
+                latencies = self._latencies[endpoint] = deque(maxlen=WINDOW)
+            latencies.append(latency_ms)
+
+            if endpoint not in self._baselines and len(latencies) == BASELINE_SIZE:
+                self._baselines[endpoint] = statistics.median(latencies)
+
+    def take_rebuild_reason(self) -> str:
+        """
+        The reason a rebuild was scheduled, if any; the schedule is cleared.
+
+        Returns:
+            str: The reason, or None if the SUT does not need a rebuild
+        """
+        with self._lock:
+            reason, self._rebuild_reason = self._rebuild_reason, None
+        return reason
+
+    def pause(self):
+        """ The SUT is being reset: stop probing and evaluating it until `resume`. """
+        with self._lock:
+            self._paused = True
+
+    def resume(self):
+        """ The SUT is ready again after a reset: watch it, once it has been idle for a probe interval. """
+        with self._lock:
+            self._paused = False
+            self._last_activity = time.monotonic()
+
+    def rebuilt(self):
+        """ The SUT was rebuilt: start over with new baselines. """
+        with self._lock:
+            self._latencies.clear()
+            self._baselines.clear()
+            self._rebuild_reason = None
+
+    def _run(self):
+        while not self._stopped.wait(PROBE_INTERVAL):
+            with self._lock:
+                if self._paused:
+                    continue
+                idle = time.monotonic() - self._last_activity >= PROBE_INTERVAL
+            if idle:
+                self._probe()
+            self._evaluate()
+
+    def _probe(self):
+        start = time.perf_counter()
+        healthy = self.backend.health()
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            if self._paused:
+                # A reset started while probing: the SUT may be restarting.
+                return
+        if healthy:
+            self.observe(PROBE, latency_ms)
+        else:
+            metrics.increment('watchdog.probe_failures')
+            self._schedule_rebuild('probe of the SUT failed')
+
+    def _evaluate(self):
+        """ Compare the recent latencies of every endpoint with its baseline. """
+        drifted = []
+        with self._lock:
+            for endpoint, baseline in self._baselines.items():
+                latencies = self._latencies[endpoint]
+                if len(latencies) < 2 * BASELINE_SIZE:
+                    continue
+
+                recent = statistics.median(list(latencies)[-BASELINE_SIZE:])
+                drift = recent / baseline if baseline else float('inf')
+                metrics.set_gauge('watchdog.drift.{endpoint}'.format(endpoint=endpoint), drift)
+                if drift > self.drift_threshold and recent - baseline > MIN_DRIFT_MS:
+                    drifted.append('{endpoint} {recent:.1f} ms vs {baseline:.1f} ms'
+                                   .format(endpoint=endpoint, recent=recent, baseline=baseline))
+
+        if drifted:
+            self._schedule_rebuild('latency drifted: ' + ', '.join(drifted))
+
+    def _schedule_rebuild(self, reason: str):
+        with self._lock:
+            if self._rebuild_reason is not None:
+                return
+            self._rebuild_reason = reason
+        metrics.increment('watchdog.rebuilds_scheduled')
+        logging.warning('Watchdog: scheduling a rebuild of the SUT at the next reset, %s', reason)
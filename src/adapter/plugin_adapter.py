@@ -1,14 +1,27 @@
 import argparse
+import atexit
 import logging
+import signal
 import socket
 
 from generic.adapter_core import AdapterCore
-from generic.broker_connection import BrokerConnection
+from generic.broker_connection import (BrokerConnection, DEFAULT_COMPRESSION_THRESHOLD, DEFAULT_PING_INTERVAL,
+                                       DEFAULT_PING_TIMEOUT)
+from generic.util.logging_util import setup_logging
+from generic.util.memory import memory_tracker, DEFAULT_ALERT_THRESHOLD
+from generic.util.metrics import metrics
+from generic.util.profiling import profiler
+from generic.util.tracing import tracer
 from matrix.handler import Handler
 
 ADAPTER_NAME = 'Matrix'
 
-def start_plugin_adapter(adapter_name: str, url: str, token: str, loglevel: int):
+def start_plugin_adapter(adapter_name: str, url: str, token: str, loglevel: int, log_json: bool = False,
+                         trace_file: str = None, profile_directory: str = None,
+                         memory_alert_threshold: int = None, metrics_file: str = None,
+                         compression_threshold: int = None, ping_interval: float = DEFAULT_PING_INTERVAL,
+                         ping_timeout: float = DEFAULT_PING_TIMEOUT, stimulus_workers: int = 1,
+                         max_reconnect_attempts: int = None):
     """
     Start the adapter and connect with AMP.
 
@@ -17,21 +30,47 @@ def start_plugin_adapter(adapter_name: str, url: str, token: str, loglevel: int)
         url (str): Url of the Axini Modeling Platform
         token (str): Token needed to authenticate with the Axini Modeling Platform
         loglevel (int): Loglevel constant
+        log_json (bool): Log structured JSON lines instead of plain text
+        trace_file (str): Record tracing spans and write them to this Chrome trace file at exit
+        profile_directory (str): Profile every test case and write the profiles to this directory
+        memory_alert_threshold (int): Track memory per test case and alert above this growth in bytes
+        metrics_file (str): Write the metrics as JSON to this file at exit
+        compression_threshold (int): Offer permessage-deflate to AMP and compress messages from this size in bytes
+        ping_interval (float): Seconds between pings to AMP, 0 to not ping
+        ping_timeout (float): Seconds without pong after which the connection with AMP is dropped and reopened
+        stimulus_workers (int): Number of threads performing stimuli, in parallel per session
+        max_reconnect_attempts (int): Stop after this many failed reconnections in a row, None to keep trying
     """
-    logging.basicConfig(
-        level=loglevel,
-        format='%(asctime)s-[%(levelname)8s] %(name)s::%(module)s|%(lineno)s:: %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    setup_logging(loglevel, structured=log_json)
 
-    broker_connection = BrokerConnection(url, token)
+    if trace_file:
+        tracer.enable()
+        atexit.register(tracer.export, trace_file)
+
+    # Profiling can also be toggled on a running adapter with SIGUSR1.
+    if profile_directory:
+        profiler.directory = profile_directory
+        profiler.enable()
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.toggle())
+
+    if memory_alert_threshold is not None:
+        memory_tracker.enable(memory_alert_threshold)
+
+    if metrics_file:
+        atexit.register(metrics.export, metrics_file)
+
+    broker_connection = BrokerConnection(url, token, compression_threshold, ping_interval, ping_timeout)
     handler = Handler()
 
-    adapter_core = AdapterCore(adapter_name, broker_connection, handler)
+    adapter_core = AdapterCore(adapter_name, broker_connection, handler, stimulus_workers, max_reconnect_attempts)
 
     broker_connection.register_adapter_core(adapter_core)
     handler.register_adapter_core(adapter_core)
 
+    # Shut down like on Ctrl-C: close the connection, end the reconnect loop and stop the SUT.
+    signal.signal(signal.SIGTERM, lambda signum, frame: adapter_core.stop())
+
     adapter_core.start()
 
 if __name__ == '__main__':
@@ -46,6 +85,41 @@ if __name__ == '__main__':
     parser.add_argument('-ll', '--log_level',
                         help='AMP Adapter logger level: ERROR, WARNING, INFO, DEBUG (default: INFO)',
                         required=False)
+    parser.add_argument('-lj', '--log_json', action='store_true',
+                        help='Log structured JSON lines instead of plain text (optional)')
+    parser.add_argument('--profile',
+                        help='Profile every test case and write the profiles to this directory (optional). '
+                             'Profiling can also be toggled with SIGUSR1',
+                        required=False)
+    parser.add_argument('--track_memory', nargs='?', type=int, const=DEFAULT_ALERT_THRESHOLD,
+                        help='Track memory growth per test case and alert above the given growth in bytes '
+                             '(optional, default threshold: {})'.format(DEFAULT_ALERT_THRESHOLD),
+                        required=False)
+    parser.add_argument('--metrics',
+                        help='Write the metrics as JSON to this file at exit (optional)',
+                        required=False)
+    parser.add_argument('--trace',
+                        help='Record tracing spans and write them at exit to this Chrome trace file (optional)',
+                        required=False)
+    parser.add_argument('--compress', nargs='?', type=int, const=DEFAULT_COMPRESSION_THRESHOLD,
+                        help='Offer permessage-deflate to AMP and compress messages from the given size in bytes '
+                             '(optional, default threshold: {})'.format(DEFAULT_COMPRESSION_THRESHOLD),
+                        required=False)
+    parser.add_argument('--ping_interval', type=float, default=DEFAULT_PING_INTERVAL,
+                        help='Ping AMP every given seconds, dropping and reopening the connection when a pong '
+                             'does not arrive in time (default: {}, no pings)'.format(DEFAULT_PING_INTERVAL),
+                        required=False)
+    parser.add_argument('--ping_timeout', type=float, default=DEFAULT_PING_TIMEOUT,
+                        help='Seconds without pong after which the connection with AMP is reopened '
+                             '(default: {})'.format(DEFAULT_PING_TIMEOUT),
+                        required=False)
+    parser.add_argument('--stimulus_workers', type=int, default=1,
+                        help='Perform stimuli of different sessions in parallel on this many threads (default: 1, '
+                             'in order)',
+                        required=False)
+    parser.add_argument('--max_reconnect_attempts', type=int,
+                        help='Stop after this many failed reconnections to AMP in a row (optional, default: keep trying)',
+                        required=False)
 
     args = parser.parse_args()
 
@@ -61,4 +135,7 @@ if __name__ == '__main__':
     else:
         log_level = args.log_level
 
-    start_plugin_adapter(name, args.url, args.token, log_level)
+    start_plugin_adapter(name, args.url, args.token, log_level, args.log_json, args.trace, args.profile,
+                         args.track_memory, args.metrics, args.compress,
+                         args.ping_interval, args.ping_timeout, args.stimulus_workers,
+                         args.max_reconnect_attempts)
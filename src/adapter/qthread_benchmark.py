@@ -0,0 +1,55 @@
+import argparse
+import json
+import time
+
+from generic.qthread import KeyedQThread, QThread
+
+### benchmark of the stimulus workers: throughput of a single QThread against a KeyedQThread
+### as the number of workers grows, for items that wait on the SUT like a stimulus does
+### usage: python qthread_benchmark.py --items 2000 --keys 32 --latency 2
+
+
+def run(workers: int, items: int, keys: int, latency_ms: float) -> dict:
+    def process(item):
+        time.sleep(latency_ms / 1000)  # the request to the SUT
+
+    if workers == 0:
+        qthread = QThread(process)
+        qthread.start()
+        start = time.perf_counter()
+        for index in range(items):
+            qthread.put(index)
+        qthread.queue.join()
+    else:
+        pool = KeyedQThread(process, workers)
+        pool.start()
+        start = time.perf_counter()
+        for index in range(items):
+            pool.put(index % keys, index)
+        pool.join()
+    duration = time.perf_counter() - start
+
+    return {'workers': workers or 'QThread', 'items': items, 'keys': keys, 'latency_ms': latency_ms,
+            'seconds': duration, 'items_per_second': items / duration}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark QThread against KeyedQThread')
+    parser.add_argument('-i', '--items', type=int, default=2000, help='items per run (default: 2000)')
+    parser.add_argument('-k', '--keys', type=int, default=32, help='distinct keys, e.g. sessions (default: 32)')
+    parser.add_argument('-l', '--latency', type=float, default=2.0,
+                        help='milliseconds an item waits on the SUT (default: 2)')
+    parser.add_argument('-w', '--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help='worker counts of the KeyedQThread (default: 1 2 4 8 16)')
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    for workers in [0] + args.workers:
+        result = run(workers, args.items, args.keys, args.latency)
+        results.append(result)
+        print('{workers!s:>8} {items_per_second:9.1f} items/s ({seconds:.2f} s)'.format(**result))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,99 @@
+import argparse
+import json
+import statistics
+import time
+
+from matrix.backends import BACKENDS, create_backend
+from matrix.fixtures import CaseChanges, FixtureLoader, parse_spec
+
+from ttAssignment1 import clear_filter_cache, close_connections, random_string, register_user_shared_secret
+
+### benchmark of the reset cost per lifecycle backend: provisioning, and per reset the time until
+### the SUT is back with its seeded world, rebuilt (reset_mode rebuild) or undone (reset_mode watchdog)
+### the script and docker backends need Docker, the fake backend runs in-process
+### usage: python reset_benchmark.py --backends fake docker --resets 10
+
+PORT = 8008
+
+SHARED_SECRET = 'benchmark'
+
+
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+def run(name: str, mode: str, resets: int, spec: dict, transport: str) -> dict:
+    backend = create_backend(name, PORT, transport=transport, shared_secret=SHARED_SECRET)
+    loader = FixtureLoader(PORT, SHARED_SECRET, existing_accounts=mode == 'undo', suffix=random_string(6))
+    try:
+        start = time.perf_counter()
+        backend.provision()
+        backend.wait_healthy()
+        provision_ms = _elapsed_ms(start)
+
+        fixtures = loader.load(spec)
+        _, response = register_user_shared_secret(PORT, 'adapter_admin_' + random_string(8), random_string(),
+                                                  SHARED_SECRET, admin=True)
+        admin_token = response['access_token']
+
+        reset_ms, seed_ms = [], []
+        for _ in range(resets):
+            start = time.perf_counter()
+            if mode == 'rebuild':
+                clear_filter_cache()
+                backend.reset()
+                backend.wait_healthy()
+                loader.suffix = random_string(6)
+                close_connections()
+            else:
+                loader.unload(fixtures, CaseChanges(), admin_token)
+            reset_ms.append(_elapsed_ms(start))
+
+            start = time.perf_counter()
+            fixtures = loader.load(spec)
+            seed_ms.append(_elapsed_ms(start))
+
+            if mode == 'rebuild':
+                _, response = register_user_shared_secret(PORT, 'adapter_admin_' + random_string(8), random_string(),
+                                                          SHARED_SECRET, admin=True)
+                admin_token = response['access_token']
+    finally:
+        backend.teardown()
+        close_connections()
+
+    return {'backend': name, 'mode': mode, 'resets': resets, 'provision_ms': provision_ms,
+            'reset_median_ms': statistics.median(reset_ms), 'reset_max_ms': max(reset_ms),
+            'seed_median_ms': statistics.median(seed_ms),
+            'total_median_ms': statistics.median(map(sum, zip(reset_ms, seed_ms)))}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the reset cost per lifecycle backend')
+    parser.add_argument('-b', '--backends', nargs='+', default=['fake', 'docker', 'script'], choices=BACKENDS,
+                        help='backends to compare (default: fake docker script)')
+    parser.add_argument('-m', '--modes', nargs='+', default=['rebuild', 'undo'], choices=('rebuild', 'undo'),
+                        help='how the SUT is reset (default: rebuild undo)')
+    parser.add_argument('-n', '--resets', type=int, default=10, help='resets per run (default: 10)')
+    parser.add_argument('-f', '--fixture_spec', default='', help='JSON fixture spec seeded at every reset '
+                                                                 '(default: only Alice)')
+    parser.add_argument('-t', '--transport', default='tcp', help='transport to the homeserver (default: tcp)')
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    spec = parse_spec(args.fixture_spec)
+    results = []
+    for name in args.backends:
+        for mode in args.modes:
+            try:
+                result = run(name, mode, args.resets, spec, args.transport)
+            except Exception as e:
+                print('{name:10} {mode:8} failed: {error}'.format(name=name, mode=mode, error=e))
+                continue
+            results.append(result)
+            print('{backend:10} {mode:8} provision {provision_ms:8.1f} ms, reset {reset_median_ms:8.1f} ms '
+                  '(max {reset_max_ms:8.1f} ms), seed {seed_median_ms:7.1f} ms, '
+                  'reset and seed {total_median_ms:8.1f} ms'.format(**result))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,230 @@
+from mock_client import *
+import argparse
+import json
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+### load generator: runs scripted scenarios against a homeserver with many concurrent users
+### usage: python load_generator.py --users 100 --rate 20 --workers 32 --output results.json
+### compare transports by running it once over TCP and once with --unix-socket (SYNAPSE_TRANSPORT=uds)
+### sync benchmark: payload size and latency of /sync with and without the filter of the adapter,
+### in one room with many members: python load_generator.py --sync-members 2000 --shared-secret <secret>
+
+ENDPOINTS = ["register", "login", "createRoom", "send", "messages", "logout"]
+
+# the filter of the sync workers of the adapter (matrix.sync.SYNC_FILTER)
+SYNC_FILTER = room_filter(timeline_types=["m.room.message"], state_types=[],
+                          event_fields=["type", "sender", "content.body"])
+
+
+def timed(samples, endpoint, fn, *args, **kwargs):
+    """ call a mock client function and record (endpoint, latency in ms, status) """
+    start = time.perf_counter()
+    try:
+        status, res = fn(*args, **kwargs)
+    except Exception as e:
+        status, res = 0, {"error": str(e)}
+    samples.append((endpoint, (time.perf_counter() - start) * 1000, status))
+    return status, res
+
+
+def run_scenario(port, messages):
+    """
+    register -> login -> createRoom -> send (x messages) -> messages -> logout
+    for one fresh user. stops at the first failing step.
+    """
+    samples = []
+    username = random_string()
+    password = random_string()
+
+    status, _ = timed(samples, "register", register_user, port, username, password)
+    if status != 200:
+        return samples
+
+    status, res = timed(samples, "login", login_user, port, username, password)
+    if status != 200:
+        return samples
+    token = res["access_token"]
+
+    status, res = timed(samples, "createRoom", create_room, port, token, name=f"load_{username}")
+    if status != 200:
+        return samples
+    room_id = res["room_id"]
+
+    for i in range(messages):
+        status, _ = timed(samples, "send", send_message, port, token, room_id, f"message {i} from {username}")
+        if status != 200:
+            return samples
+
+    status, _ = timed(samples, "messages", get_room_messages, port, token, room_id, limit=messages)
+    if status != 200:
+        return samples
+
+    timed(samples, "logout", logout_user, port, token)
+    return samples
+
+
+def percentile(ordered, fraction):
+    """ nearest-rank percentile of a sorted list """
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(samples, duration):
+    """ per endpoint: count, errors, throughput (req/s) and latency percentiles (ms) """
+    summary = {}
+    for endpoint in ENDPOINTS:
+        latencies = sorted(latency for name, latency, _ in samples if name == endpoint)
+        if not latencies:
+            continue
+        errors = sum(1 for name, _, status in samples if name == endpoint and status != 200)
+        summary[endpoint] = {
+            "count": len(latencies),
+            "errors": errors,
+            "throughput": len(latencies) / duration,
+            "mean": sum(latencies) / len(latencies),
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+        }
+    return summary
+
+
+def run_load(port, users, rate, workers, messages, processes=False):
+    """
+    start `users` scenarios with poisson arrivals at `rate` users per second (0 = all at once)
+    on a pool of `workers` threads (or processes). returns (samples, duration in seconds).
+    """
+    pool_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    samples = []
+
+    start = time.perf_counter()
+    with pool_class(max_workers=workers) as pool:
+        futures = []
+        for _ in range(users):
+            futures.append(pool.submit(run_scenario, port, messages))
+            if rate > 0:
+                time.sleep(random.expovariate(rate))
+        for future in futures:
+            samples.extend(future.result())
+
+    return samples, time.perf_counter() - start
+
+
+def register_member(port, shared_secret):
+    """ a fresh user, registered with the admin API if the shared secret is known; returns (user id, token) """
+    username = random_string()
+    if shared_secret:
+        status, res = register_user_shared_secret(port, username, random_string(), shared_secret)
+    else:
+        status, res = register_user(port, username, random_string())
+    if status != 200:
+        raise RuntimeError(f"registering a member failed with status {status}: {res.get('error')}")
+    return res["user_id"], res["access_token"]
+
+
+def timed_sync(port, token, since=None, filter=None):
+    """ one /sync: (latency in ms, size of the JSON payload in bytes, next batch token) """
+    start = time.perf_counter()
+    status, res = get_sync(port, token, since=since, filter=filter)
+    latency = (time.perf_counter() - start) * 1000
+    if status != 200:
+        raise RuntimeError(f"sync failed with status {status}: {res.get('error')}")
+    return latency, len(json.dumps(res, separators=(",", ":"))), res["next_batch"]
+
+
+def run_sync_benchmark(port, members, rounds, workers, shared_secret=None):
+    """
+    one room with `members` joined users; one of them syncs with and without the filter:
+    an initial sync, and `rounds` incremental syncs after a message is sent to the room.
+    returns per variant the median latency (ms) and payload size (bytes) of both kinds of sync.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        users = list(pool.map(lambda _: register_member(port, shared_secret), range(members)))
+        (user_id, token), others = users[0], users[1:]
+
+        status, res = create_room(port, token, name=f"sync_{random_string(6)}")
+        if status != 200:
+            raise RuntimeError(f"creating the room failed with status {status}: {res.get('error')}")
+        room_id = res["room_id"]
+        joined = pool.map(lambda user: join_room(port, user[1], room_id)[0], others)
+        if any(status != 200 for status in joined):
+            raise RuntimeError("not every member could join the room")
+
+    variants = {"unfiltered": None, "filtered": get_filter_id(port, token, user_id, SYNC_FILTER)}
+    results = {}
+    for variant, filter_id in variants.items():
+        initial_latency, initial_bytes, since = timed_sync(port, token, filter=filter_id)
+
+        latencies, sizes = [], []
+        for i in range(rounds):
+            sender = others[i % len(others)][1] if others else token
+            send_message(port, sender, room_id, f"message {i}")
+            latency, size, since = timed_sync(port, token, since=since, filter=filter_id)
+            latencies.append(latency)
+            sizes.append(size)
+
+        results[variant] = {
+            "initial_ms": initial_latency,
+            "initial_bytes": initial_bytes,
+            "incremental_ms": percentile(sorted(latencies), 0.50),
+            "incremental_bytes": percentile(sorted(sizes), 0.50),
+        }
+    return results
+
+
+def print_sync_results(results, members):
+    print(f"one room with {members} members, medians of the incremental syncs")
+    print(f"{'variant':<12}{'initial ms':>12}{'initial B':>12}{'incr. ms':>12}{'incr. B':>12}")
+    for variant, stats in results.items():
+        print(f"{variant:<12}{stats['initial_ms']:>12.1f}{stats['initial_bytes']:>12}"
+              f"{stats['incremental_ms']:>12.1f}{stats['incremental_bytes']:>12}")
+
+
+def print_summary(summary, duration):
+    print(f"{'endpoint':<12}{'count':>8}{'errors':>8}{'req/s':>10}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for endpoint, stats in summary.items():
+        print(f"{endpoint:<12}{stats['count']:>8}{stats['errors']:>8}{stats['throughput']:>10.1f}"
+              f"{stats['mean']:>10.1f}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}")
+    print(f"total duration: {duration:.2f} s (latencies in ms)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="generate load on a Synapse homeserver")
+    parser.add_argument("-p", "--port", type=int, default=8008, help="port of the homeserver (default: 8008)")
+    parser.add_argument("-u", "--users", type=int, default=50, help="number of scenarios/users (default: 50)")
+    parser.add_argument("-r", "--rate", type=float, default=10.0,
+                        help="arrival rate in users per second, 0 = all at once (default: 10)")
+    parser.add_argument("-w", "--workers", type=int, default=16, help="size of the worker pool (default: 16)")
+    parser.add_argument("-m", "--messages", type=int, default=5, help="messages sent per user (default: 5)")
+    parser.add_argument("--processes", action="store_true", help="use a process pool instead of threads")
+    parser.add_argument("-o", "--output", help="save the results as JSON to this file")
+    parser.add_argument("-s", "--unix-socket", help="send the requests over this UNIX socket of the homeserver")
+    parser.add_argument("--sync-members", type=int, default=0,
+                        help="benchmark /sync with and without the filter in a room with this many members "
+                             "instead of generating load (default: 0)")
+    parser.add_argument("--sync-rounds", type=int, default=20,
+                        help="incremental syncs per variant of the sync benchmark (default: 20)")
+    parser.add_argument("--shared-secret", help="registration_shared_secret of the homeserver, "
+                                                "to register the members of the sync benchmark without rate limits")
+    args = parser.parse_args()
+
+    if args.unix_socket:
+        use_unix_socket(args.port, args.unix_socket)
+
+    if args.sync_members:
+        results = run_sync_benchmark(args.port, args.sync_members, args.sync_rounds, args.workers,
+                                     args.shared_secret)
+        print_sync_results(results, args.sync_members)
+        report = {"sync": results}
+    else:
+        samples, duration = run_load(args.port, args.users, args.rate, args.workers, args.messages, args.processes)
+        summary = summarize(samples, duration)
+        print_summary(summary, duration)
+        report = {"duration": duration, "endpoints": summary}
+
+    if args.output:
+        config = {key: value for key, value in vars(args).items() if key != "shared_secret"}
+        with open(args.output, "w") as f:
+            json.dump({"config": config, **report}, f, indent=2)
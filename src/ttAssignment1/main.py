@@ -1,10 +1,22 @@
 from mock_client import *
+import argparse
 import sys
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 port1 = 8008
 port2 = 8009
 password = "0000"
 
+### every test is an independent unit: it creates its own random users and rooms,
+### so the tests can run concurrently on a worker pool against the same homeserver.
+### usage: python main.py --workers 8
+
+# result of one test: group and number identify it, line is the printed description
+TestResult = namedtuple("TestResult", ["group", "number", "line", "passed", "error", "duration"])
+
     ### wrappers for mock client functions for easier use
 def ep_registration(x):
     return register_user(port1, x, password)
@@ -13,128 +25,195 @@ def ep_login(x):
 def main_send_message(sender_token, receiver_token, room_id, msg):
     return send_message(port1, sender_token, room_id, msg), get_room_messages(port1, receiver_token, room_id, limit=5)
 
-if __name__ == "__main__":
+
+# ------------------------------------------------------------
+# 6 EP tests for registration
+# ------------------------------------------------------------
+
+def registration_non_string():
+    # (2,5,7): not string
+    status, res = ep_registration(1234)
+    assert status == 400
+    assert res["error"] == 'Invalid username'
+
+def registration_valid():
+    # (1,3,5,7): valid unique username
+    status, res = ep_registration(unique_username(port1))
+    assert status == 200
+
+def registration_invalid_character():
+    # (1,4,5,7): invalid char
+    status, res = ep_registration(unique_username(port1) + "$")
+    assert status == 400
+    assert res["error"] == "User ID can only contain characters a-z, 0-9, or '=_-./+'"
+
+def registration_empty():
+    # (1,5,8): empty string
+    status, res = ep_registration("")
+    assert status == 400
+    assert res["error"] == 'User ID cannot be empty'
+
+def registration_none():
+    # (6): None
+    status, res = ep_registration(None)
+    assert status == 400
+    assert "Invalid username" in res["error"]
+
+def registration_too_long():
+    # (1,3,5,9): >255 chars
+    status, res = ep_registration("a" * 256)
+    assert status == 400
+    assert res["error"] == 'User ID may not be longer than 255 characters'
+
+
+# ------------------------------------------------------------
+# 4 EP tests for login
+# ------------------------------------------------------------
+
+def login_non_string():
+    # (2,5): not string
+    status, res = ep_login(1234)
+    assert status == 500
+    assert res["error"] == 'Internal server error'
+
+def login_valid():
+    # (1,3,5): valid username, registered by this test only
+    username = unique_username(port1)
+    status, res = ep_registration(username)
+    assert status == 200
+    status, res = ep_login(username)
+    assert status == 200
+
+def login_unregistered():
+    # (1,4,5): valid format, unregistered
+    status, res = ep_login(unique_username(port1))
+    assert status == 403
+    assert res["error"] == 'Invalid username or password'
+
+def login_none():
+    # (6): None
+    status, res = ep_login(None)
+    assert status == 400
+    assert res["error"] == "User identifier is missing 'user' key"
+
+
+# ------------------------------------------------------------
+# 2 tests for messaging
+# ------------------------------------------------------------
+
+def shared_room():
+    """ register two fresh users, user1 creates a room and invites user2, who joins """
+    status, user1 = register_user(port1, unique_username(port1), password)
+    assert status == 200
+    status, user2 = register_user(port1, unique_username(port1), password)
+    assert status == 200
+
+    status, room = create_room(port1, user1["access_token"], name="ep_test_room")
+    assert status == 200
+    room_id = room["room_id"]
+    invite_user(port1, user1["access_token"], room_id, user2["user_id"])
+    join_room(port1, user2["access_token"], room_id)
+    return user1, user2, room_id
+
+def messaging_user1_to_user2():
+    # case 1: user1 sends message -> user2 receives
+    user1, user2, room_id = shared_room()
+    send_res, recv_res = main_send_message(user1["access_token"], user2["access_token"], room_id, "Hello from user1!")
+    assert 200 in send_res
+    assert 200 in recv_res
+
+def messaging_user2_to_user1():
+    # case 2: user2 sends message -> user1 receives
+    user1, user2, room_id = shared_room()
+    send_res, recv_res = main_send_message(user2["access_token"], user1["access_token"], room_id, "Hello back from user2!")
+    assert 200 in send_res
+    assert 200 in recv_res
+
+
+# group -> [(test, printed line)], in the order of the report
+TESTS = {
+    "registration": [
+        (registration_non_string, "   > registration test 1 passed (non-string input)"),
+        (registration_valid, "   > registration test 2 passed (valid username)"),
+        (registration_invalid_character, "   > registration test 3 passed (invalid character)"),
+        (registration_empty, "   > registration test 4 passed (empty username)"),
+        (registration_none, "   > registration test 5 passed (None as username)"),
+        (registration_too_long, "   > registration test 6 passed (too long username)"),
+    ],
+    "login": [
+        (login_non_string, "   > login test 1 passed (non-string input)"),
+        (login_valid, "   > login test 2 passed (valid user)"),
+        (login_unregistered, "   > login test 3 passed (unregistered user)"),
+        (login_none, "   > login test 4 passed (None as username)"),
+    ],
+    "messaging": [
+        (messaging_user1_to_user2, "  > messaging test 1 passed (user1→user2)"),
+        (messaging_user2_to_user1, "  > messaging test 2 passed (user2→user1)"),
+    ],
+}
+
+# group -> summary line printed when all tests of the group passed
+SUMMARIES = {
+    "registration": "All 6 registration API tests passed!\n",
+    "login": "All 4 login API tests passed!\n",
+    "messaging": "All messaging tests passed!",
+}
+
+
+def run_test(group, number, test, line):
+    """ run a single test and record its outcome and duration (s) """
+    start = time.perf_counter()
     try:
-        sys.stdout = open("test_result_log.txt", "w")
-        
-        # ------------------------------------------------------------
-        # 6 EP tests for registration
-        # ------------------------------------------------------------
-
-        # (2,5,7): not string
-        x = 1234
-        status, res = ep_registration(x)
-        assert status == 400
-        assert res["error"] == 'Invalid username'
-        print("   > registration test 1 passed (non-string input)")
-
-        # (1,3,5,7): valid unique username
-        x = unique_username(port1)
-        status, res = ep_registration(x)
-        assert status == 200
-        print("   > registration test 2 passed (valid username)")
-
-        # (1,4,5,7): invalid char
-        x = x + "$"
-        status, res = ep_registration(x)
-        assert status == 400
-        assert res["error"] == "User ID can only contain characters a-z, 0-9, or '=_-./+'"
-        print("   > registration test 3 passed (invalid character)")
-
-        # (1,5,8): empty string
-        x = ""
-        status, res = ep_registration(x)
-        assert status == 400
-        assert res["error"] == 'User ID cannot be empty'
-        print("   > registration test 4 passed (empty username)")
-    
-         # (6): None
-        x = None
-        status, res = ep_registration(x)
-        assert status == 400
-        assert "Invalid username" in res["error"]
-        print("   > registration test 5 passed (None as username)")
-
-        # (1,3,5,9): >255 chars
-        x = "a" * 256
-        status, res = ep_registration(x)
-        assert status == 400
-        assert res["error"] == 'User ID may not be longer than 255 characters'
-        print("   > registration test 6 passed (too long username)")
-
-        print("All 6 registration API tests passed!\n")
-
-        # ------------------------------------------------------------
-        # 4 EP tests for login
-        # ------------------------------------------------------------   
-             
-        username = "alice"
-        if not check_user_exists(port1, username):
-            register_user(port1, username, password)
-
-        # (2,5): not string
-        x = 1234
-        status, res= ep_login(x)
-        assert status == 500
-        assert res["error"] == 'Internal server error'
-        print("   > login test 1 passed (non-string input)")
-
-        # (1,3,5): valid username
-        x = "alice"
-        status, res = ep_login(x)
-        assert status == 200
-        print("   > login test 2 passed (valid user)")
-
-        # (1,4,5): valid format, unregistered
-        x = unique_username(port1)
-        status, res = ep_login(x)
-        assert status == 403
-        assert res["error"] == 'Invalid username or password'
-        print("   > login test 3 passed (unregistered user)")
-
-        # (6): None
-        x = None
-        status, res = ep_login(x)
-        assert status == 400
-        assert res["error"] == "User identifier is missing 'user' key"
-        print("   > login test 4 passed (None as username)")
-
-        print("All 4 login API tests passed!\n")
-
-        # ------------------------------------------------------------
-        # 2 tests for messaging
-        # ------------------------------------------------------------
-
-        # create two valid users
-        status, user1 = register_user(port1, unique_username(port1), password)
-        assert status == 200
-        status, user2 = register_user(port1, unique_username(port1), password)
-        assert status == 200
-
-        # user1 creates room and invites user2
-        status, room = create_room(port1, user1["access_token"], name="ep_test_room")
-        room_id = room["room_id"]
-        invite_user(port1, user1["access_token"], room_id, user2["user_id"])
-        join_room(port1, user2["access_token"], room_id)
-
-        # case 1: user1 sends message -> user2 receives
-        msg1 = "Hello from user1!"
-        send_res, recv_res = main_send_message(user1["access_token"], user2["access_token"], room_id, msg1)
-        assert 200 in send_res
-        assert 200 in recv_res
-        print("  > messaging test 1 passed (user1→user2)")
-
-        # case 2: user2 sends message -> user1 receives
-        msg2 = "Hello back from user2!"
-        send_res, recv_res = main_send_message(user2["access_token"], user1["access_token"], room_id, msg2)
-        assert 200 in send_res
-        assert 200 in recv_res
-        print("  > messaging test 2 passed (user2→user1)")
-
-        print("All messaging tests passed!")
-
-    ###Print results from log file
-    finally:
-        sys.stdout.close()
-        sys.stdout = sys.__stdout__
-        print(open("test_result_log.txt").read())
+        test()
+        passed, error = True, None
+    except Exception as e:
+        passed, error = False, traceback.format_exception_only(type(e), e)[-1].strip()
+    return TestResult(group, number, line, passed, error, time.perf_counter() - start)
+
+
+def run_tests(workers):
+    """ run all tests on a pool of `workers` threads, returns the results in report order """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_test, group, number, test, line)
+                   for group, tests in TESTS.items()
+                   for number, (test, line) in enumerate(tests, 1)]
+        return [future.result() for future in futures]
+
+
+def report(results):
+    """ the report lines: one per test and a summary per group """
+    lines = []
+    for group, tests in TESTS.items():
+        group_results = [result for result in results if result.group == group]
+        for result in group_results:
+            if result.passed:
+                lines.append(result.line)
+            else:
+                lines.append(result.line.replace(" passed ", " FAILED ") + f": {result.error}")
+
+        passed = sum(result.passed for result in group_results)
+        if passed == len(tests):
+            lines.append(SUMMARIES[group])
+        else:
+            lines.append(f"{passed} of {len(tests)} {group} tests passed!\n")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="run the EP tests against a Synapse homeserver")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="size of the worker pool (default: 8)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run_tests(args.workers)
+    duration = time.perf_counter() - start
+
+    lines = report(results)
+    with open("test_result_log.txt", "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+    print("\n".join(lines))
+    print(f"ran {len(results)} tests in {duration:.2f} s on {args.workers} workers "
+          f"(slowest: {max(result.duration for result in results):.2f} s)")
+
+    sys.exit(0 if all(result.passed for result in results) else 1)
@@ -1,26 +1,142 @@
+import hashlib
+import hmac
 import http.client
 import json
+import socket
+import threading
+import time
 import uuid
 import random
+import select
+from urllib.parse import quote
 
 HOST = "localhost"
 BASE_PATH = "/_matrix/client/v3"
+ADMIN_PATH = "/_synapse/admin/v1"
+
+# per thread: the moment (time.time_ns) the last response arrived
+_last_response = threading.local()
+
+# per thread: port -> keep-alive connection, reused by all requests of that thread
+_connections = threading.local()
+
+# raised when a reused keep-alive connection turns out to be closed by the server
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+# methods which may be sent again when the server dropped the connection: sending them twice
+# has the same effect as once (the PUT of a message carries its own transaction id)
+_IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "PUT", "DELETE"))
+
+# port -> path of the UNIX socket the homeserver of that port listens on (see use_unix_socket)
+_unix_sockets = {}
 
 
 #-----------------------------------------------------------------------------#
 
-def _send_request(port, method, path, body=None, headers=None):
-    """ internal helper to send HTTP requests """
-    conn = http.client.HTTPConnection(HOST, port)
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """ HTTP connection over a UNIX domain socket instead of TCP """
+
+    def __init__(self, path, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        super().__init__(HOST, timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def use_unix_socket(port, path):
+    """
+    send the requests for the homeserver of this port over the UNIX socket at path,
+    or over TCP again if path is None
+    """
+    if path:
+        _unix_sockets[port] = path
+    else:
+        _unix_sockets.pop(port, None)
+
+
+def new_connection(port, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+    """ a new connection to the homeserver of the port, over its UNIX socket if one is registered """
+    path = _unix_sockets.get(port)
+    if path:
+        return UnixHTTPConnection(path, timeout=timeout)
+    return http.client.HTTPConnection(HOST, port, timeout=timeout)
+
+
+def _connection(port):
+    """ the keep-alive connection of this thread to the port, opened on first use """
+    pool = getattr(_connections, "pool", None)
+    if pool is None:
+        pool = _connections.pool = {}
+    conn = pool.get(port)
+    if conn is None or getattr(conn, "path", None) != _unix_sockets.get(port):
+        if conn is not None:
+            conn.close()
+        conn = pool[port] = new_connection(port)
+    return conn
+
+
+def close_connections():
+    """ close the keep-alive connections of this thread """
+    pool = getattr(_connections, "pool", {})
+    for conn in pool.values():
+        conn.close()
+    pool.clear()
+
+
+def _is_dropped(conn):
+    """ whether the server closed the idle connection: a kept-alive socket is only readable then """
+    readable, _, _ = select.select([conn.sock], [], [], 0)
+    return bool(readable)
+
+
+def _send_request(port, method, path, body=None, headers=None, connection=None):
+    """
+    internal helper to send HTTP requests over the keep-alive connection of this thread,
+    or over the given connection (e.g. one another thread may shut down)
+    """
     payload = json.dumps(body) if body else None
     headers = headers or {"Content-Type": "application/json"}
-    conn.request(method, path, payload, headers)
-    res = conn.getresponse()
+
+    conn = connection or _connection(port)
+    reused = conn.sock is not None and connection is None
+    if reused and method not in _IDEMPOTENT_METHODS and _is_dropped(conn):
+        # it can not be sent again if the connection turns out to be closed, so open a fresh one
+        conn.close()
+        reused = False
+    try:
+        conn.request(method, path, payload, headers)
+        res = conn.getresponse()
+    except _STALE_CONNECTION_ERRORS:
+        conn.close()
+        if not reused or method not in _IDEMPOTENT_METHODS:
+            raise
+        # the server closed the idle connection: no response was received, so send it again
+        conn.request(method, path, payload, headers)
+        res = conn.getresponse()
+    except Exception:
+        conn.close()
+        raise
+
+    _last_response.time_ns = time.time_ns()
     data = res.read()
-    conn.close()
+    if res.will_close:
+        conn.close()
 
     return res.status, json.loads(data)
 
+def last_response_time_ns():
+    """time (ns since the epoch) at which the last response of this thread arrived, or 0"""
+    return getattr(_last_response, "time_ns", 0)
+
 def random_string(length=20):
     """generate a random lowercase string for temporary usernames or passwords"""
     letters = "abcdefghijklmnopqrstuvwxyz"
@@ -32,6 +148,16 @@ def unique_username(port):
     while (check_user_exists(port, username)):
         username = random_string()
     return username
+
+
+def fixture_username(prefix, index, suffix):
+    """
+    username of the index-th generated user, without asking the server whether it is available:
+    names differ by index, and the suffix (e.g. random_string(6), drawn once per batch) keeps
+    them apart from the users of earlier batches
+    """
+    return f"{prefix}{index}_{suffix}"
+
 #---------------------- authentication API -------------------------------------#
 
 def register_user(port, username, password):
@@ -47,6 +173,30 @@ def register_user(port, username, password):
     return _send_request(port, "POST", f"{BASE_PATH}/register", payload)
 
 
+def register_user_shared_secret(port, username, password, shared_secret, admin=False):
+    """
+    register a new Matrix user with the admin API, authenticated by the registration_shared_secret
+    of the homeserver. this skips the registration rate limits and user-interactive auth.
+    """
+    status, res = _send_request(port, "GET", f"{ADMIN_PATH}/register")
+    if status != 200:
+        return status, res
+    nonce = res["nonce"]
+
+    mac = hmac.new(shared_secret.encode("utf8"), digestmod=hashlib.sha1)
+    mac.update(b"\x00".join([nonce.encode("utf8"), username.encode("utf8"), password.encode("utf8"),
+                             b"admin" if admin else b"notadmin"]))
+
+    payload = {
+        "nonce": nonce,
+        "username": username,
+        "password": password,
+        "admin": admin,
+        "mac": mac.hexdigest()
+    }
+    return _send_request(port, "POST", f"{ADMIN_PATH}/register", payload)
+
+
 def login_user(port, username, password):
     """
     log in with username/password.
@@ -82,27 +232,113 @@ def logout_user(port, access_token):
     return _send_request(port, "POST", f"{BASE_PATH}/logout", headers=headers)
 
 
+def whoami(port, access_token):
+    """
+    get the user id of the session
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
+    return _send_request(port, "GET", f"{BASE_PATH}/account/whoami", headers=headers)
+
+
 def check_user_exists(port: int, username: str):
-    conn = http.client.HTTPConnection(host=HOST, port=port)
-    path = f"{BASE_PATH}/register/available?username={username}"
-    conn.request("GET", path)
-    res = conn.getresponse()
-    return res.status!= 200
+    status, _ = _send_request(port, "GET", f"{BASE_PATH}/register/available?username={username}")
+    return status != 200
 
 #------------------------ sync API -----------------------------------------#
 
-def get_sync(port, access_token, since=None, full_state=False):
+def get_sync(port, access_token, since=None, full_state=False, timeout=0, filter=None, connection=None):
     """
     perform a /sync call to fetch rooms and messages.
+    timeout (ms) > 0 long-polls: the server waits that long for new events.
+    filter is the id of an uploaded filter (see get_filter_id) or an inline filter dict.
+    connection is the connection to send it over (see new_connection), the keep-alive
+    connection of this thread if None.
     """
-    path = f"{BASE_PATH}/sync?timeout=0"
+    path = f"{BASE_PATH}/sync?timeout={timeout}"
     if since:
         path += f"&since={since}"
     if full_state:
         path += "&full_state=true"
+    if filter:
+        if isinstance(filter, dict):
+            filter = json.dumps(filter, separators=(",", ":"))
+        path += f"&filter={quote(filter)}"
 
     headers = {"Authorization": f"Bearer {access_token}"}
-    return _send_request(port, "GET", path, headers=headers)
+    return _send_request(port, "GET", path, headers=headers, connection=connection)
+
+
+#------------------------ filters ------------------------------------------#
+
+# (port, user id, filter json) -> id of the uploaded filter
+_filter_ids = {}
+_filter_lock = threading.Lock()
+
+
+def room_filter(timeline_types=None, timeline_limit=None, lazy_load_members=True, state_types=None,
+                rooms=None, event_fields=None):
+    """
+    build a sync filter that only returns the room data a caller needs:
+    lazy loaded members, a type restricted timeline, only the given rooms and event fields,
+    and no presence or account data. None means no restriction.
+    """
+    timeline = {}
+    if timeline_types is not None:
+        timeline["types"] = timeline_types
+    if timeline_limit is not None:
+        timeline["limit"] = timeline_limit
+
+    state = {"lazy_load_members": lazy_load_members}
+    if state_types is not None:
+        state["types"] = state_types
+
+    room = {"timeline": timeline, "state": state, "account_data": {"types": []}, "ephemeral": {"types": []}}
+    if rooms is not None:
+        room["rooms"] = rooms
+
+    definition = {"room": room, "presence": {"types": []}, "account_data": {"types": []}}
+    if event_fields is not None:
+        definition["event_fields"] = event_fields
+    return definition
+
+
+def create_filter(port, access_token, user_id, definition):
+    """
+    upload a filter for the user
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {access_token}"
+    }
+    return _send_request(port, "POST", f"{BASE_PATH}/user/{quote(user_id)}/filter", definition, headers)
+
+
+def get_filter_id(port, access_token, user_id, definition):
+    """
+    id of the filter for the user; every distinct filter is only uploaded once per user.
+    returns None if the filter could not be uploaded.
+    """
+    key = (port, user_id, json.dumps(definition, sort_keys=True))
+    with _filter_lock:
+        filter_id = _filter_ids.get(key)
+    if filter_id:
+        return filter_id
+
+    status, res = create_filter(port, access_token, user_id, definition)
+    if status != 200:
+        return None
+
+    with _filter_lock:
+        _filter_ids[key] = res["filter_id"]
+    return res["filter_id"]
+
+
+def clear_filter_cache():
+    """
+    forget the uploaded filters, e.g. after the homeserver was reset
+    """
+    with _filter_lock:
+        _filter_ids.clear()
 
 
 #------------------------------- rooms -------------------------------------#
@@ -204,3 +440,18 @@ def send_message(port, access_token, room_id, message):
         "Authorization": f"Bearer {access_token}"
     }
     return _send_request(port, "PUT", path, payload, headers)
+
+
+#---------------------- admin API -------------------------------------#
+
+def delete_room(port, access_token, room_id, purge=True):
+    """
+    delete a room with the admin API: its members are removed and, if purge, its history is
+    deleted from the database. access_token must be the one of a server admin.
+    """
+    path = f"{ADMIN_PATH}/rooms/{quote(room_id)}"
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {access_token}"
+    }
+    return _send_request(port, "DELETE", path, {"purge": purge}, headers)
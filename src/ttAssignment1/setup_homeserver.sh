@@ -9,6 +9,13 @@ setup_synapse_homeserver() {
     VOLNAME="synapse${ID}-data"
     CONTAINER_NAME="synapse${ID}"
 
+    # transport between the adapter and Synapse (SYNAPSE_TRANSPORT):
+    #   tcp  - published port, through the docker-proxy (default)
+    #   uds  - additionally a client listener on a UNIX socket, bind mounted at $SOCKET_DIR/synapse.sock
+    #   host - host networking, Synapse listens on the host's port 8008 directly
+    TRANSPORT="${SYNAPSE_TRANSPORT:-tcp}"
+    SOCKET_DIR="${SYNAPSE_SOCKET_DIR:-/tmp/synapse-sockets}/synapse${ID}"
+
     #remove volume if exists (self contained testing environment)
     docker rm -f "$CONTAINER_NAME"
     docker volume rm -f "$VOLNAME"
@@ -45,15 +52,78 @@ rc_registration:
   burst_count: 1000
 EOF"
 
+    # known registration secret, so fixtures can be seeded with the admin registration API
+    if [ -n "$REGISTRATION_SHARED_SECRET" ]; then
+        docker run --rm \
+        -v "$(docker volume inspect --format '{{.Mountpoint}}' "$VOLNAME")":/data \
+        -e SECRET="$REGISTRATION_SHARED_SECRET" \
+        alpine sh -c 'sed -i "s/^registration_shared_secret:.*/registration_shared_secret: \"$SECRET\"/" /data/homeserver.yaml'
+    fi
+
+    case "$TRANSPORT" in
+        tcp)
+            NETWORK_ARGS=(-p "${PORT}:8008")
+            ;;
+        uds)
+            mkdir -p "$SOCKET_DIR"
+            rm -f "$SOCKET_DIR/synapse.sock"
+            NETWORK_ARGS=(-p "${PORT}:8008" -v "${SOCKET_DIR}:/sockets")
+
+            # replaces the generated listeners block in place by the TCP listener plus one on the UNIX socket;
+            # a second listeners key appended to the file only works with loaders where the last duplicate wins
+            docker run --rm -i \
+            -v "$(docker volume inspect --format '{{.Mountpoint}}' "$VOLNAME")":/data \
+            -e LISTENERS="
+  - port: 8008
+    tls: false
+    type: http
+    x_forwarded: true
+    resources:
+      - names: [client, federation]
+        compress: false
+  - path: /sockets/synapse.sock
+    mode: 0666
+    type: http
+    resources:
+      - names: [client]
+        compress: false
+" \
+            --entrypoint python matrixdotorg/synapse:v1.138.0 - <<'EOF'
+import os, re
+path = "/data/homeserver.yaml"
+with open(path) as file:
+    config = file.read()
+listeners = "listeners:" + os.environ["LISTENERS"] + "\n"
+config, count = re.subn(r"^listeners:\n(?:[ \t]+.*\n|\n)*", lambda match: listeners, config, count=1, flags=re.M)
+if count != 1:
+    raise SystemExit(f"no listeners in {path}")
+with open(path, "w") as file:
+    file.write(config)
+EOF
+            ;;
+        host)
+            NETWORK_ARGS=(--network host)
+            ;;
+        *)
+            echo "Unknown transport: $TRANSPORT" >&2
+            exit 1
+            ;;
+    esac
+
     docker run -d --name "$CONTAINER_NAME" \
         --mount type=volume,src="$VOLNAME",dst=/data \
-        -p "${PORT}:8008" \
+        "${NETWORK_ARGS[@]}" \
         --restart unless-stopped \
         matrixdotorg/synapse:latest
 
-    echo "Synapse $CONTAINER_NAME running at http://localhost:${PORT}"
+    if [ "$TRANSPORT" = "uds" ]; then
+        echo "Synapse $CONTAINER_NAME running at http://localhost:${PORT} and unix:${SOCKET_DIR}/synapse.sock"
+    else
+        echo "Synapse $CONTAINER_NAME running at http://localhost:${PORT}"
+    fi
 }
 
 setup_synapse_homeserver 8008 1
 # setup_synapse_homeserver 8009 2
+# several federating homeservers in parallel: python -m matrix.backends.federation -n 2 (from src/adapter)
 
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The adapter imports its packages as `generic` and `matrix`, the mock client as `ttAssignment1`.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'src', 'adapter'), os.path.join(ROOT, 'src')]
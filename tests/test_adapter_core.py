@@ -0,0 +1,179 @@
+import random
+import threading
+import time
+
+import generic.adapter_core as adapter_core_module
+
+from generic.adapter_core import AdapterCore, State
+from generic.api import label_pb2, message_pb2
+from generic.api.configuration import Configuration, ConfigurationItem
+from generic.api.type import Type
+from generic.util.metrics import metrics
+
+
+class _Handler:
+    """ Records the stimuli performed per session, in the order they were performed. """
+
+    def __init__(self):
+        self.performed = {}
+        self.lock = threading.Lock()
+
+    def stimulus_key(self, pb_label):
+        return pb_label.channel
+
+    def stimulate(self, pb_label):
+        time.sleep(random.random() / 1000)
+        with self.lock:
+            self.performed.setdefault(pb_label.channel, []).append(pb_label.correlation_id)
+
+
+def _stimulus(session: str, index: int) -> bytes:
+    label = label_pb2.Label(label='send_message', type=label_pb2.Label.LabelType.STIMULUS,
+                            channel=session, correlation_id=index)
+    return message_pb2.Message(label=label).SerializeToString()
+
+
+def _perform(stimulus_workers: int) -> dict:
+    handler = _Handler()
+    adapter_core = AdapterCore('test', None, handler, stimulus_workers=stimulus_workers)
+    adapter_core.state = State.READY
+
+    sessions = ['session{index}'.format(index=index) for index in range(8)]
+    for index in range(50):
+        for session in sessions:
+            adapter_core.handle_message(_stimulus(session, index))
+
+    adapter_core.qthread_handle_message.queue.join()
+    if adapter_core.stimulus_pool:
+        adapter_core.stimulus_pool.join()
+    return handler.performed
+
+
+def test_stimuli_are_performed_in_order():
+    assert _perform(1) == {'session{index}'.format(index=index): list(range(50)) for index in range(8)}
+
+
+def test_parallel_stimuli_keep_the_order_per_session():
+    assert _perform(4) == {'session{index}'.format(index=index): list(range(50)) for index in range(8)}
+
+
+class _FailingBroker:
+    def __init__(self):
+        self.attempts = 0
+
+    def connect(self):
+        self.attempts += 1
+        raise ConnectionRefusedError('AMP is down')
+
+
+def test_start_gives_up_after_max_reconnect_attempts(monkeypatch):
+    monkeypatch.setattr(adapter_core_module, 'RECONNECT_DELAY_MIN', 0.001)
+    monkeypatch.setattr(adapter_core_module, 'RECONNECT_DELAY_MAX', 0.001)
+    broker = _FailingBroker()
+    adapter_core = AdapterCore('test', broker, _Handler(), max_reconnect_attempts=3)
+
+    adapter_core.start()
+
+    assert broker.attempts == 4
+
+
+def test_stop_ends_the_reconnect_loop():
+    broker = _FailingBroker()
+    adapter_core = AdapterCore('test', broker, _Handler())
+    threading.Timer(0.1, adapter_core.stop).start()
+
+    adapter_core.start()
+
+    assert broker.attempts == 1
+
+
+class _ResettingHandler(_Handler):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def set_configuration(self, configuration):
+        self.calls.append('set_configuration')
+
+    def start(self):
+        self.calls.append('start')
+
+    def reset(self):
+        self.calls.append('reset')
+
+
+def test_reconnect_with_the_same_configuration_resets_the_sut():
+    handler = _ResettingHandler()
+    adapter_core = AdapterCore('test', None, handler)
+    pb_config = Configuration([ConfigurationItem('endpoint', Type.STRING, 'url', 'http://localhost')]).encode()
+
+    adapter_core.state = State.ANNOUNCED
+    adapter_core.on_configuration(pb_config)
+    adapter_core.state = State.ANNOUNCED  # reconnected and announced again
+    adapter_core.on_configuration(pb_config)
+
+    assert handler.calls == ['set_configuration', 'start', 'set_configuration', 'reset']
+
+
+class _SlowHandler(_ResettingHandler):
+    """ Stimuli take a while, so RESETs arrive while the pool is performing them. """
+
+    def stimulate(self, pb_label):
+        time.sleep(0.002)
+        with self.lock:
+            self.performed.setdefault(pb_label.channel, []).append(pb_label.correlation_id)
+
+
+def test_reset_does_not_fail_stimuli_in_the_pool(monkeypatch):
+    handler = _SlowHandler()
+    adapter_core = AdapterCore('test', None, handler, stimulus_workers=4)
+    errors = []
+    monkeypatch.setattr(adapter_core, 'send_error', errors.append)
+    # Widen the race: the workers take the next stimuli while the pool is being cleared.
+    clear_queue = adapter_core.stimulus_pool.clear_queue
+    monkeypatch.setattr(adapter_core.stimulus_pool, 'clear_queue', lambda: (time.sleep(0.005), clear_queue())[1])
+
+    for _ in range(5):
+        adapter_core.state = State.READY
+        for index in range(40):
+            pb_message = message_pb2.Message.FromString(_stimulus('session{index}'.format(index=index % 8), index))
+            adapter_core.stimulus_pool.put(pb_message.label.channel, pb_message.label)
+        # As the inbound thread does, while the pool is performing the stimuli.
+        adapter_core.on_reset()
+        adapter_core._join_reset()
+
+    assert errors == []
+    assert handler.calls.count('reset') == 5
+
+
+class _ReadyHandler(_SlowHandler):
+    """ Records how many stimuli were performed when the SUT was reset, and sends READY. """
+
+    def reset(self):
+        with self.lock:
+            self.calls.append(sum(map(len, self.performed.values())))
+        self.adapter_core.send_ready()
+
+
+def test_reset_does_not_wait_behind_queued_stimuli(monkeypatch):
+    handler = _ReadyHandler()
+    adapter_core = AdapterCore('test', None, handler)
+    handler.adapter_core = adapter_core
+    monkeypatch.setattr(adapter_core, '_queue_message_to_amp', lambda message: None)
+    adapter_core.state = State.READY
+    before = len(metrics.values('reset.latency_ms'))
+
+    queued = 100
+    for index in range(queued):
+        adapter_core.handle_message(_stimulus('session', index))
+    adapter_core.handle_message(message_pb2.Message(reset=message_pb2.Message.Reset()).SerializeToString())
+    adapter_core.qthread_handle_message.queue.join()
+    adapter_core._join_reset()
+
+    # At most the stimulus being performed when the RESET arrived; the queued ones were dropped.
+    assert handler.calls[0] <= 2
+    assert sum(map(len, handler.performed.values())) < queued
+    latencies = metrics.values('reset.latency_ms')
+    assert len(latencies) == before + 1
+    # Well below the time the queued stimuli take to drain (2 ms each).
+    assert latencies[-1] < queued * 2
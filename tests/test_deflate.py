@@ -0,0 +1,31 @@
+import zlib
+
+from generic.deflate import PerMessageDeflate, TAIL
+
+
+def _response(parameters: str) -> dict:
+    return {'sec-websocket-extensions': 'permessage-deflate' + parameters}
+
+
+def test_compressed_messages_decompress():
+    deflate = PerMessageDeflate.from_response(_response('; client_max_window_bits=10'))
+    assert deflate.compressing and deflate.window_bits == 10
+
+    message = b'hello world ' * 100
+    for _ in range(3):  # the stream is kept between messages
+        assert deflate.decompress(deflate.compress(message), True) == message
+
+
+def test_window_of_8_bits_is_not_compressed():
+    deflate = PerMessageDeflate.from_response(_response('; client_max_window_bits=8'))
+    assert deflate.window_bits == 8
+    assert not deflate.compressing
+
+    # Messages from AMP are still decompressed.
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compressed = compressor.compress(b'hello') + compressor.flush(zlib.Z_SYNC_FLUSH)
+    assert deflate.decompress(compressed[:-len(TAIL)], True) == b'hello'
+
+
+def test_not_accepted():
+    assert PerMessageDeflate.from_response({}) is None
@@ -0,0 +1,20 @@
+import time
+
+from generic.api import label_pb2
+from generic.api.label_view import LabelView
+from generic.util.time_util import ns_to_datetime
+
+
+def test_missing_timestamp_is_resolved_once():
+    view = LabelView(label_pb2.Label(label='login', type=label_pb2.Label.LabelType.STIMULUS, channel='synapse'))
+
+    timestamp_ns = view.timestamp_ns
+    time.sleep(0.001)
+    assert view.timestamp_ns == timestamp_ns
+    assert view.timestamp == ns_to_datetime(timestamp_ns)
+
+
+def test_timestamp_of_the_label():
+    pb_label = label_pb2.Label(label='login', type=label_pb2.Label.LabelType.STIMULUS, channel='synapse',
+                               timestamp=1_700_000_000_123_456_789)
+    assert LabelView(pb_label).timestamp_ns == 1_700_000_000_123_456_789
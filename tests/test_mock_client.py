@@ -0,0 +1,74 @@
+import http.client
+import socket
+import threading
+
+import pytest
+
+from ttAssignment1 import mock_client
+
+RESPONSE = b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n{}'
+
+
+class _Server:
+    """ Answers one request per connection, then closes it without telling the client. """
+
+    def __init__(self, answer=lambda request: True):
+        self.answer = answer
+        self.requests = []
+        self.listener = socket.create_server(('localhost', 0))
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            with conn:
+                request = conn.recv(65536).split(b' ', 2)[:2]
+                self.requests.append(request)
+                if self.answer(request):
+                    conn.sendall(RESPONSE)
+
+    def close(self):
+        self.listener.close()
+
+
+@pytest.fixture
+def connections():
+    yield
+    mock_client.close_connections()
+
+
+def test_post_after_dropped_connection_uses_a_fresh_one(connections):
+    server = _Server()
+    try:
+        assert mock_client._send_request(server.port, 'GET', '/first')[0] == 200
+        # The server closed the connection after answering.
+        assert mock_client._send_request(server.port, 'POST', '/second', {'a': 1})[0] == 200
+        assert [path for _, path in server.requests] == [b'/first', b'/second']
+    finally:
+        server.close()
+
+
+def test_post_is_not_sent_again(connections):
+    server = _Server(answer=lambda request: request[0] != b'POST')
+    try:
+        with pytest.raises(http.client.RemoteDisconnected):
+            mock_client._send_request(server.port, 'POST', '/createRoom', {'a': 1})
+        assert server.requests == [[b'POST', b'/createRoom']]
+    finally:
+        server.close()
+
+
+def test_get_is_sent_again_on_stale_connection(connections, monkeypatch):
+    server = _Server()
+    # Skip the check, so the request is sent over the stale connection.
+    monkeypatch.setattr(mock_client, '_is_dropped', lambda conn: False)
+    try:
+        mock_client._send_request(server.port, 'GET', '/first')
+        assert mock_client._send_request(server.port, 'GET', '/second')[0] == 200
+        assert [path for _, path in server.requests] == [b'/first', b'/second']
+    finally:
+        server.close()
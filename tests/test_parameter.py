@@ -0,0 +1,88 @@
+from array import array
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from generic.api import label_pb2
+from generic.api.label import Label, Sort
+from generic.api.parameter import Parameter
+from generic.api.type import Type
+
+# Far beyond the recursion limit of a recursive codec, and of Python's own comparison.
+DEPTH = 3000
+
+
+def _nest(depth, wrap, leaf):
+    value = leaf
+    for _ in range(depth):
+        value = wrap(value)
+    return value
+
+
+def _unnest(value, unwrap):
+    """ Unwrap the value iteratively and return its depth and leaf. """
+    depth = 0
+    while True:
+        inner = unwrap(value)
+        if inner is None:
+            return depth, value
+        value = inner
+        depth += 1
+
+
+@pytest.mark.parametrize('tipe, wrap, unwrap, leaf', [
+    (Type.ARRAY, lambda value: [value], lambda value: value[0] if type(value[0]) is list else None, [1, 2]),
+    (Type.HASH, lambda value: {'nested': value}, lambda value: value.get('nested') if type(value) is dict else None,
+     {'leaf': 1}),
+    (Type.STRUCT, lambda value: SimpleNamespace(nested=value),
+     lambda value: getattr(value, 'nested', None) if type(value) is SimpleNamespace else None,
+     SimpleNamespace(leaf='x')),
+])
+def test_deeply_nested_values_round_trip(tipe, wrap, unwrap, leaf):
+    value = _nest(DEPTH, wrap, leaf)
+
+    decoded = Parameter.decode(Parameter('deep', tipe, value).encode())
+
+    assert decoded.tipe == tipe
+    assert _unnest(decoded.value, unwrap) == (DEPTH, leaf)
+
+
+def test_deeply_nested_value_encodes_in_a_label():
+    value = _nest(DEPTH, lambda value: [value], [1])
+    pb_label = Label(Sort.RESPONSE, 'deep', 'channel', [Parameter('deep', Type.ARRAY, value)]).encode()
+
+    pb_value = pb_label.parameters[0].value
+    depth = 0
+    while pb_value.array.values and pb_value.array.values[0].WhichOneof('type') == 'array':
+        pb_value = pb_value.array.values[0]
+        depth += 1
+    assert depth == DEPTH
+
+
+def test_homogeneous_arrays_round_trip():
+    for value in ([1, 2, 3], [0.5, 1.5], ['a', 'b'], [True, False]):
+        assert Parameter.decode(Parameter('values', Type.ARRAY, value).encode()).value == value
+
+    assert Parameter.decode(Parameter('values', Type.ARRAY, array('q', range(1000))).encode()).value == list(range(1000))
+
+
+def test_mixed_arrays_are_rejected():
+    pb_param = label_pb2.Label.Parameter(name='mixed')
+    pb_param.value.array.values.add(integer=1)
+    pb_param.value.array.values.add(string='a')
+
+    with pytest.raises(ValueError):
+        Parameter.decode(pb_param)
+
+    with pytest.raises(ValueError):
+        Parameter('mixed', Type.ARRAY, [1, 'a'])
+
+
+@pytest.mark.parametrize('value', [datetime(2026, 10, 19, 12, 0, 0, 123457), datetime(2500, 10, 19, 12, 0, 0, 1),
+                                   datetime(9000, 1, 1, 0, 0, 0, 999999)])
+def test_times_round_trip_to_the_microsecond(value):
+    pb_param = Parameter('at', Type.TIME, value).encode()
+
+    assert pb_param.value.time % 1_000_000 == value.microsecond
+    assert Parameter.decode(pb_param).value == value
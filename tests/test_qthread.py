@@ -0,0 +1,90 @@
+import random
+import threading
+import time
+
+import pytest
+
+from generic.qthread import KeyedQThread, QThread
+
+
+def _blocked_qthread(processed):
+    """ A started priority QThread whose worker is blocked on a first item until the event is set. """
+    release = threading.Event()
+
+    def process(item):
+        if item == 'block':
+            release.wait()
+        else:
+            processed.append(item)
+
+    qthread = QThread(process, priority=True)
+    qthread.start()
+    qthread.put('block')
+    while qthread.queue.qsize():
+        pass  # wait until the worker picked up the blocking item
+    return qthread, release
+
+
+def test_clear_queue_drops_everything_by_default():
+    processed = []
+    qthread, release = _blocked_qthread(processed)
+    qthread.put('stimulus')
+    qthread.put('error', priority=QThread.PRIORITY_CONTROL)
+
+    qthread.clear_queue()
+    release.set()
+    qthread.queue.join()
+
+    assert processed == []
+
+
+def test_clear_queue_keeps_items_that_are_not_dropped_in_order():
+    processed = []
+    qthread, release = _blocked_qthread(processed)
+    qthread.put('stimulus 1')
+    qthread.put('configuration')
+    qthread.put('stimulus 2')
+    qthread.put('error', priority=QThread.PRIORITY_CONTROL)
+
+    qthread.clear_queue(drop=lambda item: item.startswith('stimulus'))
+    qthread.put('reset', priority=QThread.PRIORITY_CONTROL)
+    release.set()
+    qthread.queue.join()
+
+    assert processed == ['error', 'reset', 'configuration']
+
+
+def test_keyed_qthread_keeps_the_order_per_key():
+    processed = {}
+    lock = threading.Lock()
+
+    def process(item):
+        key, index = item
+        time.sleep(random.random() / 1000)
+        with lock:
+            processed.setdefault(key, []).append(index)
+
+    pool = KeyedQThread(process, workers=4)
+    pool.start()
+    for index in range(200):
+        for key in ('alice', 'bob', 'carol', 'dave', 'eve'):
+            pool.put(key, (key, index))
+    pool.join()
+
+    assert processed == {key: list(range(200)) for key in ('alice', 'bob', 'carol', 'dave', 'eve')}
+
+
+def test_keyed_qthread_runs_different_keys_in_parallel():
+    barrier = threading.Barrier(2, timeout=5)
+    pool = KeyedQThread(lambda item: barrier.wait(), workers=2)
+    pool.start()
+
+    # Both items only finish if they are processed at the same time; keys 0 and 1 hash to different workers.
+    for key in (0, 1):
+        pool.put(key, key)
+    pool.join()
+
+
+def test_keyed_qthread_needs_a_worker():
+    with pytest.raises(ValueError):
+        KeyedQThread(lambda item: None, workers=0)
@@ -0,0 +1,94 @@
+import threading
+
+import matrix.sync as sync_module
+
+from matrix.sync import SyncWorker
+
+
+def _timeline(sender: str, body: str) -> dict:
+    event = {'type': 'm.room.message', 'sender': sender, 'content': {'body': body}}
+    return {'rooms': {'join': {'!room:my.matrix.host': {'timeline': {'events': [event]}}}}}
+
+
+def _patch(monkeypatch, get_sync):
+    monkeypatch.setattr(sync_module, 'whoami', lambda port, access_token: (200, {'user_id': '@alice:host'}))
+    monkeypatch.setattr(sync_module, 'get_filter_id', lambda port, access_token, user_id, sync_filter: '1')
+    monkeypatch.setattr(sync_module, 'get_sync', get_sync)
+
+
+def test_since_is_established_before_start_returns(monkeypatch):
+    requests = []
+    polled = threading.Event()
+    received = []
+
+    def get_sync(port, access_token, since=None, timeout=0, filter=None, connection=None):
+        requests.append(since)
+        if since is None:
+            return 200, {'next_batch': 's1', **_timeline('@bob:host', 'before login')}
+        if since == 's1':
+            return 200, {'next_batch': 's2', **_timeline('@bob:host', 'after login')}
+        polled.set()
+        worker._stopped.wait(1)
+        return 200, {'next_batch': since}
+
+    _patch(monkeypatch, get_sync)
+    worker = SyncWorker(0, 'token', lambda *message: received.append(message))
+    worker.start()
+    assert requests[0] is None and worker._since is not None
+
+    assert polled.wait(1)
+    worker.stop()
+    # Events before the position was established are skipped, every later one is reported.
+    assert received == [('token', '!room:my.matrix.host', '@bob:host', 'after login')]
+
+
+def test_nothing_is_reported_after_stop(monkeypatch):
+    polling = threading.Event()
+    release = threading.Event()
+    received = []
+
+    def get_sync(port, access_token, since=None, timeout=0, filter=None, connection=None):
+        if since is None:
+            return 200, {'next_batch': 's1'}
+        polling.set()
+        release.wait(1)
+        return 200, {'next_batch': 's2', **_timeline('@bob:host', 'late')}
+
+    _patch(monkeypatch, get_sync)
+    worker = SyncWorker(0, 'token', lambda *message: received.append(message))
+    worker.start()
+
+    assert polling.wait(1)
+    worker.stop()
+    release.set()
+    worker._thread.join(1)
+    assert not worker._thread.is_alive()
+    assert received == []
+
+
+def test_worker_survives_a_failed_request(monkeypatch):
+    monkeypatch.setattr(sync_module, 'RETRY_DELAY', 0.01)
+    received = []
+    delivered = threading.Event()
+    failed = []
+
+    def get_sync(port, access_token, since=None, timeout=0, filter=None, connection=None):
+        if since is None:
+            return 200, {'next_batch': 's1'}
+        if not failed:
+            failed.append(since)
+            raise ConnectionResetError('Connection reset by peer')
+        if since == 's1':
+            return 200, {'next_batch': 's2', **_timeline('@bob:host', 'after the failure')}
+        delivered.set()
+        worker._stopped.wait(1)
+        return 200, {'next_batch': since}
+
+    _patch(monkeypatch, get_sync)
+    worker = SyncWorker(0, 'token', lambda *message: received.append(message))
+    worker.start()
+
+    assert delivered.wait(1)
+    worker.stop()
+    assert failed == ['s1']
+    assert received == [('token', '!room:my.matrix.host', '@bob:host', 'after the failure')]
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+
+from generic.api import message_pb2
+from generic.api.label import Label, Sort
+from generic.util.time_util import datetime_to_ns, ns_to_datetime
+
+# Whole microseconds, which a datetime can hold exactly.
+MICROSECOND_NS = [
+    0,
+    1_000,
+    1_700_000_000_123_456_000,
+    4_102_444_800_999_999_000,  # 2100
+    -1_000,  # just before the epoch
+    -86_400_000_001_000,
+    -2_208_988_800_000_001_000,  # 1900
+]
+
+# With a sub-microsecond part, which only survives as integer nanoseconds.
+NANOSECOND_NS = [1, 999, 1_700_000_000_123_456_789, -1, -1_700_000_000_123_456_789]
+
+DATETIMES = [
+    datetime(2024, 6, 1, 12, 30, 15, 123456),
+    datetime(1970, 1, 1, 0, 0, 0, 1),
+    datetime(1969, 7, 20, 20, 17, 40, 999999),
+    datetime(1900, 1, 1, 0, 0, 0, 500000),
+]
+
+
+@pytest.mark.parametrize('ns', MICROSECOND_NS)
+def test_ns_round_trips_through_datetime(ns):
+    assert datetime_to_ns(ns_to_datetime(ns)) == ns
+
+
+@pytest.mark.parametrize('ns', NANOSECOND_NS)
+def test_datetime_truncates_to_the_microsecond_below(ns):
+    value = ns_to_datetime(ns)
+
+    assert datetime_to_ns(value) == ns - ns % 1_000
+    assert value.microsecond == ns % 1_000_000_000 // 1_000
+
+
+@pytest.mark.parametrize('value', DATETIMES)
+def test_datetime_round_trips_through_ns(value):
+    assert ns_to_datetime(datetime_to_ns(value)) == value
+
+
+@pytest.mark.parametrize('ns', MICROSECOND_NS + NANOSECOND_NS)
+def test_label_keeps_integer_nanoseconds(ns):
+    label = Label(Sort.RESPONSE, 'logged_in', 'synapse', timestamp=ns)
+
+    assert label.timestamp_ns == ns
+    assert label.timestamp == ns_to_datetime(ns)
+
+    label.timestamp = label.timestamp
+    assert label.timestamp_ns == ns - ns % 1_000
+
+
+@pytest.mark.parametrize('value', DATETIMES)
+def test_label_timestamp_from_datetime(value):
+    label = Label(Sort.RESPONSE, 'logged_in', 'synapse', timestamp=value)
+
+    assert label.timestamp_ns == datetime_to_ns(value)
+    assert label.timestamp == value
+
+
+@pytest.mark.parametrize('ns', [1, 999, 1_000, 1_700_000_000_123_456_789, 2 ** 63 - 1])
+def test_timestamp_round_trips_through_the_wire(ns):
+    label = Label(Sort.RESPONSE, 'logged_in', 'synapse', timestamp=ns)
+    raw = message_pb2.Message(label=label.encode()).SerializeToString()
+
+    decoded = Label.decode(message_pb2.Message.FromString(raw).label)
+
+    assert decoded.timestamp_ns == ns
+    assert decoded == label
+
+
+def test_pre_epoch_timestamps_can_not_be_encoded():
+    # The protobuf field is unsigned.
+    label = Label(Sort.RESPONSE, 'logged_in', 'synapse', timestamp=-1)
+
+    with pytest.raises(ValueError):
+        label.encode()
@@ -0,0 +1,30 @@
+from matrix.watchdog import HealthWatchdog
+
+
+class _Backend:
+
+    def __init__(self, healthy: bool):
+        self.healthy = healthy
+
+    def health(self) -> bool:
+        return self.healthy
+
+
+def test_failed_probe_schedules_a_rebuild():
+    watchdog = HealthWatchdog(_Backend(False))
+    watchdog._probe()
+    assert watchdog.take_rebuild_reason() == 'probe of the SUT failed'
+
+
+def test_no_probes_count_while_paused():
+    backend = _Backend(False)
+    watchdog = HealthWatchdog(backend)
+    watchdog.pause()
+    watchdog._probe()
+    assert watchdog.take_rebuild_reason() is None
+
+    backend.healthy = True
+    watchdog.resume()
+    watchdog._probe()
+    assert watchdog.take_rebuild_reason() is None
+    assert len(watchdog._latencies['probe']) == 1
@@ -0,0 +1,121 @@
+import pytest
+
+from generic.api import label_pb2
+from generic.api.configuration import Configuration, ConfigurationItem
+from generic.api.type import Type
+from matrix.handler import Handler
+
+from ttAssignment1 import close_connections, list_rooms
+
+SPEC = '{"accounts": [{"username": "alice", "password": "alice123"}], "rooms": {"count": 2}}'
+
+
+class _AdapterCore:
+
+    def __init__(self):
+        self.readies = 0
+        self.responses = []
+
+    def send_ready(self):
+        self.readies += 1
+
+    def send_response(self, label):
+        self.responses.append(label)
+
+    def send_stimulus_confirmation(self, pb_label):
+        pass
+
+
+def _stimulus(name: str, **parameters) -> label_pb2.Label:
+    pb_label = label_pb2.Label(label=name, type=label_pb2.Label.LabelType.STIMULUS, channel='synapse')
+    for key, value in parameters.items():
+        pb_label.parameters.add(name=key).value.string = value
+    return pb_label
+
+
+@pytest.fixture
+def handler():
+    handler = Handler()
+    handler.register_adapter_core(_AdapterCore())
+    items = {item.name: item for item in handler.default_configuration().items}
+    for name, value in (('backend', 'fake'), ('reset_mode', 'watchdog'), ('fixture_spec', SPEC),
+                        ('registration_shared_secret', 'secret')):
+        items[name] = ConfigurationItem(name, Type.STRING, '', value)
+    handler.set_configuration(Configuration(list(items.values())))
+    handler.start()
+    yield handler
+    handler.stop()
+    close_connections()
+
+
+def _session(handler) -> str:
+    handler.stimulate(_stimulus('login', username='alice', password='alice123'))
+    return handler.adapter_core.responses[-1].value_of('session_token')
+
+
+def test_watchdog_reset_undoes_the_test_case(handler):
+    state = handler._backend._server.state
+    token = _session(handler)
+    handler.stimulate(_stimulus('create_room', session_token=token, room_name='case room'))
+    assert len(state.rooms) == 3
+
+    handler.reset()
+
+    assert handler.adapter_core.readies == 2
+    assert handler._backend._server.state is state  # kept
+    # Only the rooms seeded again are left, and the sessions of the test case are logged out.
+    assert sorted(state.rooms) == sorted(room['room_id'] for room in handler.fixtures.rooms)
+    assert list_rooms(8008, token)[0] == 401
+
+
+def test_watchdog_reset_rebuilds_after_a_registration(handler):
+    state = handler._backend._server.state
+    handler.stimulate(_stimulus('register', username='bob', password='bob123'))
+
+    handler.reset()
+
+    assert handler._backend._server.state is not state
+    handler.stimulate(_stimulus('register', username='bob', password='bob123'))
+    assert handler.adapter_core.responses[-1].name == 'user_registered'
+
+
+def test_watchdog_mode_needs_the_shared_secret():
+    handler = Handler()
+    handler.register_adapter_core(_AdapterCore())
+    items = {item.name: item for item in handler.default_configuration().items}
+    items['reset_mode'] = ConfigurationItem('reset_mode', Type.STRING, '', 'watchdog')
+    handler.set_configuration(Configuration(list(items.values())))
+    with pytest.raises(ValueError):
+        handler.start()
+
+
+def test_rebuild_starts_new_baselines_once_the_sut_is_ready(handler, monkeypatch):
+    events = []
+    backend, watchdog = handler._backend, handler._watchdog
+    wait_healthy = backend.wait_healthy
+    monkeypatch.setattr(backend, 'wait_healthy', lambda: (events.append('healthy'), wait_healthy())[1])
+    monkeypatch.setattr(watchdog, 'rebuilt', lambda: events.append('rebuilt'))
+    monkeypatch.setattr(watchdog, 'resume', lambda: events.append('resume'))
+    watchdog._rebuild_reason = 'test'
+
+    handler.reset()
+
+    assert watchdog._paused
+    assert events == ['healthy', 'rebuilt', 'resume']
+
+
+def test_kept_sut_reloads_the_same_world(handler, monkeypatch):
+    spec = next(item for item in handler.configuration.items if item.name == 'fixture_spec')
+    monkeypatch.setattr(spec, 'value', '{"accounts": [{"username": "alice", "password": "alice123"}], '
+                        '"users": {"count": 5}, "rooms": {"count": 2, "members": 3}}')
+    handler.reset()
+    state = handler._backend._server.state
+    users = sorted(user['user_id'] for user in handler.fixtures.users)
+
+    for _ in range(3):
+        handler.reset()
+
+    assert handler._backend._server.state is state
+    assert sorted(user['user_id'] for user in handler.fixtures.users) == users
+    assert len(state.passwords) == len(users) + 1  # and the server admin
+    assert len(state.rooms) == 2